@@ -0,0 +1,74 @@
+"""
+Benchmark del parser de cantidades
+Genera un corpus sintético de líneas de ingredientes (enteros, decimales,
+fracciones, rangos, unidades en español e inglés) y mide líneas por segundo
+
+    python benchmarks/bench_quantity_parser.py --lines 200000
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from quantity_parser import UNIT_ALIASES, parse_ingredient  # noqa: E402
+
+FOODS = [
+    "harina", "azúcar", "leche", "huevos", "mantequilla", "sal", "ajo", "cebolla",
+    "tomate", "aceite de oliva", "arroz", "frijoles negros", "pechuga de pollo",
+    "flour", "sugar", "butter", "garlic", "olive oil", "ground beef", "cream cheese"
+]
+QUANTITIES = [
+    lambda r: str(r.randint(1, 500)),
+    lambda r: f"{r.randint(0, 3)},{r.randint(1, 9)}",
+    lambda r: f"{r.randint(0, 3)}.{r.randint(1, 9)}",
+    lambda r: f"{r.randint(1, 3)}/{r.choice([2, 3, 4, 8])}",
+    lambda r: f"{r.randint(1, 3)} {r.randint(1, 3)}/4",
+    lambda r: r.choice(["½", "¼", "¾", "⅓", "1½", "2 ¼"]),
+    lambda r: f"{r.randint(1, 3)}-{r.randint(4, 6)}",
+    lambda r: f"{r.randint(1, 3)} a {r.randint(4, 6)}",
+    lambda r: ""
+]
+
+
+def synthetic_corpus(lines: int, seed: int = 42):
+    rng = random.Random(seed)
+    units = sorted(UNIT_ALIASES) + [""] * 10
+    corpus = []
+    for _ in range(lines):
+        quantity = rng.choice(QUANTITIES)(rng)
+        unit = rng.choice(units)
+        connector = rng.choice(["de ", "", "of "]) if unit else ""
+        corpus.append(" ".join(part for part in (quantity, unit, connector + rng.choice(FOODS)) if part))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.lines, args.seed)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for line in corpus:
+            parse_ingredient(line)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    with_unit = sum(1 for line in corpus if parse_ingredient(line)["unit"])
+    print(f"Líneas:            {len(corpus):,}")
+    print(f"Con unidad:        {with_unit:,}")
+    print(f"Mejor tiempo:      {best:.3f} s")
+    print(f"Líneas/segundo:    {len(corpus) / best:,.0f}")
+    print(f"µs por línea:      {best / len(corpus) * 1e6:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark de arranque en frío
+Mide, en intérpretes nuevos, cuánto tarda `import main` y `create_app()`, los
+módulos que más pesan en la importación (-X importtime) y el tiempo desde que
+se lanza uvicorn hasta la primera respuesta 200 de /health, con Supabase y
+Stripe falsos (ver load_test.py) y latencia de Supabase configurable
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --supabase-latency-ms 3000 --output arranque.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_test import (  # noqa: E402
+    REPO_ROOT, BackgroundServer, FaultInjector, app_environment,
+    fake_stripe_app, fake_supabase_app, free_port, git_commit
+)
+
+IMPORT_PROBE = """
+import time, json
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+built = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "create_app_s": built - imported}))
+"""
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(values), 4),
+        "median": round(statistics.median(values), 4),
+        "max": round(max(values), 4)
+    }
+
+
+def measure_import(env: Dict[str, str], runs: int) -> Dict[str, Any]:
+    imports, factories = [], []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=REPO_ROOT, env=env,
+            capture_output=True, text=True, check=True
+        )
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        imports.append(sample["import_s"])
+        factories.append(sample["create_app_s"])
+    return {"import_s": summarize(imports), "create_app_s": summarize(factories)}
+
+
+def heaviest_imports(env: Dict[str, str], top: int) -> List[Dict[str, Any]]:
+    """
+    Módulos de primer nivel con mayor tiempo acumulado según -X importtime
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Sangría de 2 espacios = importado directamente por main
+        if name.startswith("   ") and not name.startswith("    "):
+            modules.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True)[:top]
+
+
+async def time_to_ready(env: Dict[str, str], workdir: str) -> float:
+    """
+    Segundos desde que se lanza uvicorn hasta el primer 200 de /health
+    """
+    port = free_port()
+    log_path = os.path.join(workdir, f"app-{port}.log")
+    with open(log_path, "wb") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                while True:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"La app terminó al arrancar:\n{Path(log_path).read_text(errors='replace')}")
+                    try:
+                        if (await client.get("/health")).status_code == 200:
+                            return time.perf_counter() - start
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.005)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run(args) -> Dict[str, Any]:
+    supabase_faults = FaultInjector(args.supabase_latency_ms, 0, 0)
+    supabase = BackgroundServer(fake_supabase_app(supabase_faults), free_port())
+    stripe_server = BackgroundServer(fake_stripe_app(FaultInjector()), free_port())
+    supabase.start()
+    stripe_server.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="recipetuner-startup-") as workdir:
+            env = app_environment(args, supabase.url, stripe_server.url, workdir)
+            imports = measure_import(env, args.runs)
+            ready = [await time_to_ready(env, workdir) for _ in range(args.runs)]
+            heaviest = heaviest_imports(env, args.top)
+    finally:
+        supabase.stop()
+        stripe_server.stop()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+            "supabase_latency_ms": args.supabase_latency_ms
+        },
+        **imports,
+        "time_to_ready_s": summarize(ready),
+        "heaviest_imports": heaviest
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="módulos más pesados a listar")
+    parser.add_argument("--supabase-latency-ms", type=float, default=20)
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args()
+    # app_environment() lo requiere; el arranque no llama al LLM
+    args.llm_latency_ms = 0
+
+    report = asyncio.run(run(args))
+    print(f"import main (mediana):      {report['import_s']['median'] * 1000:8.1f} ms", file=sys.stderr)
+    print(f"create_app() (mediana):     {report['create_app_s']['median'] * 1000:8.1f} ms", file=sys.stderr)
+    print(f"hasta /health 200 (mediana): {report['time_to_ready_s']['median'] * 1000:7.1f} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Resultados en {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+"""
+Prueba de carga de la API con Stripe y Supabase falsos
+Levanta servidores HTTP locales que imitan Supabase (PostgREST + Auth) y la API
+de Stripe, con latencia y errores inyectables, arranca main:app con uvicorn en
+un subproceso apuntando a ellos y lanza tráfico concurrente contra cada
+endpoint. El resultado (throughput, p50/p95/p99, tasa de errores, códigos de
+estado y llamadas recibidas por cada servicio falso) se escribe en JSON para
+comparar builds antes de desplegar.
+
+    python benchmarks/load_test.py --duration 10 --concurrency 32 --output resultado.json
+    python benchmarks/load_test.py --scenarios nutrition,analyze --supabase-latency-ms 20 --stripe-error-rate 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import random
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+import jwt
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+JWT_SECRET = "load-test-jwt-secret-load-test-jwt-secret"
+WEBHOOK_SECRET = "whsec_load_test"
+BENCH_USERS = 50
+
+# ================== SERVICIOS FALSOS ==================
+
+
+class FaultInjector:
+    """
+    Latencia (base + jitter uniforme) y fracción de respuestas con error
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.injected_errors = 0
+
+    async def __call__(self, key: str) -> bool:
+        """
+        Registrar la llamada, esperar la latencia y decidir si falla
+        """
+        self.calls[key] += 1
+        delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.injected_errors += 1
+            return True
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+            "injected_errors": self.injected_errors,
+            "calls": dict(self.calls.most_common())
+        }
+
+
+def _user_row(auth_user_id: str) -> Dict[str, Any]:
+    return {"id": f"user-{auth_user_id}", "auth_user_id": auth_user_id, "email": f"{auth_user_id}@bench.local"}
+
+
+def fake_supabase_app(faults: FaultInjector) -> Starlette:
+    """
+    PostgREST y Auth mínimos: lecturas con filas sintéticas, escrituras que
+    devuelven lo recibido
+    """
+
+    async def handle(request: Request):
+        path = request.url.path
+        table = path.rsplit("/", 1)[-1] if path.startswith("/rest/v1/") else path
+        if await faults(f"{request.method} {table}"):
+            return JSONResponse({"message": "injected failure"}, status_code=503)
+
+        if path == "/auth/v1/.well-known/jwks.json":
+            return JSONResponse({"keys": []})
+        if path == "/auth/v1/user":
+            claims = jwt.decode(
+                request.headers["Authorization"].split(" ", 1)[1],
+                options={"verify_signature": False}
+            )
+            return JSONResponse({"id": claims["sub"], "email": claims.get("email")})
+
+        if request.method == "GET":
+            params = request.query_params
+            if table == "recipetuner_users" and "auth_user_id" in params:
+                return JSONResponse([_user_row(params["auth_user_id"][3:])])
+            if table == "recipetuner_stripe_customers":
+                return JSONResponse([{"stripe_customer_id": "cus_bench", "user": _user_row("bench")}])
+            return JSONResponse([])
+
+        body = await request.body()
+        rows = json.loads(body) if body else {}
+        rows = rows if isinstance(rows, list) else [rows]
+        return JSONResponse([{"id": index + 1, **row} for index, row in enumerate(rows)], status_code=201)
+
+    return Starlette(routes=[Route("/{path:path}", handle, methods=["GET", "POST", "PATCH", "DELETE"])])
+
+
+def _subscription(subscription_id: str) -> Dict[str, Any]:
+    now = int(time.time())
+    return {
+        "id": subscription_id,
+        "object": "subscription",
+        "customer": "cus_bench",
+        "status": "trialing",
+        "latest_invoice": None,
+        "cancel_at_period_end": False,
+        "current_period_start": now,
+        "current_period_end": now + 30 * 86400,
+        "trial_end": now + 7 * 86400,
+        "metadata": {}
+    }
+
+
+def fake_stripe_app(faults: FaultInjector) -> Starlette:
+    """
+    Subconjunto de la API de Stripe que usa stripe_gateway
+    """
+
+    async def handle(request: Request):
+        parts = request.url.path.strip("/").split("/")[1:]  # sin "v1"
+        resource = parts[0] if parts else ""
+        if await faults(f"{request.method} {resource}"):
+            return JSONResponse(
+                {"error": {"type": "api_error", "message": "injected failure"}},
+                status_code=500
+            )
+
+        if resource == "customers" and request.method == "GET":
+            return JSONResponse({
+                "object": "list", "url": "/v1/customers", "has_more": False,
+                "data": [{"id": "cus_bench", "object": "customer"}]
+            })
+        if resource == "customers":
+            return JSONResponse({"id": "cus_bench", "object": "customer"})
+        if resource == "prices":
+            return JSONResponse({"object": "list", "url": "/v1/prices", "has_more": False, "data": []})
+        if resource == "payment_methods":
+            return JSONResponse({"id": parts[1], "object": "payment_method", "customer": "cus_bench"})
+        if resource == "subscriptions":
+            subscription_id = parts[1] if len(parts) > 1 else f"sub_bench_{faults.calls.total()}"
+            return JSONResponse(_subscription(subscription_id))
+
+        return JSONResponse(
+            {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL ({request.url.path})"}},
+            status_code=404
+        )
+
+    return Starlette(routes=[Route("/{path:path}", handle, methods=["GET", "POST", "DELETE"])])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """
+    Servidor uvicorn en un hilo con su propio event loop, para que los servicios
+    falsos no compitan con el generador de carga
+    """
+
+    def __init__(self, app, port: int):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"El servidor falso en {self.url} no arrancó")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+# ================== APLICACIÓN BAJO PRUEBA ==================
+
+
+def app_environment(args, supabase_url: str, stripe_url: str, workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-role-bench",
+        "SUPABASE_ANON_KEY": "anon-bench",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "STRIPE_API_BASE": stripe_url,
+        "OPENAI_API_KEY": "sk-bench",
+        "RECIPE_LLM_BACKEND": "stub",
+        "RECIPE_STUB_LATENCY": str(args.llm_latency_ms / 1000),
+        "WEBHOOK_QUEUE_PATH": os.path.join(workdir, "webhook_queue.db"),
+        "PYTHONUNBUFFERED": "1"
+    })
+    env.pop("RECIPE_CACHE_DIR", None)
+    return env
+
+
+def start_app(args, env: Dict[str, str], port: int, log_path: str) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", args.app,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--log-level", "warning", "--no-access-log",
+        "--workers", str(args.workers)
+    ]
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(process: subprocess.Popen, base_url: str, log_path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"La app terminó al arrancar:\n{Path(log_path).read_text(errors='replace')}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"La app no respondió /health en {timeout}s")
+
+
+# ================== ESCENARIOS ==================
+
+FOODS = [
+    "harina", "azúcar", "leche", "huevos", "mantequilla", "sal", "ajo", "cebolla",
+    "tomate", "aceite de oliva", "arroz", "frijoles negros", "pechuga de pollo",
+    "queso", "crema", "papa", "zanahoria", "limón", "avena", "plátano"
+]
+UNITS = ["g", "tazas", "cucharadas", "cucharaditas", "ml", ""]
+
+
+def synthetic_recipes(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    recipes = []
+    for index in range(count):
+        ingredients = []
+        for food in rng.sample(FOODS, rng.randint(4, 10)):
+            unit = rng.choice(UNITS)
+            quantity = rng.randint(50, 500) if unit in ("g", "ml") else rng.randint(1, 4)
+            ingredients.append(" ".join(str(part) for part in (quantity, unit, food) if part))
+        recipes.append({
+            "title": f"Receta de prueba {index}",
+            "ingredients": ingredients,
+            "instructions": ["Mezclar todo", "Hornear 30 minutos"],
+            "servings": rng.randint(1, 8)
+        })
+    return recipes
+
+
+def bench_token(user_index: int) -> str:
+    now = int(time.time())
+    auth_user_id = f"auth-{user_index}"
+    return jwt.encode({
+        "sub": auth_user_id,
+        "email": f"{auth_user_id}@bench.local",
+        "aud": "authenticated",
+        "session_id": f"session-{user_index}",
+        "iat": now,
+        "exp": now + 3600
+    }, JWT_SECRET, algorithm="HS256")
+
+
+def signed_webhook(event: Dict[str, Any]) -> Dict[str, Any]:
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return {
+        "content": payload,
+        "headers": {"Content-Type": "application/json", "Stripe-Signature": f"t={timestamp},v1={signature}"}
+    }
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: str
+    # (rng, número de request) -> kwargs de httpx
+    build: Callable[[random.Random, int], Dict[str, Any]]
+    ok_statuses: tuple = (200,)
+
+
+def build_scenarios(recipes: List[Dict[str, Any]], tokens: List[str]) -> Dict[str, Scenario]:
+    def auth(rng):
+        return {"Authorization": f"Bearer {rng.choice(tokens)}"}
+
+    def webhook(rng, n):
+        user_index = rng.randrange(len(tokens))
+        return signed_webhook({
+            "id": f"evt_bench_{os.getpid()}_{n}_{rng.getrandbits(32)}",
+            "object": "event",
+            "type": "customer.subscription.updated",
+            "created": int(time.time()),
+            "data": {"object": {
+                **_subscription(f"sub_bench_{user_index}"),
+                "status": "active",
+                "metadata": {"app_name": "recipetuner", "user_id": f"user-auth-{user_index}"}
+            }}
+        })
+
+    scenarios = [
+        Scenario("health", "GET", "/health", lambda rng, n: {}),
+        Scenario("nutrition", "POST", "/api/nutrition/calculate", lambda rng, n: {"json": {
+            "ingredients": rng.choice(recipes)["ingredients"], "servings": 4
+        }}),
+        Scenario("nutrition_batch", "POST", "/api/nutrition/calculate/batch", lambda rng, n: {"json": {
+            "recipes": [
+                {"id": str(i), "ingredients": recipe["ingredients"], "servings": recipe["servings"]}
+                for i, recipe in enumerate(rng.sample(recipes, min(20, len(recipes))))
+            ]
+        }}),
+        Scenario("analyze", "POST", "/api/recipes/analyze", lambda rng, n: {"json": rng.choice(recipes)}),
+        Scenario("tune", "POST", "/api/recipes/tune", lambda rng, n: {"json": {
+            **rng.choice(recipes), "targets": [rng.choice(["lower_calories", "lower_sodium", "more_protein"])]
+        }}),
+        Scenario("entitlement", "GET", "/api/entitlement", lambda rng, n: {"headers": auth(rng)}),
+        Scenario("create_subscription", "POST", "/api/create-subscription", lambda rng, n: {
+            "headers": auth(rng),
+            "json": {
+                "planId": rng.choice(["premium_mexico", "premium_usa"]),
+                "isYearly": rng.random() < 0.3,
+                "paymentMethodId": f"pm_bench_{n}",
+                "metadata": {"app_name": "recipetuner"}
+            }
+        }),
+        Scenario("webhook", "POST", "/api/stripe/webhooks", webhook)
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+# ================== GENERADOR DE CARGA ==================
+
+
+class ScenarioResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.exceptions: Counter = Counter()
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        requests = len(self.latencies)
+        latencies = np.asarray(self.latencies) * 1000
+        if requests:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            latency = {
+                "mean": round(float(latencies.mean()), 3),
+                "p50": round(float(p50), 3),
+                "p95": round(float(p95), 3),
+                "p99": round(float(p99), 3),
+                "max": round(float(latencies.max()), 3)
+            }
+        else:
+            latency = {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / requests, 4) if requests else None,
+            "throughput_rps": round(requests / self.elapsed, 1) if self.elapsed else None,
+            "latency_ms": latency,
+            "status_codes": {str(status): count for status, count in sorted(self.statuses.items())},
+            "exceptions": dict(self.exceptions)
+        }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int
+) -> ScenarioResult:
+    """
+    `concurrency` clientes en bucle cerrado durante warmup + duration segundos;
+    solo se registran las requests que empiezan después del calentamiento
+    """
+    result = ScenarioResult()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    counter = iter(range(1 << 62))
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            kwargs = scenario.build(rng, next(counter))
+            status, error = None, None
+            try:
+                response = await client.request(scenario.method, scenario.path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            latency = time.perf_counter() - sent
+            if sent < measure_from:
+                continue
+            result.latencies.append(latency)
+            if error:
+                result.exceptions[error] += 1
+                result.errors += 1
+            else:
+                result.statuses[status] += 1
+                if status not in scenario.ok_statuses:
+                    result.errors += 1
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    result.elapsed = time.perf_counter() - measure_from
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_summary(results: Dict[str, Dict[str, Any]]):
+    print(f"{'escenario':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8}", file=sys.stderr)
+    for name, data in results.items():
+        latency = data["latency_ms"]
+        cells = [
+            f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+            for value in (data["throughput_rps"], latency["p50"], latency["p95"], latency["p99"])
+        ]
+        error_rate = f"{data['error_rate']:.2%}" if data["error_rate"] is not None else "-"
+        print(f"{name:<20} {' '.join(cells)} {error_rate:>8}", file=sys.stderr)
+
+
+async def run(args) -> Dict[str, Any]:
+    supabase_faults = FaultInjector(args.supabase_latency_ms, args.supabase_jitter_ms, args.supabase_error_rate, args.seed)
+    stripe_faults = FaultInjector(args.stripe_latency_ms, args.stripe_jitter_ms, args.stripe_error_rate, args.seed + 1)
+    supabase = BackgroundServer(fake_supabase_app(supabase_faults), free_port())
+    stripe_server = BackgroundServer(fake_stripe_app(stripe_faults), free_port())
+    supabase.start()
+    stripe_server.start()
+
+    scenarios = build_scenarios(
+        synthetic_recipes(args.distinct_recipes, args.seed),
+        [bench_token(i) for i in range(BENCH_USERS)]
+    )
+    selected = list(scenarios) if args.scenarios == "all" else [name.strip() for name in args.scenarios.split(",")]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {unknown} (disponibles: {', '.join(scenarios)})")
+
+    with tempfile.TemporaryDirectory(prefix="recipetuner-load-") as workdir:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(workdir, "app.log")
+        process = start_app(args, app_environment(args, supabase.url, stripe_server.url, workdir), port, log_path)
+        try:
+            await wait_until_ready(process, base_url, log_path)
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            results = {}
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+                for name in selected:
+                    print(f"▶ {name}...", file=sys.stderr)
+                    outcome = await run_scenario(
+                        client, scenarios[name], args.concurrency, args.duration, args.warmup, args.seed
+                    )
+                    results[name] = outcome.to_dict()
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            supabase.stop()
+            stripe_server.stop()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "app": args.app,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "distinct_recipes": args.distinct_recipes,
+            "llm_latency_ms": args.llm_latency_ms,
+            "seed": args.seed
+        },
+        "scenarios": results,
+        "backends": {
+            "supabase": supabase_faults.to_dict(),
+            "stripe": stripe_faults.to_dict()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main:app", help="módulo:atributo de la app ASGI")
+    parser.add_argument("--workers", type=int, default=1, help="procesos de uvicorn")
+    parser.add_argument("--scenarios", default="all", help="lista separada por comas o 'all'")
+    parser.add_argument("--duration", type=float, default=10, help="segundos medidos por escenario")
+    parser.add_argument("--warmup", type=float, default=2, help="segundos de calentamiento por escenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30, help="timeout por request (s)")
+    parser.add_argument("--distinct-recipes", type=int, default=50, help="recetas distintas (controla aciertos de caché)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--supabase-latency-ms", type=float, default=5)
+    parser.add_argument("--supabase-jitter-ms", type=float, default=5)
+    parser.add_argument("--supabase-error-rate", type=float, default=0)
+    parser.add_argument("--stripe-latency-ms", type=float, default=80)
+    parser.add_argument("--stripe-jitter-ms", type=float, default=40)
+    parser.add_argument("--stripe-error-rate", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="latencia del backend stub de LLM")
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_summary(report["scenarios"])
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Resultados en {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
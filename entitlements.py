@@ -0,0 +1,402 @@
+"""
+Entitlements de suscripción en memoria
+Cada usuario con suscripción vigente tiene en memoria su plan, estado y fin de
+período. Los webhooks de Stripe actualizan el mapa al momento (push) y una
+reconciliación periódica contra recipetuner_subscriptions corrige lo que se
+haya perdido; las comprobaciones de acceso no hacen I/O. Mientras la primera
+carga no termine bien, las comprobaciones consultan la base por usuario.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, NamedTuple, Optional
+
+from supabase_repository import get_repository
+from plan_catalog import get_plan_catalog
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+ENTITLEMENT_RECONCILE_INTERVAL = float(os.getenv("ENTITLEMENT_RECONCILE_INTERVAL", 600))
+# Margen tras current_period_end mientras Stripe renueva el período (segundos)
+ENTITLEMENT_GRACE_SECONDS = float(os.getenv("ENTITLEMENT_GRACE_SECONDS", 3600))
+ENTITLEMENT_ACTIVE_STATUSES = frozenset(
+    status.strip()
+    for status in os.getenv("ENTITLEMENT_ACTIVE_STATUSES", "active,trialing,past_due").split(",")
+    if status.strip()
+)
+ENTITLEMENT_PAGE_SIZE = int(os.getenv("ENTITLEMENT_PAGE_SIZE", 1000))
+# Reintentos de una reconciliación fallida: backoff exponencial hasta este máximo (s)
+ENTITLEMENT_RETRY_BASE_SECONDS = float(os.getenv("ENTITLEMENT_RETRY_BASE_SECONDS", 1))
+ENTITLEMENT_RETRY_MAX_SECONDS = float(os.getenv("ENTITLEMENT_RETRY_MAX_SECONDS", 60))
+
+SUBSCRIPTIONS_TABLE = "recipetuner_subscriptions"
+SUBSCRIPTION_COLUMNS = "user_id,plan_id,stripe_subscription_id,status,current_period_end"
+
+
+def to_timestamp(value: Any) -> Optional[float]:
+    """
+    Epoch en segundos desde un entero de Stripe o un timestamp ISO de Supabase
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def subscription_period_end(subscription: Dict[str, Any]) -> Optional[float]:
+    """
+    Fin del período actual; las versiones recientes de la API lo exponen por item
+    """
+    period_end = subscription.get("current_period_end")
+    if period_end is None:
+        items = (subscription.get("items") or {}).get("data") or []
+        period_end = max((item.get("current_period_end") or 0 for item in items), default=None) or None
+    return to_timestamp(period_end)
+
+
+def subscription_plan_id(subscription: Dict[str, Any]) -> Optional[str]:
+    """
+    Plan de una suscripción de Stripe: por el price del primer item (catálogo en
+    memoria) o, si el precio no está en el catálogo, por la metadata
+    """
+    catalog = get_plan_catalog()
+    for item in (subscription.get("items") or {}).get("data") or []:
+        price_id = (item.get("price") or {}).get("id")
+        match = catalog.plan_for_price(price_id) if price_id else None
+        if match:
+            return match[0]
+    metadata = subscription.get("metadata") or {}
+    return metadata.get("plan_id") or metadata.get("planId")
+
+
+class Entitlement(NamedTuple):
+    user_id: str
+    plan_id: Optional[str]
+    status: str
+    current_period_end: Optional[float]
+    stripe_subscription_id: Optional[str]
+    # Marca de tiempo del evento que la produjo (0 si viene de la base)
+    source_created: float
+
+    def is_active(self, now: Optional[float] = None) -> bool:
+        if self.status not in ENTITLEMENT_ACTIVE_STATUSES:
+            return False
+        if self.current_period_end is None:
+            return True
+        return (now or time.time()) < self.current_period_end + ENTITLEMENT_GRACE_SECONDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "plan_id": self.plan_id,
+            "status": self.status,
+            "current_period_end": self.current_period_end,
+            "stripe_subscription_id": self.stripe_subscription_id,
+            "active": self.is_active()
+        }
+
+
+class EntitlementCache:
+    """
+    Mapa user_id -> Entitlement.
+
+    Solo se guardan suscripciones en estado activo; una vez cargado el mapa, un
+    usuario ausente no tiene plan de pago. Antes de eso (`loaded` en False) la
+    ausencia no prueba nada y `resolve()` consulta la base para ese usuario.
+    Las actualizaciones por webhook y la reconciliación
+    comparten el mapa: la reconciliación no pisa entradas actualizadas por un
+    webhook después de empezar su lectura.
+    """
+
+    def __init__(self, reconcile_interval: float = ENTITLEMENT_RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._entries: Dict[str, Entitlement] = {}
+        # Momento (monotónico) de la última escritura push por usuario
+        self._pushed_at: Dict[str, float] = {}
+        # Evento más reciente aplicado por suscripción, también de las ya
+        # canceladas (que no están en el mapa), para descartar los atrasados
+        self._applied_events: Dict[str, float] = {}
+        # Se activa solo cuando una reconciliación termina bien
+        self._loaded = asyncio.Event()
+        self._lookups = SingleFlight()
+        self._task: Optional[asyncio.Task] = None
+        self.reconciled_at: Optional[float] = None
+
+        self.checks = 0
+        self.pushes = 0
+        self.stale_pushes = 0
+        self.reconciles = 0
+        self.failed_reconciles = 0
+        self.reconcile_corrections = 0
+        self.fallback_lookups = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded.is_set()
+
+    # ================== CONSULTAS (SIN I/O) ==================
+
+    def get(self, user_id: Optional[str]) -> Optional[Entitlement]:
+        entitlement = self._entries.get(user_id) if user_id else None
+        if entitlement is not None and not entitlement.is_active():
+            return None
+        return entitlement
+
+    def is_entitled(self, user_id: Optional[str], plan_id: Optional[str] = None) -> bool:
+        """
+        ¿Tiene el usuario una suscripción vigente (opcionalmente de ese plan)?
+        """
+        self.checks += 1
+        entitlement = self.get(user_id)
+        if entitlement is None:
+            return False
+        return plan_id is None or entitlement.plan_id == plan_id
+
+    # ================== CONSULTAS ANTES DE LA PRIMERA CARGA ==================
+
+    async def _lookup(self, user_id: str) -> Optional[Entitlement]:
+        self.fallback_lookups += 1
+        rows = await get_repository().select(
+            SUBSCRIPTIONS_TABLE,
+            columns=SUBSCRIPTION_COLUMNS,
+            filters={"user_id": user_id}
+        )
+        best = None
+        for row in rows:
+            entitlement = self._from_row(row)
+            if entitlement is not None and (
+                best is None or (entitlement.current_period_end or 0) > (best.current_period_end or 0)
+            ):
+                best = entitlement
+        # Un webhook aplicado durante la consulta es más reciente que la base
+        if best is not None and user_id not in self._entries:
+            self._entries[user_id] = best
+        return self.get(user_id)
+
+    async def resolve(self, user_id: Optional[str]) -> Optional[Entitlement]:
+        """
+        Entitlement vigente del usuario. Con el mapa cargado no hace I/O; antes
+        consulta Supabase (coalescido por usuario) y propaga sus errores, para
+        que el endpoint responda 503 en lugar de negar el acceso.
+        """
+        self.checks += 1
+        entitlement = self.get(user_id)
+        if entitlement is not None or self.loaded or not user_id:
+            return entitlement
+        return await self._lookups.do(user_id, lambda: self._lookup(user_id))
+
+    # ================== ACTUALIZACIÓN PUSH (WEBHOOKS) ==================
+
+    def apply_subscription(
+        self,
+        user_id: str,
+        subscription: Dict[str, Any],
+        event_created: Optional[float] = None
+    ) -> bool:
+        """
+        Aplicar el estado de una suscripción de Stripe recibido por webhook.
+        Devuelve False si el evento es más viejo que el último aplicado a esa
+        suscripción (Stripe no garantiza el orden de entrega): quien llama no
+        debe guardarlo en la base.
+        """
+        created = float(event_created or time.time())
+        subscription_id = subscription.get("id")
+        if subscription_id and created < self._applied_events.get(subscription_id, 0.0):
+            self.stale_pushes += 1
+            logger.info(f"⏭️ Evento atrasado para entitlement de {user_id}: {subscription_id}")
+            return False
+
+        current = self._entries.get(user_id)
+
+        entitlement = Entitlement(
+            user_id=user_id,
+            plan_id=subscription_plan_id(subscription),
+            status=subscription.get("status") or "canceled",
+            current_period_end=subscription_period_end(subscription),
+            stripe_subscription_id=subscription_id,
+            source_created=created
+        )
+        self.pushes += 1
+        self._pushed_at[user_id] = time.monotonic()
+        if subscription_id:
+            self._applied_events[subscription_id] = created
+
+        if entitlement.status in ENTITLEMENT_ACTIVE_STATUSES:
+            self._entries[user_id] = entitlement
+        elif current is None or current.stripe_subscription_id == entitlement.stripe_subscription_id:
+            # Solo se revoca si termina la suscripción que daba el acceso
+            self._entries.pop(user_id, None)
+        return True
+
+    # ================== RECONCILIACIÓN ==================
+
+    async def _load_rows(self):
+        repository = get_repository()
+        rows, offset = [], 0
+        while True:
+            page = await repository.select(
+                SUBSCRIPTIONS_TABLE,
+                columns=SUBSCRIPTION_COLUMNS,
+                limit=ENTITLEMENT_PAGE_SIZE,
+                offset=offset,
+                order="stripe_subscription_id"
+            )
+            rows.extend(page)
+            if len(page) < ENTITLEMENT_PAGE_SIZE:
+                return rows
+            offset += ENTITLEMENT_PAGE_SIZE
+
+    @staticmethod
+    def _from_row(row: Dict[str, Any], now: Optional[float] = None) -> Optional[Entitlement]:
+        """
+        Entitlement vigente de una fila de recipetuner_subscriptions (o None)
+        """
+        user_id = row.get("user_id")
+        status = row.get("status")
+        if not user_id or status not in ENTITLEMENT_ACTIVE_STATUSES:
+            return None
+        entitlement = Entitlement(
+            user_id=user_id,
+            plan_id=row.get("plan_id"),
+            status=status,
+            current_period_end=to_timestamp(row.get("current_period_end")),
+            stripe_subscription_id=row.get("stripe_subscription_id"),
+            # Cualquier webhook posterior tiene prioridad sobre la base
+            source_created=0.0
+        )
+        return entitlement if entitlement.is_active(now) else None
+
+    async def reconcile(self) -> bool:
+        """
+        Reconstruir el mapa desde Supabase; si falla se conserva el actual
+        """
+        started = time.monotonic()
+        try:
+            rows = await self._load_rows()
+        except Exception as e:
+            self.failed_reconciles += 1
+            logger.error(f"❌ Error reconciliando entitlements (se mantiene el mapa actual): {e}")
+            return False
+
+        now = time.time()
+        entries: Dict[str, Entitlement] = {}
+        for row in rows:
+            entitlement = self._from_row(row, now)
+            if entitlement is None:
+                continue
+            user_id = entitlement.user_id
+            # Con varias filas vigentes por usuario gana la de período más largo
+            previous = entries.get(user_id)
+            if previous is None or (entitlement.current_period_end or 0) > (previous.current_period_end or 0):
+                entries[user_id] = entitlement
+
+        # Los webhooks llegados durante la lectura son más recientes que la base
+        for user_id, pushed_at in self._pushed_at.items():
+            if pushed_at >= started:
+                if user_id in self._entries:
+                    entries[user_id] = self._entries[user_id]
+                else:
+                    entries.pop(user_id, None)
+
+        # Diferencias con el mapa actual (sin contar source_created)
+        corrections = sum(
+            1 for user_id in entries.keys() | self._entries.keys()
+            if tuple(entries.get(user_id, ()))[:5] != tuple(self._entries.get(user_id, ()))[:5]
+        )
+        self._entries = entries
+        self._pushed_at = {user_id: t for user_id, t in self._pushed_at.items() if t >= started}
+        self.reconciled_at = now
+        self.reconciles += 1
+        self.reconcile_corrections += corrections
+        self._loaded.set()
+        logger.info(f"🔐 Entitlements reconciliados: {len(entries)} activos, {corrections} corregidos")
+        return True
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if await self.reconcile():
+                failures = 0
+                delay = self.reconcile_interval
+            else:
+                # Sin esperar el intervalo completo: sobre todo si aún no hay mapa
+                delay = min(
+                    ENTITLEMENT_RETRY_BASE_SECONDS * 2 ** failures,
+                    ENTITLEMENT_RETRY_MAX_SECONDS,
+                    self.reconcile_interval
+                ) * random.uniform(0.5, 1.0)
+                failures += 1
+            await asyncio.sleep(delay)
+
+    async def start(self, timeout: Optional[float] = None):
+        """
+        Arrancar la carga inicial y la reconciliación periódica. Espera la
+        primera carga como máximo `timeout` segundos (None: sin límite); los
+        webhooks que lleguen mientras tanto ya se aplican al mapa y las
+        comprobaciones usan resolve() contra la base.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="entitlement-reconcile")
+        try:
+            await asyncio.wait_for(self._loaded.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Entitlements sin cargar tras {timeout}s: siguen en segundo plano")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "loaded": self.loaded,
+            "fallback_lookups": self.fallback_lookups,
+            "checks": self.checks,
+            "pushes": self.pushes,
+            "stale_pushes": self.stale_pushes,
+            "reconciles": self.reconciles,
+            "failed_reconciles": self.failed_reconciles,
+            "reconcile_corrections": self.reconcile_corrections,
+            "reconcile_age_seconds": round(time.time() - self.reconciled_at, 1) if self.reconciled_at else None
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_entitlements: Optional[EntitlementCache] = None
+
+def get_entitlements() -> EntitlementCache:
+    """
+    Obtener el mapa de entitlements compartido (se crea en el primer uso)
+    """
+    global _entitlements
+    if _entitlements is None:
+        _entitlements = EntitlementCache()
+    return _entitlements
+
+async def start_entitlements(timeout: Optional[float] = None):
+    await get_entitlements().start(timeout)
+
+async def stop_entitlements():
+    global _entitlements
+    if _entitlements is not None:
+        await _entitlements.stop()
+        _entitlements = None
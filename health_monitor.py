@@ -0,0 +1,245 @@
+"""
+Health checks profundos con resultados cacheados
+Una tarea de fondo sondea Supabase, Stripe y el backend de LLM cada
+HEALTH_PROBE_INTERVAL segundos (en paralelo, con timeout y latencia medida) y
+publica un reporte inmutable. /health, /health/ready y /health/live solo leen
+ese reporte: los probes del balanceador nunca generan llamadas externas.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Mapping, NamedTuple, Optional
+
+from supabase_repository import get_repository
+from stripe_gateway import get_stripe_gateway
+from llm_backends import get_llm_backend
+from plan_catalog import PLANS_TABLE
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 15))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", 5))
+# Fallos seguidos para dar por caída una dependencia que ya respondió antes
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", 2))
+# Dependencias sin las que la instancia no debe recibir tráfico (readiness)
+HEALTH_CRITICAL_DEPENDENCIES = frozenset(
+    name.strip()
+    for name in os.getenv("HEALTH_CRITICAL_DEPENDENCIES", "supabase").split(",")
+    if name.strip()
+)
+
+
+async def probe_supabase():
+    await get_repository().select(PLANS_TABLE, columns="id", limit=1)
+
+async def probe_stripe():
+    await get_stripe_gateway().ping()
+
+async def probe_llm():
+    await get_llm_backend().ping()
+
+DEFAULT_PROBES: Dict[str, Callable[[], Awaitable[Any]]] = {
+    "supabase": probe_supabase,
+    "stripe": probe_stripe,
+    "llm": probe_llm
+}
+
+
+class ProbeResult(NamedTuple):
+    ok: bool
+    latency_ms: float
+    checked_at: float
+    error: Optional[str]
+
+
+class DependencyState:
+    """
+    Historial mínimo de una dependencia: último resultado, fallos seguidos y
+    si alguna vez respondió
+    """
+
+    def __init__(self, critical: bool):
+        self.critical = critical
+        self.last: Optional[ProbeResult] = None
+        self.consecutive_failures = 0
+        self.ever_up = False
+
+    def record(self, result: ProbeResult):
+        self.last = result
+        if result.ok:
+            self.consecutive_failures = 0
+            self.ever_up = True
+        else:
+            self.consecutive_failures += 1
+
+    @property
+    def up(self) -> bool:
+        # Un fallo aislado no tumba una dependencia que ya respondía
+        if not self.ever_up:
+            return self.last is not None and self.last.ok
+        return self.consecutive_failures < HEALTH_FAILURE_THRESHOLD
+
+    def to_dict(self) -> Dict[str, Any]:
+        last = self.last
+        return {
+            "status": "up" if self.up else "down",
+            "critical": self.critical,
+            "latency_ms": last.latency_ms if last else None,
+            "checked_at": _iso(last.checked_at) if last else None,
+            "consecutive_failures": self.consecutive_failures,
+            "error": last.error if last else None
+        }
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class HealthMonitor:
+    """
+    Sondeo periódico de dependencias con el último reporte en memoria
+    """
+
+    def __init__(
+        self,
+        probes: Optional[Dict[str, Callable[[], Awaitable[Any]]]] = None,
+        interval: float = HEALTH_PROBE_INTERVAL,
+        timeout: float = HEALTH_PROBE_TIMEOUT,
+        critical: frozenset = HEALTH_CRITICAL_DEPENDENCIES
+    ):
+        self.probes = probes if probes is not None else DEFAULT_PROBES
+        self.interval = interval
+        self.timeout = timeout
+        self._states = {name: DependencyState(name in critical) for name in self.probes}
+        self._report: Mapping[str, Any] = MappingProxyType({"status": "starting", "dependencies": {}})
+        self._checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+        self.rounds = 0
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable[Any]]) -> ProbeResult:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), timeout=self.timeout)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"timeout tras {self.timeout}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:300]
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if error:
+            logger.warning(f"⚠️ Health check de {name} falló ({latency_ms} ms): {error}")
+        return ProbeResult(error is None, latency_ms, time.time(), error)
+
+    async def check(self) -> Mapping[str, Any]:
+        """
+        Sondear todas las dependencias en paralelo y publicar el reporte
+        """
+        names = list(self.probes)
+        results = await asyncio.gather(*(self._probe(name, self.probes[name]) for name in names))
+        for name, result in zip(names, results):
+            self._states[name].record(result)
+
+        dependencies = {name: state.to_dict() for name, state in self._states.items()}
+        if any(state.critical and not state.up for state in self._states.values()):
+            status = "unhealthy"
+        elif all(state.up for state in self._states.values()):
+            status = "healthy"
+        else:
+            status = "degraded"
+
+        self._checked_at = time.time()
+        self._report = MappingProxyType({
+            "status": status,
+            "checked_at": _iso(self._checked_at),
+            "dependencies": dependencies
+        })
+        self.rounds += 1
+        return self._report
+
+    # ================== CONSULTAS (SIN I/O) ==================
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Último reporte; si el sondeo dejó de correr se marca como stale
+        """
+        report = dict(self._report)
+        if self._checked_at is not None:
+            age = time.time() - self._checked_at
+            report["age_seconds"] = round(age, 1)
+            if age > 3 * self.interval + self.timeout and report["status"] == "healthy":
+                report["status"] = "degraded"
+                report["stale"] = True
+        return report
+
+    def is_ready(self) -> bool:
+        return self._report["status"] in ("healthy", "degraded")
+
+    def uptime(self) -> float:
+        return time.time() - self.started_at
+
+    # ================== CICLO DE VIDA ==================
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"❌ Error en ronda de health checks: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="health-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "ready": self.is_ready(),
+            "dependencies": {
+                name: {
+                    "up": state.up,
+                    "latency_ms": state.last.latency_ms if state.last else None,
+                    "consecutive_failures": state.consecutive_failures
+                }
+                for name, state in self._states.items()
+            }
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_monitor: Optional[HealthMonitor] = None
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    Obtener el monitor compartido (se crea en el primer uso)
+    """
+    global _monitor
+    if _monitor is None:
+        _monitor = HealthMonitor()
+    return _monitor
+
+def start_health_monitor():
+    get_health_monitor().start()
+
+async def stop_health_monitor():
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
@@ -0,0 +1,347 @@
+"""
+Soporte de Idempotency-Key para los endpoints que modifican suscripciones
+La respuesta de la primera request con una clave se guarda durante
+IDEMPOTENCY_TTL segundos (LRU acotado en memoria y, opcionalmente, SQLite
+compartido entre workers): los reintentos del cliente se responden sin tocar
+Stripe, los duplicados concurrentes esperan a la request en curso y la clave se
+reenvía a Stripe para que un reintento tras un timeout no duplique el cobro.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from singleflight import SingleFlight
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+# Vigencia de una clave (Stripe conserva las suyas 24 h)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_MAXSIZE = int(os.getenv("IDEMPOTENCY_MAXSIZE", 10_000))
+# Archivo SQLite para conservar las respuestas entre reinicios y workers (vacío = solo memoria)
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "")
+# Segundos que otro worker considera "en curso" una clave reclamada
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    locked_until REAL NOT NULL DEFAULT 0,
+    status_code INTEGER,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at);
+"""
+
+
+class IdempotencyRecord(NamedTuple):
+    fingerprint: str
+    first_seen: float
+    status_code: Optional[int] = None
+    body: Any = None
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+
+class IdempotentRequest(NamedTuple):
+    """
+    Contexto que recibe el handler: la clave (None si el cliente no envió una) y
+    el instante del primer intento, estable entre reintentos
+    """
+    key: Optional[str]
+    first_seen: float
+
+    def stripe_key(self, operation: str) -> Optional[str]:
+        """
+        Clave de Stripe derivada para una operación concreta de la request
+        """
+        if self.key is None:
+            return None
+        digest = hashlib.sha256(self.key.encode("utf-8")).hexdigest()
+        return f"recipetuner-{operation}-{digest}"
+
+    @property
+    def started_at(self) -> datetime:
+        return datetime.fromtimestamp(self.first_seen, tz=timezone.utc).replace(tzinfo=None)
+
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def _conflict() -> HTTPException:
+    return HTTPException(
+        status_code=422,
+        detail="Idempotency-Key ya usada con otros parámetros"
+    )
+
+
+class IdempotencyStore:
+    """
+    Respuestas por clave en un TTLCache, con single-flight para las requests
+    concurrentes del mismo proceso y una tabla SQLite opcional (modo WAL) que
+    comparten los workers de la máquina.
+
+    Se guardan las respuestas 2xx y los errores del cliente (4xx); los 5xx, 409
+    y 429 no, para que el reintento vuelva a ejecutar la operación (con la misma
+    clave hacia Stripe).
+    """
+
+    def __init__(
+        self,
+        path: str = IDEMPOTENCY_DB_PATH,
+        maxsize: int = IDEMPOTENCY_MAXSIZE,
+        ttl: float = IDEMPOTENCY_TTL,
+        lock_timeout: float = IDEMPOTENCY_LOCK_TIMEOUT
+    ):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._records = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (time.time(),))
+
+        self.executed = 0
+        self.replayed = 0
+        self.db_replayed = 0
+        self.parked = 0
+        self.conflicts = 0
+
+    # ================== SQLITE ==================
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _claim(self, key: str, fingerprint: str, first_seen: float) -> Optional[IdempotencyRecord]:
+        """
+        Reclamar la clave para este proceso; devuelve el registro existente
+        (completado o abandonado) o None si la clave es nueva
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT fingerprint, first_seen, locked_until, status_code, body "
+                "FROM idempotency_keys WHERE key = ? AND expires_at >= ?",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, first_seen, expires_at, locked_until) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, fingerprint, first_seen, first_seen + self.ttl, now + self.lock_timeout)
+                )
+                return None
+
+            stored_fingerprint, stored_first_seen, locked_until, status_code, body = row
+            if stored_fingerprint != fingerprint:
+                raise _conflict()
+            if status_code is not None:
+                return IdempotencyRecord(stored_fingerprint, stored_first_seen, status_code, json.loads(body))
+            if locked_until > now:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Hay una request en curso con esta Idempotency-Key",
+                    headers={"Retry-After": "1"}
+                )
+            self._conn.execute(
+                "UPDATE idempotency_keys SET locked_until = ? WHERE key = ?",
+                (now + self.lock_timeout, key)
+            )
+            return IdempotencyRecord(stored_fingerprint, stored_first_seen)
+        finally:
+            self._conn.execute("COMMIT")
+
+    def _complete(self, key: str, status_code: int, body: Any):
+        self._conn.execute(
+            "UPDATE idempotency_keys SET status_code = ?, body = ?, locked_until = 0 WHERE key = ?",
+            (status_code, json.dumps(body), key)
+        )
+
+    def _release(self, key: str):
+        self._conn.execute("UPDATE idempotency_keys SET locked_until = 0 WHERE key = ?", (key,))
+
+    async def _persist(self, fn: Callable[..., Any], *args):
+        try:
+            await self._run(fn, *args)
+        except sqlite3.Error as e:
+            logger.error(f"❌ Error guardando Idempotency-Key en SQLite: {e}")
+
+    # ================== EJECUCIÓN ==================
+
+    async def _execute(
+        self,
+        key: str,
+        record: IdempotencyRecord,
+        handler: Callable[[IdempotentRequest], Awaitable[Any]]
+    ) -> Tuple[IdempotencyRecord, bool]:
+        """
+        Devuelve la respuesta y si ya estaba guardada (otro worker o un reinicio)
+        """
+        first_seen = record.first_seen
+        if self._conn is not None:
+            try:
+                stored = await self._run(self._claim, key, record.fingerprint, first_seen)
+            except sqlite3.Error as e:
+                logger.error(f"❌ Error leyendo Idempotency-Key de SQLite: {e}")
+                stored = None
+            if stored is not None and stored.completed:
+                self._records.set(key, stored)
+                self.db_replayed += 1
+                return stored, True
+            if stored is not None:
+                first_seen = stored.first_seen
+                self._records.set(key, stored)
+
+        self.executed += 1
+        try:
+            body = await handler(IdempotentRequest(key, first_seen))
+            status_code = 200
+        except HTTPException as e:
+            if e.status_code >= 500 or e.status_code in (409, 429):
+                if self._conn is not None:
+                    await self._persist(self._release, key)
+                raise
+            status_code, body = e.status_code, {"detail": e.detail}
+        except BaseException:
+            if self._conn is not None:
+                await self._persist(self._release, key)
+            raise
+
+        completed = IdempotencyRecord(record.fingerprint, first_seen, status_code, jsonable_encoder(body))
+        self._records.set(key, completed)
+        if self._conn is not None:
+            await self._persist(self._complete, key, status_code, completed.body)
+        return completed, False
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[IdempotentRequest], Awaitable[Any]]
+    ) -> JSONResponse:
+        """
+        Ejecutar `handler` una sola vez por clave y devolver siempre la misma respuesta
+        """
+        record = self._records.get(key)
+        if record is not None and record.fingerprint != fingerprint:
+            self.conflicts += 1
+            raise _conflict()
+        if record is not None and record.completed:
+            self.replayed += 1
+            return self._response(record, replayed=True)
+        if record is None:
+            # Registro pendiente antes de ceder el event loop: un duplicado que
+            # llegue ahora ya ve la huella de esta request
+            record = IdempotencyRecord(fingerprint, time.time())
+            self._records.set(key, record)
+
+        leader = False
+
+        async def execute() -> Tuple[IdempotencyRecord, bool]:
+            nonlocal leader
+            leader = True
+            return await self._execute(key, record, handler)
+
+        completed, stored = await self._flights.do(key, execute)
+        if not leader:
+            self.parked += 1
+        return self._response(completed, replayed=stored or not leader)
+
+    @staticmethod
+    def _response(record: IdempotencyRecord, replayed: bool) -> JSONResponse:
+        headers = {"Idempotent-Replayed": "true"} if replayed else None
+        return JSONResponse(status_code=record.status_code, content=record.body, headers=headers)
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": self._records.stats(),
+            "in_flight": self._flights.in_flight(),
+            "persistent": self._conn is not None,
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "db_replayed": self.db_replayed,
+            "parked": self.parked,
+            "conflicts": self.conflicts
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_store: Optional[IdempotencyStore] = None
+
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    Obtener el almacén compartido (se crea en el primer uso)
+    """
+    global _store
+    if _store is None:
+        _store = IdempotencyStore()
+    return _store
+
+def close_idempotency_store():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+async def idempotent(
+    idempotency_key: Optional[str],
+    scope: str,
+    payload: Any,
+    handler: Callable[[IdempotentRequest], Awaitable[Any]]
+) -> Any:
+    """
+    Ejecutar el handler de un endpoint respetando el header Idempotency-Key.
+    `scope` separa las claves por usuario y endpoint; `payload` es el cuerpo de
+    la request, cuya huella debe coincidir en los reintentos.
+    """
+    if not idempotency_key:
+        return await handler(IdempotentRequest(None, time.time()))
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key excede {IDEMPOTENCY_KEY_MAX_LENGTH} caracteres"
+        )
+    return await get_idempotency_store().run(
+        f"{scope}:{idempotency_key}",
+        request_fingerprint(payload),
+        handler
+    )
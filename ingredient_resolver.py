@@ -0,0 +1,185 @@
+"""
+Resolución de nombres de ingredientes
+Convierte texto libre ("2 tazas de harina integral", "strawberries") en una
+entrada de la tabla de alimentos usando un índice invertido de trigramas
+precalculado, sin recorrer la tabla completa ni consultar al LLM
+"""
+
+import os
+import re
+import logging
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from quantity_parser import UNIT_ALIASES
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+# Similitud mínima (coeficiente de Dice sobre trigramas) para aceptar una coincidencia
+RESOLVER_MIN_SCORE = float(os.getenv("RESOLVER_MIN_SCORE", 0.45))
+RESOLVER_CACHE_SIZE = int(os.getenv("RESOLVER_CACHE_SIZE", 50_000))
+
+# Palabras que no identifican al alimento (artículos, preparación, unidades)
+STOPWORDS = {
+    "de", "del", "la", "el", "los", "las", "en", "con", "y", "a", "al", "o", "para",
+    "of", "the", "and", "or", "an", "to", "for", "with",
+    "gusto", "taste", "opcional", "optional",
+    "picado", "picada", "picados", "picadas", "finamente", "rallado", "rallada",
+    "chopped", "minced", "diced", "sliced", "grated", "fresh", "fresco", "fresca"
+} | set(UNIT_ALIASES)
+
+_NON_WORD_RE = re.compile(r"[^a-zñ ]+")
+
+
+def _stem(word: str) -> str:
+    """
+    Singular aproximado en español e inglés. No tiene que ser correcto, solo
+    consistente: se aplica igual a la tabla y a las consultas.
+    """
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ces"):
+        return word[:-3] + "z"          # nueces -> nuez
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"          # strawberries -> strawberry
+    if word.endswith("oes"):
+        return word[:-2]                # tomatoes -> tomato
+    if word.endswith("es") and word[-3] in "lrndj":
+        return word[:-2]                # limones -> limon, frijoles -> frijol
+    if word.endswith(("ches", "shes")):
+        return word[:-2]                # peaches -> peach
+    if word.endswith("s"):
+        return word[:-1]                # huevos -> huevo, tomates -> tomate
+    return word
+
+
+def normalize_ingredient_name(text: str) -> str:
+    """
+    Clave canónica: minúsculas, sin acentos (conservando la ñ), sin cantidades,
+    unidades ni palabras vacías, y en singular
+    """
+    text = text.lower().replace("ñ", "\0")
+    decomposed = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in decomposed if not unicodedata.combining(c)).replace("\0", "ñ")
+    words = _NON_WORD_RE.sub(" ", text).split()
+    return " ".join(_stem(word) for word in words if word not in STOPWORDS)
+
+
+def _trigrams(key: str) -> List[str]:
+    padded = f"  {key} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class IngredientMatch(NamedTuple):
+    column: int
+    name: str
+    score: float
+    method: str  # "exact" | "prefix" | "trigram"
+
+
+class IngredientResolver:
+    """
+    Índice de nombres (nombre principal y alias) de la tabla de alimentos.
+
+    Orden de búsqueda: clave exacta y, si no existe, la mejor entre el prefijo de
+    palabras más largo conocido y el nombre con mayor similitud de trigramas. Para la última etapa cada trigrama guarda la lista
+    de nombres que lo contienen; contar coincidencias es un bincount sobre las
+    listas de los trigramas de la consulta, independiente del tamaño de la tabla.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[Tuple[str, int]],
+        min_score: float = RESOLVER_MIN_SCORE,
+        cache_size: int = RESOLVER_CACHE_SIZE
+    ):
+        self.min_score = min_score
+        self._keys: List[str] = []
+        self._columns: List[int] = []
+        self._exact: Dict[str, int] = {}
+
+        for name, column in names:
+            key = normalize_ingredient_name(name)
+            if key and key not in self._exact:
+                self._exact[key] = len(self._keys)
+                self._keys.append(key)
+                self._columns.append(column)
+
+        postings: Dict[str, List[int]] = {}
+        sizes = []
+        for name_id, key in enumerate(self._keys):
+            grams = _trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(name_id)
+
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._sizes = np.array(sizes, dtype=np.float64)
+        self._resolve_cached = lru_cache(maxsize=cache_size)(self._resolve)
+        self.unresolved = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _match(self, name_id: int, score: float, method: str) -> IngredientMatch:
+        return IngredientMatch(self._columns[name_id], self._keys[name_id], score, method)
+
+    def _resolve(self, text: str) -> Optional[IngredientMatch]:
+        key = normalize_ingredient_name(text)
+        if not key:
+            return None
+
+        name_id = self._exact.get(key)
+        if name_id is not None:
+            return self._match(name_id, 1.0, "exact")
+
+        # Prefijo de palabras conocido ("cebolla morada" -> "cebolla"); compite con
+        # los trigramas para no perder una coincidencia casi exacta con errata
+        prefix = None
+        words = key.split()
+        for end in range(len(words) - 1, 0, -1):
+            name_id = self._exact.get(" ".join(words[:end]))
+            if name_id is not None:
+                prefix = self._match(name_id, round(end / len(words), 3), "prefix")
+                break
+
+        fuzzy = self._trigram_match(key)
+        if prefix is None or (fuzzy is not None and fuzzy.score > prefix.score):
+            return fuzzy
+        return prefix
+
+    def _trigram_match(self, key: str) -> Optional[IngredientMatch]:
+        grams = _trigrams(key)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return None
+
+        shared = np.bincount(np.concatenate(lists), minlength=len(self._keys))
+        scores = 2.0 * shared / (self._sizes + len(grams))
+        best = int(np.argmax(scores))
+        if scores[best] < self.min_score:
+            return None
+        return self._match(best, round(float(scores[best]), 3), "trigram")
+
+    def resolve(self, text: str) -> Optional[IngredientMatch]:
+        """
+        Mejor entrada para el texto, o None si ninguna es suficientemente parecida
+        """
+        match = self._resolve_cached(text)
+        if match is None:
+            self.unresolved += 1
+        return match
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self._resolve_cached.cache_info()
+        return {
+            "names": len(self._keys),
+            "trigrams": len(self._postings),
+            "unresolved": self.unresolved,
+            "cache": {"size": cache.currsize, "hits": cache.hits, "misses": cache.misses}
+        }
@@ -4,18 +4,18 @@ Funciones auxiliares para conectar con Supabase y gestionar datos de suscripcion
 """
 
 import os
-from datetime import datetime
-from supabase import create_client, Client
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 import logging
 
-logger = logging.getLogger(__name__)
+from supabase_repository import get_repository
+from jwt_verifier import get_jwt_verifier
+from user_cache import user_profile_cache
+from usage_writer import get_usage_writer
+from plan_catalog import get_plan_catalog
+from resilience import CircuitOpenError, DependencyTimeoutError
 
-# Cliente Supabase
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Usar service role para operaciones del servidor
-)
+logger = logging.getLogger(__name__)
 
 # ================== VALIDACIÓN DE USUARIOS ==================
 
@@ -24,23 +24,33 @@ async def validate_supabase_token(token: str) -> Optional[Dict[str, Any]]:
     Validar token de Supabase y obtener datos del usuario
     """
     try:
-        # Verificar token con Supabase
-        response = supabase.auth.get_user(token)
+        # Verificar firma y expiración del JWT localmente
+        claims = await get_jwt_verifier().verify(token)
 
-        if response.user:
-            # Obtener perfil del usuario desde la tabla
-            user_profile = supabase.table('recipetuner_users').select('*').eq('auth_user_id', response.user.id).execute()
+        if claims:
+            auth_user_id = claims['sub']
 
-            if user_profile.data:
+            # Obtener perfil del usuario desde la caché o desde la tabla
+            profile = user_profile_cache.get_by_auth_user_id(auth_user_id)
+            if profile is None:
+                user_profile = await get_repository().select('recipetuner_users', filters={'auth_user_id': auth_user_id})
+                if user_profile:
+                    profile = user_profile[0]
+                    user_profile_cache.put(profile, auth_user_id=auth_user_id)
+
+            if profile:
                 return {
-                    "user_id": user_profile.data[0]['id'],
-                    "auth_user_id": response.user.id,
-                    "email": response.user.email,
-                    "profile": user_profile.data[0]
+                    "user_id": profile['id'],
+                    "auth_user_id": auth_user_id,
+                    "email": claims.get('email'),
+                    "profile": profile
                 }
 
         return None
 
+    except (CircuitOpenError, DependencyTimeoutError):
+        # Supabase caído no es un token inválido: 503, no 401
+        raise
     except Exception as e:
         logger.error(f"❌ Error validando token: {e}")
         return None
@@ -53,7 +63,7 @@ async def create_subscription_in_supabase(subscription_data: Dict[str, Any]) ->
     """
     try:
         # Insertar en tabla de suscripciones
-        result = supabase.table('recipetuner_subscriptions').insert({
+        result = await get_repository().insert('recipetuner_subscriptions', {
             'user_id': subscription_data['user_id'],
             'plan_id': subscription_data['plan_id'],
             'stripe_subscription_id': subscription_data['stripe_subscription_id'],
@@ -63,9 +73,9 @@ async def create_subscription_in_supabase(subscription_data: Dict[str, Any]) ->
             'current_period_end': subscription_data['current_period_end'],
             'trial_start': subscription_data.get('trial_start'),
             'trial_end': subscription_data.get('trial_end')
-        }).execute()
+        })
 
-        logger.info(f"✅ Suscripción creada en Supabase: {result.data[0]['id']}")
+        logger.info(f"✅ Suscripción creada en Supabase: {result[0]['id']}")
         return True
 
     except Exception as e:
@@ -77,7 +87,11 @@ async def update_subscription_in_supabase(stripe_subscription_id: str, updates:
     Actualizar suscripción en Supabase
     """
     try:
-        result = supabase.table('recipetuner_subscriptions').update(updates).eq('stripe_subscription_id', stripe_subscription_id).execute()
+        await get_repository().update(
+            'recipetuner_subscriptions',
+            updates,
+            filters={'stripe_subscription_id': stripe_subscription_id}
+        )
 
         logger.info(f"✅ Suscripción actualizada en Supabase: {stripe_subscription_id}")
         return True
@@ -86,15 +100,37 @@ async def update_subscription_in_supabase(stripe_subscription_id: str, updates:
         logger.error(f"❌ Error actualizando suscripción en Supabase: {e}")
         return False
 
+async def upsert_subscription_in_supabase(subscription_data: Dict[str, Any]) -> bool:
+    """
+    Crear o actualizar la suscripción por stripe_subscription_id (idempotente
+    ante reintentos del mismo webhook)
+    """
+    try:
+        await get_repository().upsert(
+            'recipetuner_subscriptions',
+            subscription_data,
+            on_conflict='stripe_subscription_id'
+        )
+
+        logger.info(f"✅ Suscripción guardada en Supabase: {subscription_data['stripe_subscription_id']}")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error guardando suscripción en Supabase: {e}")
+        return False
+
 async def get_subscription_by_stripe_id(stripe_subscription_id: str) -> Optional[Dict[str, Any]]:
     """
     Obtener suscripción por Stripe ID
     """
     try:
-        result = supabase.table('recipetuner_subscriptions').select('*').eq('stripe_subscription_id', stripe_subscription_id).execute()
+        result = await get_repository().select(
+            'recipetuner_subscriptions',
+            filters={'stripe_subscription_id': stripe_subscription_id}
+        )
 
-        if result.data:
-            return result.data[0]
+        if result:
+            return result[0]
 
         return None
 
@@ -109,14 +145,14 @@ async def create_billing_event(event_data: Dict[str, Any]) -> bool:
     Registrar evento de facturación en Supabase
     """
     try:
-        result = supabase.table('recipetuner_billing_events').insert({
+        await get_repository().insert('recipetuner_billing_events', {
             'user_id': event_data.get('user_id'),
             'subscription_id': event_data.get('subscription_id'),
             'stripe_event_id': event_data['stripe_event_id'],
             'event_type': event_data['event_type'],
             'event_data': event_data['event_data'],
             'processed': False
-        }).execute()
+        }, returning=False)
 
         logger.info(f"✅ Evento de facturación registrado: {event_data['stripe_event_id']}")
         return True
@@ -130,10 +166,14 @@ async def is_event_processed(stripe_event_id: str) -> bool:
     Verificar si un evento ya fue procesado
     """
     try:
-        result = supabase.table('recipetuner_billing_events').select('processed').eq('stripe_event_id', stripe_event_id).execute()
+        result = await get_repository().select(
+            'recipetuner_billing_events',
+            columns='processed',
+            filters={'stripe_event_id': stripe_event_id}
+        )
 
-        if result.data:
-            return result.data[0]['processed']
+        if result:
+            return result[0]['processed']
 
         return False
 
@@ -146,7 +186,11 @@ async def mark_event_as_processed(stripe_event_id: str) -> bool:
     Marcar evento como procesado
     """
     try:
-        result = supabase.table('recipetuner_billing_events').update({'processed': True}).eq('stripe_event_id', stripe_event_id).execute()
+        await get_repository().update(
+            'recipetuner_billing_events',
+            {'processed': True},
+            filters={'stripe_event_id': stripe_event_id}
+        )
 
         logger.info(f"✅ Evento marcado como procesado: {stripe_event_id}")
         return True
@@ -155,6 +199,26 @@ async def mark_event_as_processed(stripe_event_id: str) -> bool:
         logger.error(f"❌ Error marcando evento: {e}")
         return False
 
+async def record_processed_event(event_data: Dict[str, Any]) -> bool:
+    """
+    Registrar un evento como procesado en una sola escritura (upsert por stripe_event_id)
+    """
+    try:
+        await get_repository().upsert('recipetuner_billing_events', {
+            'user_id': event_data.get('user_id'),
+            'subscription_id': event_data.get('subscription_id'),
+            'stripe_event_id': event_data['stripe_event_id'],
+            'event_type': event_data['event_type'],
+            'event_data': event_data['event_data'],
+            'processed': True
+        }, on_conflict='stripe_event_id')
+
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error registrando evento procesado: {e}")
+        return False
+
 # ================== GESTIÓN DE CUSTOMERS ==================
 
 async def get_or_create_customer_mapping(user_id: str, stripe_customer_id: str) -> bool:
@@ -162,20 +226,24 @@ async def get_or_create_customer_mapping(user_id: str, stripe_customer_id: str)
     Crear o actualizar mapeo de customer Stripe con usuario
     """
     try:
+        repository = get_repository()
+
         # Verificar si ya existe mapeo
-        existing = supabase.table('recipetuner_stripe_customers').select('*').eq('user_id', user_id).execute()
+        existing = await repository.select('recipetuner_stripe_customers', filters={'user_id': user_id})
 
-        if existing.data:
+        if existing:
             # Actualizar customer ID existente
-            result = supabase.table('recipetuner_stripe_customers').update({
-                'stripe_customer_id': stripe_customer_id
-            }).eq('user_id', user_id).execute()
+            await repository.update(
+                'recipetuner_stripe_customers',
+                {'stripe_customer_id': stripe_customer_id},
+                filters={'user_id': user_id}
+            )
         else:
             # Crear nuevo mapeo
-            result = supabase.table('recipetuner_stripe_customers').insert({
+            await repository.insert('recipetuner_stripe_customers', {
                 'user_id': user_id,
                 'stripe_customer_id': stripe_customer_id
-            }).execute()
+            })
 
         logger.info(f"✅ Mapeo de customer actualizado: {user_id} -> {stripe_customer_id}")
         return True
@@ -184,73 +252,104 @@ async def get_or_create_customer_mapping(user_id: str, stripe_customer_id: str)
         logger.error(f"❌ Error gestionando mapeo de customer: {e}")
         return False
 
-async def get_user_by_stripe_customer_id(stripe_customer_id: str) -> Optional[Dict[str, Any]]:
+async def get_customer_id_for_user(user_id: str) -> Optional[str]:
     """
-    Obtener usuario por Stripe Customer ID
+    Obtener el Stripe Customer ID mapeado a un usuario
     """
     try:
-        result = supabase.table('recipetuner_stripe_customers').select('*, user:recipetuner_users(*)').eq('stripe_customer_id', stripe_customer_id).execute()
+        result = await get_repository().select(
+            'recipetuner_stripe_customers',
+            columns='stripe_customer_id',
+            filters={'user_id': user_id},
+            limit=1
+        )
 
-        if result.data:
-            return result.data[0]['user']
+        if result:
+            return result[0]['stripe_customer_id']
 
         return None
 
     except Exception as e:
-        logger.error(f"❌ Error obteniendo usuario por customer ID: {e}")
+        logger.error(f"❌ Error obteniendo mapeo de customer: {e}")
         return None
 
-# ================== PLANES DE SUSCRIPCIÓN ==================
-
-async def get_plan_by_id(plan_id: str) -> Optional[Dict[str, Any]]:
+async def get_user_by_stripe_customer_id(stripe_customer_id: str) -> Optional[Dict[str, Any]]:
     """
-    Obtener plan de suscripción por ID
+    Obtener usuario por Stripe Customer ID
     """
     try:
-        result = supabase.table('recipetuner_subscription_plans').select('*').eq('id', plan_id).execute()
-
-        if result.data:
-            return result.data[0]
+        cached = user_profile_cache.get_by_stripe_customer_id(stripe_customer_id)
+        if cached is not None:
+            return cached
+
+        result = await get_repository().select(
+            'recipetuner_stripe_customers',
+            columns='*, user:recipetuner_users(*)',
+            filters={'stripe_customer_id': stripe_customer_id}
+        )
+
+        if result:
+            user = result[0]['user']
+            if user:
+                user_profile_cache.put(user, stripe_customer_id=stripe_customer_id)
+            return user
 
         return None
 
     except Exception as e:
-        logger.error(f"❌ Error obteniendo plan: {e}")
+        logger.error(f"❌ Error obteniendo usuario por customer ID: {e}")
         return None
 
+def invalidate_user_cache(
+    auth_user_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    stripe_customer_id: Optional[str] = None
+) -> bool:
+    """
+    Descartar el perfil cacheado de un usuario cuyo estado cambió
+    """
+    return user_profile_cache.invalidate(
+        auth_user_id=auth_user_id,
+        user_id=user_id,
+        stripe_customer_id=stripe_customer_id
+    )
+
+# ================== PLANES DE SUSCRIPCIÓN ==================
+
+async def get_plan_by_id(plan_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Obtener plan de suscripción por ID (catálogo en memoria, sin consultar la base)
+    """
+    plan = get_plan_catalog().get_plan(plan_id)
+    return dict(plan) if plan is not None else None
+
 # ================== FUNCIONES AUXILIARES ==================
 
 async def get_price_ids_from_plan(plan_id: str) -> Dict[str, str]:
     """
     Obtener Price IDs de Stripe desde la configuración del plan
     """
-    try:
-        plan = await get_plan_by_id(plan_id)
-
-        if not plan:
-            raise Exception(f"Plan no encontrado: {plan_id}")
+    price_ids = get_plan_catalog().price_ids(plan_id)
 
-        return {
-            "monthly": plan.get('stripe_price_id_monthly'),
-            "yearly": plan.get('stripe_price_id_yearly')
-        }
+    if price_ids is None:
+        logger.error(f"❌ Error obteniendo Price IDs: plan no encontrado: {plan_id}")
+        raise Exception(f"Plan no encontrado: {plan_id}")
 
-    except Exception as e:
-        logger.error(f"❌ Error obteniendo Price IDs: {e}")
-        raise
+    return price_ids
 
 async def log_api_usage(user_id: str, endpoint: str, success: bool, metadata: Dict[str, Any] = None):
     """
-    Registrar uso de API para analytics
+    Registrar uso de API para analytics (se encola y se escribe por lotes)
     """
     try:
-        supabase.table('recipetuner_api_usage').insert({
+        get_usage_writer().record({
             'user_id': user_id,
             'endpoint': endpoint,
             'success': success,
             'metadata': metadata or {},
-            'timestamp': 'now()'
-        }).execute()
+            # La fila se inserta más tarde: guardar el momento real de la llamada
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
 
     except Exception as e:
         logger.error(f"❌ Error registrando uso de API: {e}")
@@ -0,0 +1,174 @@
+"""
+Verificación local de JWT de Supabase
+Valida firma, expiración y audiencia del access token sin ir a Supabase Auth en cada
+request. Soporta el secreto HS256 del proyecto y llaves asimétricas publicadas vía JWKS
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import jwt
+
+from supabase_repository import get_repository
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", 10))
+
+# Tiempo que se conserva el JWKS antes de volver a descargarlo
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", 3600))
+# Intervalo mínimo entre descargas forzadas por un `kid` desconocido (rotación)
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 30))
+
+# Ventana de revocación: cada sesión se confirma contra Supabase Auth como máximo
+# una vez por ventana; 0 desactiva la confirmación remota
+AUTH_REVOCATION_WINDOW = int(os.getenv("AUTH_REVOCATION_WINDOW", 300))
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+
+class SupabaseJWTVerifier:
+    """
+    Verificador de access tokens de Supabase.
+
+    - HS256: se valida con SUPABASE_JWT_SECRET.
+    - RS256/ES256: se valida con el JWKS del proyecto, cacheado y refrescado
+      cuando aparece un `kid` desconocido (rotación de llaves).
+    - Sin secreto configurado para un token HS256 se recurre a Supabase Auth.
+    """
+
+    def __init__(
+        self,
+        jwt_secret: Optional[str] = SUPABASE_JWT_SECRET,
+        audience: str = SUPABASE_JWT_AUDIENCE,
+        leeway: int = JWT_LEEWAY_SECONDS,
+        revocation_window: int = AUTH_REVOCATION_WINDOW
+    ):
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.leeway = leeway
+        self.revocation_window = revocation_window
+
+        self._jwks: Dict[str, Any] = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock: Optional[asyncio.Lock] = None
+
+        # session_id -> True (sesión confirmada) / False (sesión revocada)
+        self._sessions = TTLCache(maxsize=50_000, ttl=max(revocation_window, 1))
+
+    # ================== JWKS ==================
+
+    async def _refresh_jwks(self, force: bool = False):
+        if self._jwks_lock is None:
+            self._jwks_lock = asyncio.Lock()
+
+        async with self._jwks_lock:
+            age = time.monotonic() - self._jwks_fetched_at
+            if self._jwks and age < (JWKS_MIN_REFRESH_INTERVAL if force else JWKS_CACHE_TTL):
+                return
+
+            keys = await get_repository().get_jwks()
+            self._jwks = {
+                key["kid"]: jwt.PyJWK(key).key
+                for key in keys
+                if key.get("kid")
+            }
+            self._jwks_fetched_at = time.monotonic()
+            logger.info(f"🔑 JWKS actualizado: {len(self._jwks)} llaves")
+
+    async def _get_signing_key(self, kid: Optional[str]):
+        await self._refresh_jwks()
+        if kid not in self._jwks:
+            # Posible rotación de llaves: forzar descarga (con límite de frecuencia)
+            await self._refresh_jwks(force=True)
+        return self._jwks.get(kid)
+
+    # ================== VERIFICACIÓN ==================
+
+    def _decode(self, token: str, key: Any, algorithms) -> Dict[str, Any]:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"]}
+        )
+
+    async def _verify_remotely(self, token: str) -> Optional[Dict[str, Any]]:
+        auth_user = await get_repository().get_auth_user(token)
+        if not auth_user:
+            return None
+        return {"sub": auth_user["id"], "email": auth_user.get("email")}
+
+    async def _check_revocation(self, token: str, claims: Dict[str, Any]) -> bool:
+        """
+        Confirmar contra Supabase Auth que la sesión sigue activa, una vez por ventana
+        """
+        if self.revocation_window <= 0:
+            return True
+
+        session_key = claims.get("session_id") or claims["sub"]
+        status = self._sessions.get(session_key)
+        if status is None:
+            status = await self._verify_remotely(token) is not None
+            self._sessions.set(session_key, status)
+            if not status:
+                logger.warning(f"🚫 Sesión revocada: {session_key}")
+        return status
+
+    async def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Verificar un access token y devolver sus claims, o None si no es válido
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get("alg")
+
+            if algorithm == "HS256":
+                if not self.jwt_secret:
+                    # Sin secreto local solo Supabase Auth puede validar el token
+                    return await self._verify_remotely(token)
+                claims = self._decode(token, self.jwt_secret, ["HS256"])
+            elif algorithm in ASYMMETRIC_ALGORITHMS:
+                key = await self._get_signing_key(header.get("kid"))
+                if key is None:
+                    logger.warning(f"⚠️ JWT firmado con kid desconocido: {header.get('kid')}")
+                    return None
+                claims = self._decode(token, key, [algorithm])
+            else:
+                logger.warning(f"⚠️ Algoritmo JWT no soportado: {algorithm}")
+                return None
+
+        except jwt.ExpiredSignatureError:
+            return None
+        except jwt.InvalidTokenError as e:
+            logger.warning(f"⚠️ JWT inválido: {e}")
+            return None
+
+        if not await self._check_revocation(token, claims):
+            return None
+
+        return claims
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_verifier: Optional[SupabaseJWTVerifier] = None
+
+def get_jwt_verifier() -> SupabaseJWTVerifier:
+    """
+    Obtener el verificador compartido (se crea en el primer uso)
+    """
+    global _verifier
+    if _verifier is None:
+        _verifier = SupabaseJWTVerifier()
+    return _verifier
@@ -0,0 +1,230 @@
+"""
+Backends de LLM para el análisis de recetas
+OpenAI (chat completions con salida JSON) y un backend local determinista para
+pruebas y desarrollo sin API key
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metrics import track_dependency
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+RECIPE_LLM_BACKEND = os.getenv("RECIPE_LLM_BACKEND")  # "openai" | "stub"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+# Latencia simulada del backend stub (segundos)
+RECIPE_STUB_LATENCY = float(os.getenv("RECIPE_STUB_LATENCY", 0))
+
+SYSTEM_PROMPT = (
+    "Eres un nutriólogo y chef experto. Analiza la receta que te envían y responde "
+    "únicamente con un objeto JSON con las claves: summary (string), difficulty "
+    "(\"fácil\" | \"media\" | \"difícil\"), estimated_time_minutes (entero), tags "
+    "(lista de strings), allergens (lista de strings) y suggestions (lista de strings "
+    "con mejoras o sustituciones más saludables). Responde en español."
+)
+
+EXPLAIN_PROMPT = (
+    "Eres un nutriólogo y chef experto. Te envían una receta y las sustituciones de "
+    "ingredientes propuestas para hacerla más saludable. Explica en dos o tres frases, "
+    "en español y en tono cercano, por qué funcionan y cómo afectan el sabor o la textura."
+)
+
+
+class LLMError(Exception):
+    """Error al consultar el modelo"""
+
+
+def build_recipe_prompt(recipe: Dict[str, Any]) -> str:
+    """
+    Texto de la receta normalizada que se envía al modelo
+    """
+    lines = []
+    if recipe.get("title"):
+        lines.append(f"Receta: {recipe['title']}")
+    if recipe.get("servings"):
+        lines.append(f"Porciones: {recipe['servings']}")
+    lines.append("Ingredientes:")
+    lines.extend(f"- {ingredient}" for ingredient in recipe.get("ingredients", []))
+    if recipe.get("instructions"):
+        lines.append("Preparación:")
+        lines.extend(f"{i}. {step}" for i, step in enumerate(recipe["instructions"], 1))
+    return "\n".join(lines)
+
+
+class OpenAIBackend:
+    """
+    Backend sobre la API de chat completions de OpenAI (httpx asíncrono)
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = OPENAI_MODEL,
+        base_url: str = OPENAI_BASE_URL,
+        timeout: float = OPENAI_TIMEOUT
+    ):
+        self.model = model
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout
+        )
+
+    async def _chat(self, system: str, user: str, json_output: bool) -> str:
+        payload = {
+            "model": self.model,
+            "temperature": 0.2,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
+            ]
+        }
+        if json_output:
+            payload["response_format"] = {"type": "json_object"}
+
+        try:
+            with track_dependency("openai", "chat.completions"):
+                response = await self._client.post("/chat/completions", json=payload)
+        except httpx.HTTPError as e:
+            # Errores de red y timeouts (OPENAI_TIMEOUT): fallo del modelo, no del servidor
+            raise LLMError(f"Error de red con OpenAI: {type(e).__name__}: {e}") from e
+
+        if response.status_code >= 400:
+            raise LLMError(f"OpenAI respondió {response.status_code}: {response.text}")
+
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, ValueError) as e:
+            raise LLMError(f"Respuesta de OpenAI no válida: {e}")
+
+    async def ping(self):
+        """
+        Comprobar credenciales y conectividad sin consumir tokens (health checks)
+        """
+        try:
+            with track_dependency("openai", "models.list"):
+                response = await self._client.get("/models")
+        except httpx.HTTPError as e:
+            raise LLMError(f"Error de red con OpenAI: {type(e).__name__}: {e}") from e
+        if response.status_code >= 400:
+            raise LLMError(f"OpenAI respondió {response.status_code}")
+
+    async def analyze(self, recipe: Dict[str, Any]) -> Dict[str, Any]:
+        content = await self._chat(SYSTEM_PROMPT, build_recipe_prompt(recipe), json_output=True)
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            raise LLMError(f"Respuesta de OpenAI no válida: {e}")
+
+    async def explain_substitutions(self, recipe: Dict[str, Any], substitutions: List[Dict[str, Any]]) -> str:
+        changes = "\n".join(f"- {s['original']} -> {s['replacement']}" for s in substitutions)
+        prompt = f"{build_recipe_prompt(recipe)}\nSustituciones:\n{changes}"
+        return (await self._chat(EXPLAIN_PROMPT, prompt, json_output=False)).strip()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class StubLLMBackend:
+    """
+    Backend local determinista: misma receta, misma respuesta, sin red.
+    Útil para pruebas, benchmarks y desarrollo sin OPENAI_API_KEY.
+    """
+
+    name = "stub"
+
+    ALLERGEN_KEYWORDS = {
+        "gluten": ["harina", "trigo", "pan", "pasta", "flour", "wheat", "bread"],
+        "lácteos": ["leche", "queso", "crema", "mantequilla", "yogur", "milk", "cheese", "butter", "cream"],
+        "huevo": ["huevo", "egg"],
+        "frutos secos": ["nuez", "almendra", "cacahuate", "walnut", "almond", "peanut"],
+        "mariscos": ["camarón", "camaron", "shrimp", "langosta", "cangrejo"]
+    }
+
+    def __init__(self, calls: Optional[List[Dict[str, Any]]] = None, latency: float = 0.0):
+        # Registro de llamadas recibidas (para verificar caché y coalescencia)
+        self.calls = calls if calls is not None else []
+        # Latencia simulada por llamada, para pruebas de carga y de concurrencia
+        self.latency = latency
+
+    async def analyze(self, recipe: Dict[str, Any]) -> Dict[str, Any]:
+        self.calls.append(recipe)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        ingredients = recipe.get("ingredients", [])
+        text = " ".join(ingredients)
+
+        allergens = [
+            allergen
+            for allergen, keywords in self.ALLERGEN_KEYWORDS.items()
+            if any(keyword in text for keyword in keywords)
+        ]
+        steps = len(recipe.get("instructions", []))
+
+        return {
+            "summary": f"{recipe.get('title') or 'Receta'} con {len(ingredients)} ingredientes",
+            "difficulty": "fácil" if steps <= 3 else "media" if steps <= 8 else "difícil",
+            "estimated_time_minutes": 10 + 5 * steps,
+            "tags": [],
+            "allergens": allergens,
+            "suggestions": []
+        }
+
+    async def explain_substitutions(self, recipe: Dict[str, Any], substitutions: List[Dict[str, Any]]) -> str:
+        self.calls.append(recipe)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ". ".join(s["note"] for s in substitutions if s.get("note"))
+
+    async def ping(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_backend = None
+
+def get_llm_backend():
+    """
+    Obtener el backend configurado (RECIPE_LLM_BACKEND, o stub si no hay API key)
+    """
+    global _backend
+    if _backend is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        choice = RECIPE_LLM_BACKEND or ("openai" if api_key else "stub")
+        if choice == "openai":
+            if not api_key:
+                raise LLMError("OPENAI_API_KEY es requerida para el backend openai")
+            _backend = OpenAIBackend(api_key)
+        else:
+            _backend = StubLLMBackend(latency=RECIPE_STUB_LATENCY)
+        logger.info(f"🤖 Backend LLM: {_backend.name}")
+    return _backend
+
+def set_llm_backend(backend):
+    """
+    Reemplazar el backend (p. ej. por StubLLMBackend en pruebas)
+    """
+    global _backend
+    _backend = backend
+
+async def close_llm_backend():
+    global _backend
+    if _backend is not None:
+        await _backend.aclose()
+        _backend = None
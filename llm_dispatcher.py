@@ -0,0 +1,186 @@
+"""
+Despachador de llamadas al LLM
+Agrupa análisis idénticos en curso (single-flight por hash de la receta) y
+limita las llamadas al proveedor con un token bucket, un máximo de llamadas
+concurrentes y una cola con tiempo máximo de espera
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from llm_backends import LLMError, get_llm_backend
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", 5))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 10))
+# Espera máxima en cola antes de rechazar (segundos) y tamaño máximo de la cola
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 20))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 200))
+
+
+class LLMOverloadedError(LLMError):
+    """La llamada no pudo despacharse a tiempo (cola llena o tiempo de espera agotado)"""
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: `rate` tokens por segundo con ráfagas de hasta `burst`.
+    Los que esperan se atienden en orden de llegada (el lock de asyncio es FIFO).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class LLMDispatcher:
+    """
+    Punto único de salida hacia el backend de LLM.
+
+    Las peticiones con la misma clave que llegan mientras otra está en curso
+    comparten su resultado sin consumir cupo. El resto espera turno (concurrencia
+    y token bucket) hasta `queue_timeout`; si la cola ya tiene `max_queue`
+    peticiones se rechaza de inmediato, en lugar de acumular latencia.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        rate: float = LLM_RATE_LIMIT_RPS,
+        burst: int = LLM_RATE_BURST,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_queue: int = LLM_MAX_QUEUE
+    ):
+        # Sin backend explícito se usa el configurado en cada llamada (ver set_llm_backend)
+        self._backend = backend
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._bucket = TokenBucket(rate, burst)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._flights = SingleFlight()
+
+        self.waiting = 0
+        self.active = 0
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+
+    @property
+    def backend(self):
+        return self._backend or get_llm_backend()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _admit(self):
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            await self._bucket.acquire()
+        except BaseException:
+            semaphore.release()
+            raise
+
+    async def _dispatch(self, call: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloadedError(f"Cola del LLM llena ({self.waiting} en espera)")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._admit(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise LLMOverloadedError(f"Sin turno para el LLM tras {self.queue_timeout}s en cola")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.calls += 1
+        try:
+            return await call(self.backend)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active -= 1
+            self._get_semaphore().release()
+
+    async def analyze(self, key: str, recipe: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analizar la receta; `key` identifica su contenido (recipe_hash)
+        """
+        return await self._flights.do(key, lambda: self._dispatch(lambda backend: backend.analyze(recipe)))
+
+    async def explain_substitutions(
+        self,
+        key: str,
+        recipe: Dict[str, Any],
+        substitutions: List[Dict[str, Any]]
+    ) -> str:
+        """
+        Explicación en lenguaje natural de un conjunto de sustituciones
+        """
+        return await self._flights.do(
+            ("explain", key),
+            lambda: self._dispatch(lambda backend: backend.explain_substitutions(recipe, substitutions))
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": self.waiting,
+            "active": self.active,
+            "calls": self.calls,
+            "coalesced": self._flights.shared,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "queue_timeouts": self.queue_timeouts,
+            "tokens_available": round(self._bucket.available(), 2)
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_dispatcher: Optional[LLMDispatcher] = None
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """
+    Obtener el despachador compartido (se crea en el primer uso)
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = LLMDispatcher()
+    return _dispatcher
@@ -5,20 +5,44 @@ Separado de CalorieSnap para mayor estabilidad
 """
 
 import os
+import json
+import math
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Request
+from typing import List, Optional
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import uvicorn
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 
 # Importar nuestros endpoints
-from stripe_endpoints import router as stripe_router
+from stripe_endpoints import router as stripe_router, process_webhook_event, require_subscription
 from integration_helper import (
     initialize_stripe_integration,
     health_check_enhanced,
     validate_required_env_vars
 )
+from stripe_gateway import shutdown_stripe_gateway
+from supabase_repository import close_repository
+from webhook_queue import start_webhook_workers, stop_webhook_workers
+from usage_writer import start_usage_writer, stop_usage_writer, get_usage_writer
+from plan_catalog import start_plan_catalog, stop_plan_catalog, get_plan_catalog
+from entitlements import start_entitlements, stop_entitlements, get_entitlements
+from health_monitor import start_health_monitor, stop_health_monitor, get_health_monitor
+from resilience import CircuitOpenError, DependencyTimeoutError, resilience_stats
+from idempotency import close_idempotency_store, get_idempotency_store
+from webhook_queue import get_webhook_stats
+from webhook_dedup import webhook_deduplicator
+from stripe_customers import customer_resolver
+from user_cache import user_profile_cache
+from metrics import MetricsMiddleware, registry as metrics_registry
+from recipe_analysis import normalize_recipe, recipe_hash, get_recipe_analyzer
+from recipe_tuner import get_recipe_tuner, TuningError, TUNER_TOP_K, TUNER_MAX_SUBSTITUTIONS
+from llm_backends import close_llm_backend, LLMError
+from llm_dispatcher import get_llm_dispatcher, LLMOverloadedError
+from nutrition_engine import get_nutrition_engine
 
 # Configurar logging
 logging.basicConfig(
@@ -27,30 +51,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RecipeTunerAPI")
 
-# Crear aplicación FastAPI
-app = FastAPI(
-    title="RecipeTuner API",
-    description="API independiente para RecipeTuner - Análisis y gestión de recetas con IA",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# Configurar CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://localhost:8081",
-        "https://recipetuner.com",
-        "https://www.recipetuner.com",
-        "exp://localhost:19000",
-        "exp://192.168.*:19000"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Rutas propias de RecipeTuner (la aplicación se arma en create_app)
+router = APIRouter()
 
 # Variables de entorno requeridas para RecipeTuner
 REQUIRED_ENV_VARS = [
@@ -61,7 +63,10 @@ REQUIRED_ENV_VARS = [
     "SUPABASE_ANON_KEY"
 ]
 
-@app.on_event("startup")
+# Espera máxima por la primera carga del catálogo y de los entitlements al
+# arrancar; si Supabase tarda más, siguen cargando en segundo plano
+STARTUP_LOAD_TIMEOUT = float(os.getenv("STARTUP_LOAD_TIMEOUT", 0.5))
+
 async def startup_event():
     """Inicializar aplicación al arrancar"""
     logger.info("🚀 Iniciando RecipeTuner API Server...")
@@ -80,9 +85,50 @@ async def startup_event():
         logger.error(f"❌ Error inicializando Stripe: {e}")
         raise
 
+    # Tabla nutricional y grafo de sustituciones en memoria (una sola carga por proceso)
+    get_nutrition_engine()
+    get_recipe_tuner()
+
+    # Catálogo de planes y entitlements por usuario en memoria: primera carga en
+    # paralelo y acotada por STARTUP_LOAD_TIMEOUT, refresco en segundo plano
+    await asyncio.gather(
+        start_plan_catalog(timeout=STARTUP_LOAD_TIMEOUT),
+        start_entitlements(timeout=STARTUP_LOAD_TIMEOUT)
+    )
+
+    # Workers que procesan los webhooks encolados
+    start_webhook_workers(process_webhook_event)
+
+    # Escritor por lotes de analytics de uso
+    start_usage_writer()
+
+    # Sondeo periódico de Supabase, Stripe y LLM para /health
+    start_health_monitor()
+
     logger.info("✅ RecipeTuner API Server iniciado correctamente")
 
-@app.get("/")
+async def shutdown_event():
+    """Liberar recursos al apagar la aplicación"""
+    await stop_health_monitor()
+    await stop_webhook_workers()
+    await stop_usage_writer()
+    await stop_entitlements()
+    await stop_plan_catalog()
+    close_idempotency_store()
+    await close_llm_backend()
+    shutdown_stripe_gateway()
+    await close_repository()
+    logger.info("👋 RecipeTuner API Server detenido")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_event()
+    try:
+        yield
+    finally:
+        await shutdown_event()
+
+@router.get("/")
 async def root():
     """Endpoint raíz"""
     return {
@@ -93,13 +139,13 @@ async def root():
         "docs": "/docs"
     }
 
-@app.get("/health")
+@router.get("/health")
 async def health_check():
-    """Health check mejorado"""
+    """Health check con el estado de Stripe, Supabase y LLM del último sondeo (sin I/O)"""
     try:
-        health_data = health_check_enhanced()
+        health_data = {**health_check_enhanced(), **get_health_monitor().report()}
         return JSONResponse(
-            status_code=200 if health_data["status"] == "healthy" else 503,
+            status_code=503 if health_data["status"] == "unhealthy" else 200,
             content=health_data
         )
     except Exception as e:
@@ -113,10 +159,59 @@ async def health_check():
             }
         )
 
-# Incluir routers
-app.include_router(stripe_router, prefix="/api", tags=["Stripe Subscriptions"])
+@router.get("/health/live", include_in_schema=False)
+async def liveness():
+    """Liveness: el proceso y su event loop responden"""
+    return {"status": "alive", "uptime_seconds": round(get_health_monitor().uptime(), 1)}
+
+@router.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """Readiness: arranque completo y dependencias críticas disponibles (último sondeo)"""
+    monitor = get_health_monitor()
+    report = monitor.report()
+    return JSONResponse(
+        status_code=200 if monitor.is_ready() else 503,
+        content={
+            "status": report["status"],
+            "checked_at": report.get("checked_at"),
+            "dependencies": {name: dep["status"] for name, dep in report["dependencies"].items()}
+        }
+    )
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto Prometheus"""
+    return PlainTextResponse(
+        await metrics_registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Dependencia con el circuito abierto: rechazo inmediato y reintento sugerido"""
+    logger.warning(f"🔌 {request.url.path} rechazada: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={
+            "error": "Service unavailable",
+            "message": f"Servicio externo no disponible ({exc.dependency}), intenta de nuevo más tarde",
+            "timestamp": datetime.now().isoformat()
+        },
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+async def dependency_timeout_handler(request: Request, exc: DependencyTimeoutError):
+    """Dependencia sin responder a tiempo fuera de los endpoints que lo tratan"""
+    logger.warning(f"⏱️ {request.url.path} sin respuesta: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={
+            "error": "Service unavailable",
+            "message": f"Servicio externo sin respuesta ({exc.dependency}), intenta de nuevo más tarde",
+            "timestamp": datetime.now().isoformat()
+        },
+        headers={"Retry-After": "1"}
+    )
 
-@app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Manejador global de excepciones"""
     logger.error(f"❌ Error no manejado: {exc}")
@@ -130,18 +225,243 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 # Endpoints específicos de RecipeTuner
-@app.get("/api/recipes/analyze")
-async def analyze_recipe():
-    """Analizar receta con IA (placeholder)"""
-    return {"message": "Endpoint de análisis de recetas - Por implementar"}
+class AnalyzeRecipeRequest(BaseModel):
+    text: Optional[str] = None
+    title: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    instructions: Optional[List[str]] = None
+    servings: Optional[int] = None
+
+def _sse(event: Optional[str], data: Optional[dict]) -> str:
+    """Formatear un server-sent event (sin evento: comentario keep-alive)"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/api/recipes/analyze")
+async def analyze_recipe(request: AnalyzeRecipeRequest, http_request: Request, stream: bool = False):
+    """
+    Analizar receta con IA (texto libre o JSON estructurado).
+
+    Con ?stream=true (o Accept: text/event-stream) responde server-sent events:
+    ingredients y nutrition de inmediato, analysis cuando responde el modelo y done.
+    """
+    recipe = normalize_recipe(
+        text=request.text,
+        title=request.title,
+        ingredients=request.ingredients,
+        instructions=request.instructions,
+        servings=request.servings
+    )
+    if not recipe["ingredients"]:
+        raise HTTPException(status_code=400, detail="La receta no contiene ingredientes")
+
+    if stream or "text/event-stream" in http_request.headers.get("accept", ""):
+        async def events():
+            try:
+                async for event, data in get_recipe_analyzer().stream(recipe):
+                    yield _sse(event, data)
+            except LLMError as e:
+                logger.error(f"❌ Error del modelo analizando receta: {e}")
+                yield _sse("error", {"detail": "Error consultando el modelo de IA"})
+            except Exception as e:
+                # Los headers ya se enviaron: el error solo puede viajar como evento
+                logger.error(f"❌ Error en análisis en streaming: {e}")
+                yield _sse("error", {"detail": "Ha ocurrido un error interno del servidor"})
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
-@app.get("/api/nutrition/calculate")
-async def calculate_nutrition():
-    """Calcular información nutricional (placeholder)"""
-    return {"message": "Endpoint de cálculo nutricional - Por implementar"}
+    try:
+        return await get_recipe_analyzer().analyze(recipe)
+    except LLMOverloadedError as e:
+        logger.warning(f"⚠️ Análisis rechazado por saturación del LLM: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de IA saturado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "5"}
+        )
+    except LLMError as e:
+        logger.error(f"❌ Error del modelo analizando receta: {e}")
+        raise HTTPException(status_code=502, detail="Error consultando el modelo de IA")
+
+class TuneRecipeRequest(AnalyzeRecipeRequest):
+    targets: List[str] = ["lower_calories"]
+    top_k: int = TUNER_TOP_K
+    max_substitutions: int = TUNER_MAX_SUBSTITUTIONS
+    explain: bool = False
+
+# Exigir suscripción activa para el ajuste de recetas
+TUNING_REQUIRES_SUBSCRIPTION = os.getenv("TUNING_REQUIRES_SUBSCRIPTION", "false").lower() == "true"
+
+@router.post(
+    "/api/recipes/tune",
+    dependencies=[Depends(require_subscription)] if TUNING_REQUIRES_SUBSCRIPTION else []
+)
+async def tune_recipe(request: TuneRecipeRequest):
+    """
+    Proponer versiones de la receta con sustituciones de ingredientes para un
+    objetivo nutricional (lower_calories, lower_sodium, more_protein, ...)
+    """
+    recipe = normalize_recipe(
+        text=request.text,
+        title=request.title,
+        ingredients=request.ingredients,
+        instructions=request.instructions,
+        servings=request.servings
+    )
+    if not recipe["ingredients"]:
+        raise HTTPException(status_code=400, detail="La receta no contiene ingredientes")
+    if not 1 <= request.top_k <= 10 or not 1 <= request.max_substitutions <= 6:
+        raise HTTPException(status_code=400, detail="top_k debe estar entre 1 y 10 y max_substitutions entre 1 y 6")
+
+    tuner = get_recipe_tuner()
+    try:
+        result = tuner.tune(
+            recipe["ingredients"],
+            recipe["servings"],
+            targets=request.targets,
+            top_k=request.top_k,
+            max_substitutions=request.max_substitutions
+        )
+    except TuningError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if request.explain and result["alternatives"]:
+        key = f"{recipe_hash(recipe)}:{','.join(request.targets)}"
+        result = await tuner.explain(recipe, key, result)
+    return result
+
+class NutritionRequest(BaseModel):
+    text: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    servings: Optional[int] = None
+
+@router.post("/api/nutrition/calculate")
+async def calculate_nutrition(request: NutritionRequest):
+    """Calcular información nutricional (totales y por porción)"""
+    recipe = normalize_recipe(text=request.text, ingredients=request.ingredients, servings=request.servings)
+    if not recipe["ingredients"]:
+        raise HTTPException(status_code=400, detail="La receta no contiene ingredientes")
+
+    return get_nutrition_engine().compute(recipe["ingredients"], recipe["servings"])
+
+# Máximo de recetas por request del endpoint por lotes
+NUTRITION_BATCH_MAX_RECIPES = int(os.getenv("NUTRITION_BATCH_MAX_RECIPES", 500))
+
+class NutritionBatchItem(NutritionRequest):
+    id: Optional[str] = None
+
+class NutritionBatchRequest(BaseModel):
+    recipes: List[NutritionBatchItem]
+
+@router.post("/api/nutrition/calculate/batch")
+async def calculate_nutrition_batch(request: NutritionBatchRequest):
+    """
+    Calcular la información nutricional de varias recetas (p. ej. un plan semanal)
+    en una sola pasada; responde NDJSON, una línea por receta en el orden recibido
+    """
+    if not request.recipes:
+        raise HTTPException(status_code=400, detail="El lote no contiene recetas")
+    if len(request.recipes) > NUTRITION_BATCH_MAX_RECIPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {NUTRITION_BATCH_MAX_RECIPES} recetas por lote"
+        )
+
+    recipes = [
+        normalize_recipe(text=item.text, ingredients=item.ingredients, servings=item.servings)
+        for item in request.recipes
+    ]
+    # Un solo producto de matrices para todo el lote, fuera del event loop
+    results = await asyncio.to_thread(
+        get_nutrition_engine().compute_many,
+        [(recipe["ingredients"], recipe["servings"]) for recipe in recipes]
+    )
+
+    def stream():
+        for index, (item, result) in enumerate(zip(request.recipes, results)):
+            yield json.dumps({"index": index, "id": item.id, **result}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# ================== APLICACIÓN ==================
+
+def register_collectors():
+    """
+    Estadísticas internas publicadas en /metrics (se evalúan solo al hacer scrape)
+    """
+    metrics_registry.register_collector("recipetuner_webhook_queue", get_webhook_stats)
+    metrics_registry.register_collector("recipetuner_webhook_dedup", webhook_deduplicator.stats)
+    metrics_registry.register_collector("recipetuner_api_usage_writer", lambda: get_usage_writer().stats())
+    metrics_registry.register_collector("recipetuner_plan_catalog", lambda: get_plan_catalog().stats())
+    metrics_registry.register_collector("recipetuner_entitlements", lambda: get_entitlements().stats())
+    metrics_registry.register_collector("recipetuner_user_cache", user_profile_cache.stats)
+    metrics_registry.register_collector("recipetuner_stripe_customers", customer_resolver.stats)
+    metrics_registry.register_collector("recipetuner_recipe_analysis", lambda: get_recipe_analyzer().stats())
+    metrics_registry.register_collector("recipetuner_llm_dispatcher", lambda: get_llm_dispatcher().stats())
+    metrics_registry.register_collector("recipetuner_recipe_tuner", lambda: get_recipe_tuner().stats())
+    metrics_registry.register_collector("recipetuner_nutrition", lambda: get_nutrition_engine().stats())
+    metrics_registry.register_collector("recipetuner_health", lambda: get_health_monitor().stats())
+    metrics_registry.register_collector("recipetuner_resilience", resilience_stats)
+    metrics_registry.register_collector("recipetuner_idempotency", lambda: get_idempotency_store().stats())
+
+def create_app() -> FastAPI:
+    """
+    Construir la aplicación FastAPI.
+
+    No abre conexiones ni lee datos: los clientes de Stripe, Supabase y OpenAI
+    se crean en su primer uso y las cargas y tareas de fondo arrancan en el
+    lifespan, así que el proceso acepta tráfico en cuanto termina de importar.
+    """
+    app = FastAPI(
+        title="RecipeTuner API",
+        description="API independiente para RecipeTuner - Análisis y gestión de recetas con IA",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        lifespan=lifespan
+    )
+
+    # Configurar CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:3000",
+            "http://localhost:8081",
+            "https://recipetuner.com",
+            "https://www.recipetuner.com",
+            "exp://localhost:19000",
+            "exp://192.168.*:19000"
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Instrumentación (latencia por ruta, requests en curso, códigos de estado)
+    app.add_middleware(MetricsMiddleware)
+
+    app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+    app.add_exception_handler(DependencyTimeoutError, dependency_timeout_handler)
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    # Incluir routers
+    app.include_router(router)
+    app.include_router(stripe_router, prefix="/api", tags=["Stripe Subscriptions"])
+
+    register_collectors()
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
-    # Configuración para desarrollo local
+    import uvicorn
+
+    # Configuración para desarrollo local (en producción: python serve.py)
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
         "main:app",
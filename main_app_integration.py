@@ -6,6 +6,8 @@ Archivo para integrar los nuevos endpoints Stripe con tu aplicación FastAPI exi
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 import logging
 
@@ -51,7 +53,7 @@ async def get_current_user_enhanced(request: Request):
 
     token = auth_header.replace("Bearer ", "")
 
-    # Validar token con Supabase
+    # Validar JWT de Supabase (verificación local + perfil cacheado)
     user_data = await validate_supabase_token(token)
     if not user_data:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
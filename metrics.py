@@ -0,0 +1,294 @@
+"""
+Métricas de RecipeTuner API en formato Prometheus
+Latencia por ruta, requests en curso, códigos de estado y tiempos de llamadas a
+dependencias externas (Stripe, Supabase), expuestos en /metrics
+"""
+
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ================== TIPOS DE MÉTRICAS ==================
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+            for values, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float):
+        self._values[label_values] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [conteos por bucket (no acumulados) + overflow, suma, total]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, *label_values: str, value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+Metric = Union[Counter, Gauge, Histogram]
+Collector = Callable[[], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+
+
+# ================== REGISTRO ==================
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso.
+
+    Además de las métricas propias acepta "collectors": funciones que devuelven un
+    dict de estadísticas (p. ej. stats() de una caché o de la cola de webhooks) y que
+    solo se evalúan al hacer scrape, sin costo por request.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Collector] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def register_collector(self, prefix: str, collector: Collector):
+        self._collectors[prefix] = collector
+
+    async def _collect(self) -> List[str]:
+        lines = []
+        for prefix, collector in self._collectors.items():
+            try:
+                stats = collector()
+                if asyncio.iscoroutine(stats):
+                    stats = await stats
+            except Exception as e:
+                logger.error(f"❌ Error en collector de métricas {prefix}: {e}")
+                continue
+            for name, value in _flatten(prefix, stats):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return lines
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        lines.extend(await self._collect())
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix: str, stats: Dict[str, Any]) -> Iterator[Tuple[str, float]]:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+registry = MetricsRegistry()
+
+# ================== MÉTRICAS HTTP ==================
+
+http_requests_total = registry.counter(
+    "recipetuner_http_requests_total",
+    "Requests HTTP atendidas",
+    ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "recipetuner_http_request_duration_seconds",
+    "Latencia de requests HTTP por ruta",
+    ("method", "route")
+)
+http_requests_in_flight = registry.gauge(
+    "recipetuner_http_requests_in_flight",
+    "Requests HTTP en curso"
+)
+
+# ================== MÉTRICAS DE DEPENDENCIAS ==================
+
+dependency_duration = registry.histogram(
+    "recipetuner_dependency_duration_seconds",
+    "Latencia de llamadas a servicios externos",
+    ("dependency", "operation", "outcome")
+)
+
+
+@contextmanager
+def track_dependency(dependency: str, operation: str):
+    """
+    Medir una llamada a un servicio externo:
+
+        with track_dependency("stripe", "subscription.create"):
+            ...
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        dependency_duration.observe(dependency, operation, outcome, value=time.perf_counter() - start)
+
+
+def _full_route_path(path: str, route: Any) -> str:
+    """
+    Plantilla completa de una ruta, incluyendo el prefijo de include_router.
+
+    Algunas versiones de FastAPI dejan en scope["route"] la ruta original del
+    APIRouter (sin prefijo): el prefijo se deduce buscando el sufijo de la URL
+    que coincide con la expresión de la ruta.
+    """
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    regex = getattr(route, "path_regex", None)
+    if template is None:
+        return "unmatched"
+    if regex is None:
+        return template
+
+    for i, char in enumerate(path):
+        if char == "/" and regex.match(path[i:]):
+            return path[:i] + template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI de instrumentación.
+
+    Etiqueta por plantilla de ruta (p. ej. /api/recipes/{id}) en lugar de la URL
+    completa, para acotar la cardinalidad; la etiqueta se calcula una sola vez
+    por ruta y se reutiliza.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_labels: Dict[int, str] = {}
+
+    def _route_label(self, scope) -> str:
+        route = scope.get("route")
+        if route is None:
+            return "unmatched"
+        label = self._route_labels.get(id(route))
+        if label is None:
+            label = self._route_labels[id(route)] = _full_route_path(scope["path"], route)
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route_path = self._route_label(scope)
+            method = scope["method"]
+            http_request_duration.observe(method, route_path, value=duration)
+            http_requests_total.inc(method, route_path, str(status_code))
@@ -0,0 +1,231 @@
+"""
+Motor de cálculo nutricional
+La tabla de composición de alimentos se carga una sola vez en una matriz NumPy
+(nutrientes × alimentos, valores por gramo); una receta se convierte en un vector
+disperso de gramos y sus totales salen de un único producto matriz-vector
+"""
+
+import os
+import csv
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from quantity_parser import parse_ingredient, to_grams
+from ingredient_resolver import IngredientResolver
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+NUTRITION_TABLE_PATH = os.getenv(
+    "NUTRITION_TABLE_PATH",
+    str(Path(__file__).resolve().parent / "data" / "food_composition.csv")
+)
+# Líneas de ingrediente ya resueltas (parseo + búsqueda) que se recuerdan
+NUTRITION_LINE_CACHE_SIZE = int(os.getenv("NUTRITION_LINE_CACHE_SIZE", 20_000))
+
+# Columnas de nutrientes de la tabla (valores por 100 g)
+NUTRIENTS = ("kcal", "protein_g", "fat_g", "carbs_g", "fiber_g", "sugar_g", "sodium_mg")
+
+
+class NutritionEngine:
+    """
+    Tabla de composición en forma matricial.
+
+    La matriz se guarda en orden Fortran para que cada alimento (columna) quede
+    contiguo en memoria: tomar las columnas de una receta es una copia barata.
+    """
+
+    def __init__(
+        self,
+        foods: Sequence[str],
+        matrix: np.ndarray,
+        densities: np.ndarray,
+        unit_weights: np.ndarray,
+        aliases: Optional[Dict[str, int]] = None
+    ):
+        if matrix.shape != (len(NUTRIENTS), len(foods)):
+            raise ValueError(f"Matriz con forma {matrix.shape}, se esperaba {(len(NUTRIENTS), len(foods))}")
+
+        self.foods = list(foods)
+        self.matrix = np.asfortranarray(matrix, dtype=np.float64)
+        self.densities = np.asarray(densities, dtype=np.float64)
+        self.unit_weights = np.asarray(unit_weights, dtype=np.float64)
+        # Las mismas tablas como listas de Python (None si falta el dato) para la conversión escalar
+        self._densities = [None if np.isnan(d) else d for d in self.densities.tolist()]
+        self._unit_weights = [None if np.isnan(w) else w for w in self.unit_weights.tolist()]
+
+        # Nombres principales primero: ganan si un alias normaliza a la misma clave
+        self.resolver = IngredientResolver(
+            [(food, i) for i, food in enumerate(self.foods)] + list((aliases or {}).items())
+        )
+
+        # Las mismas líneas se repiten entre recetas ("1 pizca de sal", "2 huevos")
+        self._resolve_line = lru_cache(maxsize=NUTRITION_LINE_CACHE_SIZE)(self._resolve_line_uncached)
+
+    @classmethod
+    def from_csv(cls, path: str = NUTRITION_TABLE_PATH) -> "NutritionEngine":
+        """
+        Cargar la tabla: name, aliases (separados por |), nutrientes por 100 g,
+        density_g_ml y unit_weight_g (opcionales)
+        """
+        foods: List[str] = []
+        columns: List[List[float]] = []
+        densities: List[float] = []
+        unit_weights: List[float] = []
+        aliases: Dict[str, int] = {}
+
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                column = len(foods)
+                foods.append(row["name"])
+                columns.append([float(row[nutrient] or 0) / 100.0 for nutrient in NUTRIENTS])
+                densities.append(float(row.get("density_g_ml") or "nan"))
+                unit_weights.append(float(row.get("unit_weight_g") or "nan"))
+                for alias in (row.get("aliases") or "").split("|"):
+                    if alias.strip():
+                        aliases[alias] = column
+
+        matrix = np.array(columns, dtype=np.float64).T.reshape(len(NUTRIENTS), len(foods))
+        engine = cls(foods, matrix, np.array(densities), np.array(unit_weights), aliases)
+        logger.info(f"🥗 Tabla nutricional cargada: {len(foods)} alimentos, {len(engine.resolver)} nombres")
+        return engine
+
+    # ================== RESOLUCIÓN DE INGREDIENTES ==================
+
+    def lookup(self, name: str) -> Optional[int]:
+        """
+        Columna del alimento que mejor corresponde al nombre (ver IngredientResolver)
+        """
+        match = self.resolver.resolve(name)
+        return match.column if match else None
+
+    def to_grams(self, quantity: Optional[float], unit: Optional[str], column: int) -> Optional[float]:
+        """
+        Convertir cantidad y unidad canónica a gramos del alimento; None si no es posible
+        """
+        return to_grams(quantity, unit, self._densities[column], self._unit_weights[column])
+
+    def _resolve_line_uncached(self, line: str) -> Tuple[Optional[int], Optional[float]]:
+        parsed = parse_ingredient(line)
+        column = self.lookup(parsed["name"]) if parsed["name"] else None
+        if column is None:
+            return None, None
+        return column, self.to_grams(parsed["quantity"], parsed["unit"], column)
+
+    def weight_vector(
+        self,
+        lines: Sequence[str],
+        resolved: Optional[Dict[str, Tuple[Optional[int], Optional[float]]]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        """
+        Vector disperso de la receta: (columnas, gramos) más el detalle por línea.
+        `resolved` comparte las líneas ya resueltas entre varias recetas.
+        """
+        columns: List[int] = []
+        grams: List[float] = []
+        items: List[Dict[str, Any]] = []
+
+        for line in lines:
+            if resolved is None:
+                column, weight = self._resolve_line(line)
+            else:
+                if line not in resolved:
+                    resolved[line] = self._resolve_line(line)
+                column, weight = resolved[line]
+            item = {
+                "raw": line,
+                "food": self.foods[column] if column is not None else None,
+                "grams": None if weight is None else round(weight, 1)
+            }
+            if column is None:
+                item["status"] = "unmatched"
+            elif weight is None:
+                item["status"] = "no_quantity"
+            else:
+                item["status"] = "ok"
+                columns.append(column)
+                grams.append(weight)
+            items.append(item)
+
+        return np.array(columns, dtype=np.intp), np.array(grams, dtype=np.float64), items
+
+    # ================== CÁLCULO ==================
+
+    def _result(
+        self,
+        totals: np.ndarray,
+        servings: Optional[int],
+        items: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        portions = servings if servings and servings > 0 else 1
+        return {
+            "servings": portions,
+            "totals": dict(zip(NUTRIENTS, np.round(totals, 1).tolist())),
+            "per_serving": dict(zip(NUTRIENTS, np.round(totals / portions, 1).tolist())),
+            "ingredients": items,
+            "unmatched": [item["raw"] for item in items if item["status"] != "ok"]
+        }
+
+    def compute(self, lines: Sequence[str], servings: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Totales y valores por porción de una receta (líneas de ingredientes normalizadas)
+        """
+        columns, grams, items = self.weight_vector(lines)
+        totals = self.matrix[:, columns] @ grams
+
+        # Aporte por ingrediente: las mismas columnas escaladas, sin recorrer nutrientes
+        contributions = (self.matrix[:, columns] * grams).T.round(1).tolist()
+        ok_items = (item for item in items if item["status"] == "ok")
+        for item, values in zip(ok_items, contributions):
+            item["nutrients"] = dict(zip(NUTRIENTS, values))
+
+        return self._result(totals, servings, items)
+
+    def compute_many(self, recipes: Sequence[Tuple[Sequence[str], Optional[int]]]) -> List[Dict[str, Any]]:
+        """
+        Varias recetas en una sola pasada: cada línea distinta se resuelve una vez,
+        la matriz de pesos (alimentos × recetas) se restringe a los alimentos
+        usados y los totales salen de un único producto de matrices
+        """
+        resolved: Dict[str, Tuple[Optional[int], Optional[float]]] = {}
+        vectors = [self.weight_vector(lines, resolved) for lines, _ in recipes]
+        if not vectors:
+            return []
+
+        all_columns = np.concatenate([columns for columns, _, _ in vectors])
+        used, positions = np.unique(all_columns, return_inverse=True)
+        recipe_ids = np.repeat(np.arange(len(vectors)), [len(columns) for columns, _, _ in vectors])
+
+        weights = np.zeros((len(used), len(vectors)))
+        np.add.at(weights, (positions, recipe_ids), np.concatenate([grams for _, grams, _ in vectors]))
+        totals = self.matrix[:, used] @ weights
+
+        return [
+            self._result(totals[:, i], servings, items)
+            for i, ((_, servings), (_, _, items)) in enumerate(zip(recipes, vectors))
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self._resolve_line.cache_info()
+        return {
+            "foods": len(self.foods),
+            "resolver": self.resolver.stats(),
+            "line_cache": {"size": cache.currsize, "hits": cache.hits, "misses": cache.misses}
+        }
+
+
+_engine: Optional[NutritionEngine] = None
+
+def get_nutrition_engine() -> NutritionEngine:
+    """
+    Obtener el motor compartido (la tabla se carga en el primer uso)
+    """
+    global _engine
+    if _engine is None:
+        _engine = NutritionEngine.from_csv()
+    return _engine
@@ -0,0 +1,203 @@
+"""
+Catálogo de planes y precios de Stripe
+Los planes de recipetuner_subscription_plans se cargan al arrancar en un mapa
+inmutable en memoria; las consultas no hacen I/O. Se recarga en segundo plano
+por intervalo o cuando llegan webhooks price.* / product.*
+"""
+
+import os
+import time
+import asyncio
+import logging
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from supabase_repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+PLAN_CATALOG_REFRESH_INTERVAL = float(os.getenv("PLAN_CATALOG_REFRESH_INTERVAL", 300))
+PLANS_TABLE = "recipetuner_subscription_plans"
+
+FREQUENCIES = ("monthly", "yearly")
+
+
+def _fallback_plans() -> Dict[str, Dict[str, Any]]:
+    """
+    Planes por defecto (variables PRICE_*) para cuando la tabla no responde o
+    no define el plan
+    """
+    return {
+        "premium_mexico": {
+            "id": "premium_mexico",
+            "stripe_price_id_monthly": os.getenv("PRICE_MEXICO_MONTHLY", "price_mexico_monthly_89mxn"),
+            "stripe_price_id_yearly": os.getenv("PRICE_MEXICO_YEARLY", "price_mexico_yearly_699mxn")
+        },
+        "premium_usa": {
+            "id": "premium_usa",
+            "stripe_price_id_monthly": os.getenv("PRICE_USA_MONTHLY", "price_usa_monthly_499usd"),
+            "stripe_price_id_yearly": os.getenv("PRICE_USA_YEARLY", "price_usa_yearly_3999usd")
+        }
+    }
+
+
+class CatalogSnapshot:
+    """
+    Vista inmutable del catálogo. Una recarga construye un snapshot nuevo y lo
+    publica reemplazando la referencia, así que un lector nunca ve un estado a medias.
+    """
+
+    def __init__(self, plans: Dict[str, Dict[str, Any]], source: str):
+        self.plans: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+            {plan_id: MappingProxyType(dict(plan)) for plan_id, plan in plans.items()}
+        )
+        # price_id -> (plan_id, frecuencia), para resolver eventos de Stripe
+        self.by_price: Mapping[str, tuple] = MappingProxyType({
+            plan[f"stripe_price_id_{frequency}"]: (plan_id, frequency)
+            for plan_id, plan in plans.items()
+            for frequency in FREQUENCIES
+            if plan.get(f"stripe_price_id_{frequency}")
+        })
+        self.source = source
+        self.loaded_at = time.time()
+
+
+class PlanCatalog:
+    """
+    Catálogo en memoria con recarga en segundo plano
+    """
+
+    def __init__(self, refresh_interval: float = PLAN_CATALOG_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._snapshot = CatalogSnapshot(_fallback_plans(), source="fallback")
+        self._refresh_requested = asyncio.Event()
+        self._first_load = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.loads = 0
+        self.failed_loads = 0
+
+    # ================== CONSULTAS (SIN I/O) ==================
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    def get_plan(self, plan_id: str) -> Optional[Mapping[str, Any]]:
+        return self._snapshot.plans.get(plan_id)
+
+    def get_price_id(self, plan_id: str, frequency: str) -> Optional[str]:
+        plan = self._snapshot.plans.get(plan_id)
+        return plan.get(f"stripe_price_id_{frequency}") if plan else None
+
+    def price_ids(self, plan_id: str) -> Optional[Dict[str, Optional[str]]]:
+        plan = self._snapshot.plans.get(plan_id)
+        if plan is None:
+            return None
+        return {frequency: plan.get(f"stripe_price_id_{frequency}") for frequency in FREQUENCIES}
+
+    def plan_for_price(self, price_id: str) -> Optional[tuple]:
+        return self._snapshot.by_price.get(price_id)
+
+    # ================== CARGA ==================
+
+    async def load(self) -> bool:
+        """
+        Recargar desde Supabase; si falla se conserva el snapshot actual
+        """
+        try:
+            rows = await get_repository().select(PLANS_TABLE)
+        except Exception as e:
+            self.failed_loads += 1
+            logger.error(f"❌ Error cargando catálogo de planes (se mantiene {self._snapshot.source}): {e}")
+            return False
+
+        plans = _fallback_plans()
+        for row in rows:
+            if row.get("is_active") is False:
+                plans.pop(row["id"], None)
+                continue
+            plans[row["id"]] = row
+
+        self._snapshot = CatalogSnapshot(plans, source="supabase")
+        self.loads += 1
+        logger.info(f"📋 Catálogo de planes cargado: {len(plans)} planes")
+        return True
+
+    def request_refresh(self):
+        """
+        Pedir una recarga (p. ej. por un webhook price.* / product.*); varias
+        peticiones seguidas se atienden con una sola carga
+        """
+        self._refresh_requested.set()
+
+    async def _run(self):
+        # Un snapshot ya cargado (precarga en el master antes del fork) no se repite
+        if self._snapshot.source != "supabase":
+            await self.load()
+        self._first_load.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh_requested.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_requested.clear()
+            await self.load()
+
+    async def start(self, timeout: Optional[float] = None):
+        """
+        Arrancar la carga inicial y el refresco periódico. Espera la primera
+        carga como máximo `timeout` segundos (None: sin límite); mientras tanto
+        se sirven los planes por defecto.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="plan-catalog-refresh")
+        try:
+            await asyncio.wait_for(self._first_load.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Catálogo de planes sin cargar tras {timeout}s: sigue en segundo plano")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "plans": len(snapshot.plans),
+            "prices": len(snapshot.by_price),
+            "from_supabase": snapshot.source == "supabase",
+            "age_seconds": round(time.time() - snapshot.loaded_at, 1),
+            "loads": self.loads,
+            "failed_loads": self.failed_loads
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_catalog: Optional[PlanCatalog] = None
+
+def get_plan_catalog() -> PlanCatalog:
+    """
+    Obtener el catálogo compartido (se crea en el primer uso)
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = PlanCatalog()
+    return _catalog
+
+async def start_plan_catalog(timeout: Optional[float] = None):
+    await get_plan_catalog().start(timeout)
+
+async def stop_plan_catalog():
+    global _catalog
+    if _catalog is not None:
+        await _catalog.stop()
+        _catalog = None
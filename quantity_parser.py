@@ -0,0 +1,135 @@
+"""
+Parser de cantidades y unidades de ingredientes
+Los alias de unidades (español e inglés) se compilan al importar en un dict
+alias -> (unidad, tipo, factor) y en una única expresión regular que separa
+cantidad, rango, unidad y nombre en una sola pasada por línea
+"""
+
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# ================== TABLAS DE UNIDADES ==================
+
+# unidad canónica -> (tipo, factor a gramos o mililitros, alias)
+UNIT_DEFINITIONS = {
+    "g": ("mass", 1.0, ("g", "gr", "grs", "gramo", "gramos", "gram", "grams")),
+    "kg": ("mass", 1000.0, ("kg", "kilo", "kilos", "kilogramo", "kilogramos", "kilogram", "kilograms")),
+    "mg": ("mass", 0.001, ("mg", "miligramo", "miligramos", "milligram", "milligrams")),
+    "oz": ("mass", 28.35, ("oz", "onza", "onzas", "ounce", "ounces")),
+    "lb": ("mass", 453.6, ("lb", "lbs", "libra", "libras", "pound", "pounds")),
+    "ml": ("volume", 1.0, ("ml", "mililitro", "mililitros", "milliliter", "milliliters", "millilitre", "millilitres")),
+    "l": ("volume", 1000.0, ("l", "lt", "lts", "litro", "litros", "liter", "liters", "litre", "litres")),
+    "cup": ("volume", 240.0, ("taza", "tazas", "cup", "cups")),
+    "tbsp": ("volume", 15.0, ("cda", "cdas", "cucharada", "cucharadas", "tbsp", "tbs", "tablespoon", "tablespoons")),
+    "tsp": ("volume", 5.0, ("cdita", "cditas", "cucharadita", "cucharaditas", "tsp", "teaspoon", "teaspoons")),
+    "pinch": ("pinch", 0.4, ("pizca", "pizcas", "pinch", "pinches")),
+    "piece": ("count", 1.0, (
+        "pieza", "piezas", "pza", "pzas", "unidad", "unidades", "diente", "dientes",
+        "clove", "cloves", "rebanada", "rebanadas", "slice", "slices"
+    ))
+}
+
+# alias -> (unidad canónica, tipo, factor)
+UNIT_ALIASES: Dict[str, Tuple[str, str, float]] = {
+    alias: (unit, kind, factor)
+    for unit, (kind, factor, aliases) in UNIT_DEFINITIONS.items()
+    for alias in aliases
+}
+
+UNICODE_FRACTIONS = {
+    "½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75,
+    "⅕": 0.2, "⅖": 0.4, "⅗": 0.6, "⅘": 0.8, "⅙": 1 / 6, "⅚": 5 / 6,
+    "⅛": 0.125, "⅜": 0.375, "⅝": 0.625, "⅞": 0.875
+}
+
+# ================== EXPRESIÓN REGULAR ==================
+
+_FRACTION_CHARS = "".join(UNICODE_FRACTIONS)
+_NUMBER = (
+    rf"\d+\s+\d+/\d+"              # 1 1/2
+    rf"|\d+/\d+"                   # 3/4
+    rf"|\d+\s*[{_FRACTION_CHARS}]"  # 1½, 1 ½
+    rf"|\d+(?:[.,]\d+)?"           # 2, 1.5, 1,5
+    rf"|[{_FRACTION_CHARS}]"       # ½
+)
+# Alias más largos primero para que "cucharadita" no se quede en "cucharada"
+_UNIT_PATTERN = "|".join(re.escape(alias) for alias in sorted(UNIT_ALIASES, key=len, reverse=True))
+
+_LINE_RE = re.compile(
+    rf"^\s*(?:(?P<quantity>{_NUMBER})"
+    rf"(?:\s*(?:-|–|a|to|o|or)\s*(?P<quantity_max>{_NUMBER}))?)?\s*"
+    rf"(?:(?P<unit>{_UNIT_PATTERN})\.?(?![\wáéíóúñ]))?\s*"
+    rf"(?:(?:de|of)\s+)?(?P<name>.*?)\s*$",
+    re.IGNORECASE
+)
+
+
+def parse_number(value: Optional[str]) -> Optional[float]:
+    """
+    Convertir "1 1/2", "3/4", "1½", "1,5" o "½" a float; None si no es una
+    cantidad válida ("1/0")
+    """
+    if not value:
+        return None
+    total = 0.0
+    for token in value.replace(",", ".").split():
+        if "/" in token:
+            numerator, denominator = token.split("/")
+            if float(denominator) == 0:
+                return None
+            total += float(numerator) / float(denominator)
+        elif token[-1] in UNICODE_FRACTIONS:
+            whole = token[:-1]
+            total += (float(whole) if whole else 0.0) + UNICODE_FRACTIONS[token[-1]]
+        else:
+            total += float(token)
+    return total
+
+
+def parse_ingredient(line: str) -> Dict[str, Any]:
+    """
+    Separar cantidad, unidad y nombre de una línea de ingrediente normalizada.
+
+    Los rangos ("2-3 tazas", "2 a 3 dientes") devuelven el punto medio como
+    cantidad y los extremos en quantity_min/quantity_max.
+    """
+    match = _LINE_RE.match(line)
+    quantity = parse_number(match.group("quantity"))
+    quantity_max = parse_number(match.group("quantity_max"))
+    unit = match.group("unit")
+
+    result = {
+        "raw": line,
+        "quantity": quantity,
+        "unit": UNIT_ALIASES[unit.lower()][0] if unit else None,
+        "name": match.group("name")
+    }
+    if quantity is not None and quantity_max is not None:
+        result["quantity"] = (quantity + quantity_max) / 2
+        result["quantity_min"] = quantity
+        result["quantity_max"] = quantity_max
+    return result
+
+
+def to_grams(
+    quantity: Optional[float],
+    unit: Optional[str],
+    density: Optional[float] = None,
+    unit_weight: Optional[float] = None
+) -> Optional[float]:
+    """
+    Gramos de un ingrediente a partir de la cantidad y la unidad canónica.
+    El volumen requiere la densidad del alimento (g/ml) y las piezas (o la
+    ausencia de unidad, "2 huevos") su peso por unidad; None si falta el dato.
+    """
+    kind, factor = UNIT_DEFINITIONS[unit][:2] if unit else ("count", 1.0)
+
+    if kind == "pinch":
+        return factor * (quantity or 1)
+    if quantity is None:
+        return None
+    if kind == "mass":
+        return quantity * factor
+    if kind == "volume":
+        return quantity * factor * density if density else None
+    return quantity * factor * unit_weight if unit_weight else None
@@ -0,0 +1,276 @@
+"""
+Motor de análisis de recetas
+Normaliza la receta (texto libre o JSON), separa ingredientes y pasos, consulta al
+LLM y cachea el resultado por hash del contenido normalizado
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from llm_dispatcher import get_llm_dispatcher
+from nutrition_engine import get_nutrition_engine
+from quantity_parser import parse_ingredient
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+RECIPE_CACHE_SIZE = int(os.getenv("RECIPE_CACHE_SIZE", 5_000))
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", 7 * 24 * 3600))
+# Directorio opcional para persistir análisis entre reinicios
+RECIPE_CACHE_DIR = os.getenv("RECIPE_CACHE_DIR")
+# Intervalo de comentarios keep-alive mientras se espera al LLM en modo streaming
+RECIPE_STREAM_HEARTBEAT = float(os.getenv("RECIPE_STREAM_HEARTBEAT", 10))
+
+# Versión del formato de análisis: cambiarla invalida la caché existente
+ANALYSIS_VERSION = "2"
+
+# ================== NORMALIZACIÓN ==================
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•·▪◦]+|\d+[.)](?!\d))\s*")
+_NUMBERED_RE = re.compile(r"^\s*\d+[.)](?!\d)")
+_SPACES_RE = re.compile(r"\s+")
+_INGREDIENTS_HEADER_RE = re.compile(r"^(ingredientes|ingredients)\s*:?$")
+_INSTRUCTIONS_HEADER_RE = re.compile(
+    r"^(preparaci[oó]n|modo de preparaci[oó]n|instrucciones|instructions|pasos|"
+    r"procedimiento|elaboraci[oó]n|method|steps|directions)\s*:?$"
+)
+_STARTS_WITH_QUANTITY_RE = re.compile(r"^[\d½¼¾⅓⅔]")
+
+
+def normalize_line(line: str) -> str:
+    """
+    Minúsculas, Unicode NFC, sin viñetas ni numeración y espacios colapsados
+    """
+    line = unicodedata.normalize("NFC", line).strip().lower()
+    line = _BULLET_RE.sub("", line)
+    return _SPACES_RE.sub(" ", line).strip().rstrip(".")
+
+
+def _has_bullet(line: str) -> bool:
+    return bool(_BULLET_RE.match(line)) and not _NUMBERED_RE.match(line)
+
+
+def parse_recipe_text(text: str) -> Dict[str, Any]:
+    """
+    Separar título, ingredientes y pasos de una receta en texto libre
+    """
+    title = None
+    ingredients: List[str] = []
+    instructions: List[str] = []
+    section = None
+
+    for raw_line in text.splitlines():
+        line = normalize_line(raw_line)
+        if not line:
+            continue
+
+        header = line.rstrip(":")
+        if _INGREDIENTS_HEADER_RE.match(header):
+            section = "ingredients"
+            continue
+        if _INSTRUCTIONS_HEADER_RE.match(header):
+            section = "instructions"
+            continue
+
+        if section == "ingredients":
+            ingredients.append(line)
+        elif section == "instructions":
+            instructions.append(line)
+        elif _has_bullet(raw_line) or _STARTS_WITH_QUANTITY_RE.match(line):
+            # Sin encabezados: viñetas y líneas con cantidad son ingredientes
+            ingredients.append(line)
+        elif title is None:
+            title = line
+        else:
+            instructions.append(line)
+
+    return {"title": title, "ingredients": ingredients, "instructions": instructions}
+
+
+def normalize_recipe(
+    text: Optional[str] = None,
+    title: Optional[str] = None,
+    ingredients: Optional[List[str]] = None,
+    instructions: Optional[List[str]] = None,
+    servings: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Forma canónica de una receta, recibida como texto libre o como campos JSON
+    """
+    parsed = parse_recipe_text(text) if text else {"title": None, "ingredients": [], "instructions": []}
+
+    normalized_ingredients = [normalize_line(i) for i in ingredients] if ingredients else parsed["ingredients"]
+    normalized_instructions = [normalize_line(i) for i in instructions] if instructions else parsed["instructions"]
+
+    return {
+        "title": normalize_line(title) if title else parsed["title"],
+        "servings": servings,
+        "ingredients": [i for i in normalized_ingredients if i],
+        "instructions": [i for i in normalized_instructions if i]
+    }
+
+
+def recipe_hash(recipe: Dict[str, Any]) -> str:
+    """
+    Hash del contenido normalizado. El orden de los ingredientes no altera la
+    receta, así que se ordenan; el de los pasos sí, así que se conserva.
+    """
+    canonical = json.dumps(
+        {
+            "v": ANALYSIS_VERSION,
+            "title": recipe.get("title"),
+            "servings": recipe.get("servings"),
+            "ingredients": sorted(recipe.get("ingredients", [])),
+            "instructions": recipe.get("instructions", [])
+        },
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+# ================== CACHÉ ==================
+
+class AnalysisCache:
+    """
+    LRU en memoria con almacenamiento opcional en disco (un JSON por hash)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = RECIPE_CACHE_SIZE,
+        ttl: float = RECIPE_CACHE_TTL,
+        directory: Optional[str] = RECIPE_CACHE_DIR
+    ):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._directory = Path(directory) if directory else None
+        if self._directory:
+            self._directory.mkdir(parents=True, exist_ok=True)
+        self.disk_hits = 0
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory.get(key)
+        if value is None and self._directory:
+            value = await asyncio.to_thread(self._read_disk, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self._memory.set(key, value)
+        if self._directory:
+            try:
+                await asyncio.to_thread(self._write_disk, key, value)
+            except OSError as e:
+                logger.error(f"❌ Error guardando análisis en disco: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._memory.stats(), "disk_hits": self.disk_hits}
+
+# ================== ANALIZADOR ==================
+
+class RecipeAnalyzer:
+    """
+    Pipeline: normalizar -> parsear ingredientes -> LLM, con caché por contenido.
+    Las llamadas al modelo pasan por el despachador (coalescencia y límites).
+    """
+
+    def __init__(self, cache: Optional[AnalysisCache] = None):
+        self.cache = cache or AnalysisCache()
+        self.llm_calls = 0
+
+    async def analyze(self, recipe: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analizar una receta ya normalizada (ver normalize_recipe)
+        """
+        key = recipe_hash(recipe)
+
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        self.llm_calls += 1
+        analysis = await get_llm_dispatcher().analyze(key, recipe)
+
+        result = {
+            "recipe_hash": key,
+            "title": recipe.get("title"),
+            "servings": recipe.get("servings"),
+            "ingredients": [parse_ingredient(line) for line in recipe["ingredients"]],
+            "analysis": analysis
+        }
+        await self.cache.set(key, result)
+        return {**result, "cached": False}
+
+    async def stream(
+        self,
+        recipe: Dict[str, Any],
+        heartbeat: float = RECIPE_STREAM_HEARTBEAT
+    ) -> AsyncIterator[Tuple[Optional[str], Optional[Dict[str, Any]]]]:
+        """
+        Análisis por etapas como pares (evento, datos): "ingredients" y "nutrition"
+        salen de inmediato (no dependen del LLM), "analysis" cuando responde el
+        modelo y "done" al final. Mientras se espera al modelo se emite
+        (None, None) cada `heartbeat` segundos para mantener viva la conexión.
+        """
+        key = recipe_hash(recipe)
+        yield "ingredients", {
+            "recipe_hash": key,
+            "title": recipe.get("title"),
+            "servings": recipe.get("servings"),
+            "ingredients": [parse_ingredient(line) for line in recipe["ingredients"]]
+        }
+        yield "nutrition", get_nutrition_engine().compute(recipe["ingredients"], recipe.get("servings"))
+
+        task = asyncio.ensure_future(self.analyze(recipe))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=heartbeat)
+                if not task.done():
+                    yield None, None
+            result = task.result()
+        finally:
+            # Cliente desconectado: no dejar la llamada al modelo huérfana
+            task.cancel()
+
+        yield "analysis", {"analysis": result["analysis"], "cached": result["cached"]}
+        yield "done", {"recipe_hash": key}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache": self.cache.stats(), "llm_calls": self.llm_calls}
+
+
+_analyzer: Optional[RecipeAnalyzer] = None
+
+def get_recipe_analyzer() -> RecipeAnalyzer:
+    """
+    Obtener el analizador compartido (se crea en el primer uso)
+    """
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = RecipeAnalyzer()
+    return _analyzer
@@ -0,0 +1,326 @@
+"""
+Motor de ajuste de recetas (RecipeTuner)
+Busca, sobre un grafo de sustituciones precalculado y puntuado con la matriz
+nutricional, las mejores versiones de una receta para un objetivo (menos
+calorías, menos sodio, más proteína...). El LLM solo se usa, opcionalmente,
+para redactar la explicación de cada alternativa.
+"""
+
+import os
+import csv
+import heapq
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from llm_backends import LLMError
+from llm_dispatcher import get_llm_dispatcher
+from nutrition_engine import NUTRIENTS, NutritionEngine, get_nutrition_engine
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+SUBSTITUTIONS_PATH = os.getenv(
+    "SUBSTITUTIONS_PATH",
+    str(Path(__file__).resolve().parent / "data" / "substitutions.csv")
+)
+TUNER_TOP_K = int(os.getenv("TUNER_TOP_K", 3))
+TUNER_MAX_SUBSTITUTIONS = int(os.getenv("TUNER_MAX_SUBSTITUTIONS", 3))
+# Límite de nodos explorados por búsqueda (protección ante recetas enormes)
+TUNER_MAX_EXPANSIONS = int(os.getenv("TUNER_MAX_EXPANSIONS", 20_000))
+TUNER_CACHE_SIZE = int(os.getenv("TUNER_CACHE_SIZE", 2_000))
+TUNER_CACHE_TTL = int(os.getenv("TUNER_CACHE_TTL", 3600))
+
+# objetivo -> (nutriente, sentido: 1 = reducir, -1 = aumentar)
+TUNING_TARGETS = {
+    "lower_calories": ("kcal", 1),
+    "lower_sodium": ("sodium_mg", 1),
+    "lower_fat": ("fat_g", 1),
+    "lower_sugar": ("sugar_g", 1),
+    "lower_carbs": ("carbs_g", 1),
+    "more_protein": ("protein_g", -1),
+    "more_fiber": ("fiber_g", -1)
+}
+
+
+class TuningError(ValueError):
+    """Parámetros de ajuste no válidos"""
+
+
+class SubstitutionGraph:
+    """
+    Aristas alimento -> sustituto con una proporción en peso (1 g del original se
+    reemplaza por `ratio` g del sustituto). Una arista hacia el mismo alimento
+    representa reducir la cantidad.
+
+    Al construirse se precalcula, para cada arista, el cambio de nutrientes por
+    gramo del ingrediente original: una sola matriz nutrientes × aristas.
+    """
+
+    def __init__(self, engine: NutritionEngine, edges: Sequence[Tuple[int, int, float, str]]):
+        self.engine = engine
+        self.sources = np.array([edge[0] for edge in edges], dtype=np.intp)
+        self.targets = np.array([edge[1] for edge in edges], dtype=np.intp)
+        self.ratios = np.array([edge[2] for edge in edges], dtype=np.float64)
+        self.notes = [edge[3] for edge in edges]
+
+        matrix = engine.matrix
+        self.delta = matrix[:, self.targets] * self.ratios - matrix[:, self.sources]
+
+        by_source: Dict[int, List[int]] = {}
+        for edge_id, source in enumerate(self.sources.tolist()):
+            by_source.setdefault(source, []).append(edge_id)
+        self.by_source = {source: np.array(ids, dtype=np.intp) for source, ids in by_source.items()}
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    @classmethod
+    def from_csv(cls, engine: NutritionEngine, path: str = SUBSTITUTIONS_PATH) -> "SubstitutionGraph":
+        """
+        Cargar aristas (from, to, ratio, note); los nombres se resuelven contra la tabla nutricional
+        """
+        edges = []
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                source = engine.lookup(row["from"])
+                target = engine.lookup(row["to"])
+                if source is None or target is None:
+                    logger.warning(f"⚠️ Sustitución ignorada, alimento desconocido: {row['from']} -> {row['to']}")
+                    continue
+                edges.append((source, target, float(row["ratio"]), row.get("note") or ""))
+
+        graph = cls(engine, edges)
+        logger.info(f"🔁 Grafo de sustituciones cargado: {len(graph)} aristas")
+        return graph
+
+
+class RecipeTuner:
+    """
+    Búsqueda best-first (A*) de las k mejores combinaciones de sustituciones.
+
+    El efecto de una sustitución es lineal en los gramos, así que la mejora de
+    una combinación es la suma de las mejoras de sus sustituciones: cada nodo
+    guarda su puntuación parcial y un hijo la extiende en O(1). La prioridad
+    suma una cota optimista de lo que aún puede mejorar (las mejores opciones
+    de los ingredientes restantes), de modo que un resultado sale del heap solo
+    cuando nada pendiente puede superarlo.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[NutritionEngine] = None,
+        graph: Optional[SubstitutionGraph] = None,
+        cache_size: int = TUNER_CACHE_SIZE,
+        cache_ttl: float = TUNER_CACHE_TTL
+    ):
+        self.engine = engine or get_nutrition_engine()
+        self.graph = graph or SubstitutionGraph.from_csv(self.engine)
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.searches = 0
+        self.expansions = 0
+
+    def _objective(self, targets: Sequence[str], baseline: np.ndarray) -> np.ndarray:
+        """
+        Pesos por nutriente: cada objetivo cuenta en proporción a su valor base,
+        para que "menos calorías y menos sodio" pese lo mismo en ambos
+        """
+        weights = np.zeros(len(NUTRIENTS))
+        for target in targets:
+            nutrient, sign = TUNING_TARGETS[target]
+            index = NUTRIENTS.index(nutrient)
+            weights[index] += sign / max(abs(baseline[index]), 1.0)
+        return weights
+
+    def _search(
+        self,
+        gains: List[np.ndarray],
+        top_k: int,
+        max_substitutions: int,
+        max_expansions: int
+    ) -> List[Tuple[float, Tuple[Tuple[int, int], ...]]]:
+        """
+        k mejores conjuntos de (posición, opción) con a lo sumo `max_substitutions`
+        elementos. `gains[p]` son las mejoras de las opciones del ingrediente p,
+        de mayor a menor; las posiciones vienen ordenadas por su mejor opción.
+        """
+        best = np.array([g[0] for g in gains])
+        prefix = np.concatenate(([0.0], np.cumsum(best)))
+        n = len(gains)
+
+        def bound(after: int, remaining: int) -> float:
+            start = after + 1
+            return float(prefix[min(start + remaining, n)] - prefix[start])
+
+        heap = [(-bound(-1, max_substitutions), 0, 0.0, (), False)]
+        counter = 1
+        results = []
+        expansions = 0
+
+        while heap and len(results) < top_k and expansions < max_expansions:
+            _, _, gain, state, final = heapq.heappop(heap)
+            if final:
+                results.append((gain, state))
+                continue
+
+            expansions += 1
+            if state:
+                heapq.heappush(heap, (-gain, counter, gain, state, True))
+                counter += 1
+            remaining = max_substitutions - len(state) - 1
+            if remaining < 0:
+                continue
+
+            last = state[-1][0] if state else -1
+            for position in range(last + 1, n):
+                for option, option_gain in enumerate(gains[position].tolist()):
+                    child_gain = gain + option_gain
+                    priority = child_gain + bound(position, remaining)
+                    heapq.heappush(heap, (-priority, counter, child_gain, state + ((position, option),), False))
+                    counter += 1
+
+        self.expansions += expansions
+        return results
+
+    def tune(
+        self,
+        lines: Sequence[str],
+        servings: Optional[int] = None,
+        targets: Sequence[str] = ("lower_calories",),
+        top_k: int = TUNER_TOP_K,
+        max_substitutions: int = TUNER_MAX_SUBSTITUTIONS,
+        max_expansions: int = TUNER_MAX_EXPANSIONS
+    ) -> Dict[str, Any]:
+        """
+        Alternativas de la receta ordenadas por mejora del objetivo
+        """
+        unknown = [target for target in targets if target not in TUNING_TARGETS]
+        if unknown or not targets:
+            raise TuningError(f"Objetivos no válidos: {unknown or targets}. Opciones: {sorted(TUNING_TARGETS)}")
+
+        cache_key = (tuple(lines), servings, tuple(targets), top_k, max_substitutions)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        self.searches += 1
+        engine = self.engine
+        columns, grams, items = engine.weight_vector(lines)
+        ok_items = [item for item in items if item["status"] == "ok"]
+        baseline = engine.matrix[:, columns] @ grams
+        portions = servings if servings and servings > 0 else 1
+
+        # Mejora de cada arista por gramo del original (positiva = mejor)
+        edge_gain = -(self._objective(targets, baseline) @ self.graph.delta)
+
+        # Opciones que mejoran el objetivo, por ingrediente
+        slots = []
+        for index, (column, weight) in enumerate(zip(columns.tolist(), grams.tolist())):
+            edges = self.graph.by_source.get(column)
+            if edges is None:
+                continue
+            gains = edge_gain[edges] * weight
+            improving = gains > 1e-9
+            if improving.any():
+                order = np.argsort(-gains[improving], kind="stable")
+                slots.append((index, edges[improving][order], gains[improving][order]))
+        slots.sort(key=lambda slot: -slot[2][0])
+
+        found = self._search([slot[2] for slot in slots], top_k, max_substitutions, max_expansions)
+
+        alternatives = []
+        for rank, (gain, state) in enumerate(found, 1):
+            chosen = [(slots[position][0], int(slots[position][1][option])) for position, option in state]
+            chosen.sort()
+            totals = baseline + self.graph.delta[:, [edge for _, edge in chosen]] @ grams[[i for i, _ in chosen]]
+
+            substitutions = []
+            replaced = {}
+            for index, edge in chosen:
+                item = ok_items[index]
+                new_grams = float(grams[index] * self.graph.ratios[edge])
+                target_food = engine.foods[self.graph.targets[edge]]
+                replacement = f"{new_grams:.0f} g de {target_food}"
+                replaced[item["raw"]] = replacement
+                substitutions.append({
+                    "original": item["raw"],
+                    "replacement": replacement,
+                    "from": item["food"],
+                    "to": target_food,
+                    "grams_before": round(float(grams[index]), 1),
+                    "grams_after": round(new_grams, 1),
+                    "note": self.graph.notes[edge]
+                })
+
+            alternatives.append({
+                "rank": rank,
+                "improvement": round(gain * 100, 1),
+                "substitutions": substitutions,
+                "ingredients": [replaced.get(line, line) for line in lines],
+                "totals": dict(zip(NUTRIENTS, np.round(totals, 1).tolist())),
+                "per_serving": dict(zip(NUTRIENTS, np.round(totals / portions, 1).tolist())),
+                "explanation": ". ".join(s["note"] for s in substitutions)
+            })
+
+        result = {
+            "targets": list(targets),
+            "servings": portions,
+            "baseline": {
+                "totals": dict(zip(NUTRIENTS, np.round(baseline, 1).tolist())),
+                "per_serving": dict(zip(NUTRIENTS, np.round(baseline / portions, 1).tolist()))
+            },
+            "alternatives": alternatives,
+            "unmatched": [item["raw"] for item in items if item["status"] != "ok"]
+        }
+        self._cache.set(cache_key, result)
+        return result
+
+    async def explain(self, recipe: Dict[str, Any], key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reemplazar las explicaciones basadas en notas por texto del LLM (una
+        llamada por alternativa, en paralelo); si el modelo falla se conservan las notas
+        """
+        dispatcher = get_llm_dispatcher()
+        texts = await asyncio.gather(
+            *[
+                dispatcher.explain_substitutions(f"{key}:{alternative['rank']}", recipe, alternative["substitutions"])
+                for alternative in result["alternatives"]
+            ],
+            return_exceptions=True
+        )
+
+        explained = []
+        for alternative, text in zip(result["alternatives"], texts):
+            if isinstance(text, LLMError):
+                logger.warning(f"⚠️ Explicación del LLM no disponible, se usan las notas: {text}")
+            elif isinstance(text, BaseException):
+                raise text
+            else:
+                alternative = {**alternative, "explanation": text}
+            explained.append(alternative)
+        return {**result, "alternatives": explained}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "edges": len(self.graph),
+            "searches": self.searches,
+            "expansions": self.expansions,
+            "cache": self._cache.stats()
+        }
+
+
+_tuner: Optional[RecipeTuner] = None
+
+def get_recipe_tuner() -> RecipeTuner:
+    """
+    Obtener el motor compartido (el grafo se carga en el primer uso)
+    """
+    global _tuner
+    if _tuner is None:
+        _tuner = RecipeTuner()
+    return _tuner
@@ -0,0 +1,310 @@
+"""
+Resiliencia de las llamadas salientes (Stripe y Supabase)
+Cada dependencia tiene un circuit breaker; cada operación idempotente, un
+timeout adaptativo calculado a partir del percentil de sus latencias recientes
+y reintentos con backoff exponencial y jitter. Con el circuito abierto las
+llamadas fallan al instante en lugar de acumular requests colgadas.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+# Fallos seguidos que abren el circuito y segundos hasta probar de nuevo
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+# Timeout adaptativo = percentil de las latencias exitosas x multiplicador,
+# acotado entre ADAPTIVE_TIMEOUT_MIN y el timeout configurado de la dependencia
+ADAPTIVE_TIMEOUT_PERCENTILE = float(os.getenv("ADAPTIVE_TIMEOUT_PERCENTILE", 99))
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", 3))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", 1))
+ADAPTIVE_TIMEOUT_WINDOW = int(os.getenv("ADAPTIVE_TIMEOUT_WINDOW", 200))
+# Muestras necesarias antes de ajustar el timeout (hasta entonces se usa el máximo)
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 20))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.1))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 2))
+
+
+class CircuitOpenError(Exception):
+    """El circuito de la dependencia está abierto: la llamada no se intentó"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"Circuito abierto para {dependency} (reintento en {retry_after:.0f}s)")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class DependencyTimeoutError(asyncio.TimeoutError):
+    """La llamada superó el timeout (adaptativo) de la dependencia"""
+
+    def __init__(self, dependency: str, operation: str, timeout: float):
+        super().__init__(f"Timeout de {dependency} en {operation} tras {timeout:.2f}s")
+        self.dependency = dependency
+        self.operation = operation
+        self.timeout = timeout
+
+
+# ================== CIRCUIT BREAKER ==================
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failure_threshold` fallos seguidos; open -> half_open
+    pasados `reset_timeout` segundos, con una única llamada de prueba: si sale
+    bien se cierra, si falla vuelve a abrirse
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """
+        Autorizar una llamada o fallar de inmediato con CircuitOpenError
+        """
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self.state = self.HALF_OPEN
+        if self._trial_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, 1)
+        self._trial_in_flight = True
+
+    def record_success(self):
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info(f"✅ Circuito de {self.name} cerrado")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        self._trial_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            logger.error(f"🔌 Circuito de {self.name} abierto tras {self.consecutive_failures} fallos")
+
+    def release(self):
+        """
+        La llamada se canceló sin decir nada de la salud de la dependencia:
+        liberar el turno de prueba
+        """
+        self._trial_in_flight = False
+
+
+# ================== TIMEOUT ADAPTATIVO ==================
+
+class LatencyWindow:
+    """
+    Últimas latencias exitosas y el timeout que se deriva de ellas
+    """
+
+    def __init__(self, max_timeout: float, window: int = ADAPTIVE_TIMEOUT_WINDOW):
+        self.max_timeout = max_timeout
+        self._samples = deque(maxlen=window)
+        self._timeout = max_timeout
+        self._dirty = False
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._dirty = True
+
+    def percentile(self, q: float) -> Optional[float]:
+        return float(np.percentile(self._samples, q)) if self._samples else None
+
+    def timeout(self) -> float:
+        if len(self._samples) < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return self.max_timeout
+        if self._dirty:
+            adaptive = self.percentile(ADAPTIVE_TIMEOUT_PERCENTILE) * ADAPTIVE_TIMEOUT_MULTIPLIER
+            self._timeout = min(self.max_timeout, max(ADAPTIVE_TIMEOUT_MIN, adaptive))
+            self._dirty = False
+        return self._timeout
+
+
+# ================== DEPENDENCIA ==================
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """
+    Backoff exponencial con jitter completo (attempt empieza en 0)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Dependency:
+    """
+    Política de llamadas hacia un servicio externo.
+
+    `is_failure(exc)` decide qué excepciones cuentan contra la salud del servicio
+    (timeouts, errores de red, 5xx, 429); los errores del cliente (4xx, tarjeta
+    rechazada) se propagan sin abrir el circuito ni reintentarse.
+
+    El timeout adaptativo se calcula por operación (una lectura rápida no acorta
+    el de una escritura lenta) y solo para operaciones idempotentes: cortar una
+    escritura antes de tiempo la deja en un estado desconocido, así que estas
+    usan siempre el timeout máximo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_timeout: float,
+        is_failure: Callable[[BaseException], bool],
+        max_attempts: int = RETRY_MAX_ATTEMPTS
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.max_attempts = max(1, max_attempts)
+        self.max_timeout = max_timeout
+        self.breaker = CircuitBreaker(name)
+        # Todas las operaciones (para métricas) y una ventana por operación
+        self.latency = LatencyWindow(max_timeout)
+        self._windows: Dict[str, LatencyWindow] = {}
+
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+
+    def window(self, operation: str) -> LatencyWindow:
+        window = self._windows.get(operation)
+        if window is None:
+            window = self._windows[operation] = LatencyWindow(self.max_timeout)
+        return window
+
+    async def call(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[Any]],
+        idempotent: bool = False,
+        timeout: Optional[float] = None,
+        limiter: Optional[AsyncContextManager] = None
+    ) -> Any:
+        """
+        Ejecutar `fn()` (una corrutina nueva por intento) bajo el breaker y, si
+        `idempotent`, con timeout adaptativo y reintentos ante fallos del
+        servicio. `limiter` (p. ej. un semáforo) se adquiere antes de empezar a
+        contar el timeout: la espera en la cola local no es un fallo del servicio.
+        """
+        window = self.window(operation)
+        attempts = self.max_attempts if idempotent else 1
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                async with limiter or nullcontext():
+                    budget = timeout or (window.timeout() if idempotent else self.max_timeout)
+                    self.calls += 1
+                    started = time.perf_counter()
+                    result = await asyncio.wait_for(fn(), timeout=budget)
+                    elapsed = time.perf_counter() - started
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.failures += 1
+                self.breaker.record_failure()
+                error = DependencyTimeoutError(self.name, operation, budget)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self.is_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.failures += 1
+                self.breaker.record_failure()
+                error = e
+            else:
+                window.add(elapsed)
+                self.latency.add(elapsed)
+                self.breaker.record_success()
+                return result
+
+            if attempt + 1 >= attempts:
+                raise error
+            self.retries += 1
+            delay = backoff_delay(attempt)
+            logger.warning(f"🔁 Reintentando {self.name} {operation} en {delay:.2f}s: {error}")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latency.percentile(50)
+        p99 = self.latency.percentile(99)
+        return {
+            "state": self.breaker.state,
+            "open": self.breaker.state == CircuitBreaker.OPEN,
+            "half_open": self.breaker.state == CircuitBreaker.HALF_OPEN,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "opened": self.breaker.opened,
+            "rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "timeout_seconds": {
+                _metric_name(operation): round(window.timeout(), 3)
+                for operation, window in self._windows.items()
+            }
+        }
+
+
+def _metric_name(operation: str) -> str:
+    """
+    "GET /rest/v1/tabla" -> "get_rest_v1_tabla" (nombre válido en /metrics)
+    """
+    return re.sub(r"\W+", "_", operation).strip("_").lower()
+
+
+# ================== REGISTRO ==================
+
+_dependencies: Dict[str, Dependency] = {}
+
+def get_dependency(
+    name: str,
+    max_timeout: float,
+    is_failure: Callable[[BaseException], bool],
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+) -> Dependency:
+    """
+    Obtener (o crear en el primer uso) la política compartida de una dependencia
+    """
+    dependency = _dependencies.get(name)
+    if dependency is None:
+        dependency = _dependencies[name] = Dependency(name, max_timeout, is_failure, max_attempts)
+    return dependency
+
+def resilience_stats() -> Dict[str, Any]:
+    return {name: dependency.stats() for name, dependency in _dependencies.items()}
@@ -0,0 +1,218 @@
+"""
+Arranque de producción de RecipeTuner API
+Con gunicorn disponible: un master que importa la app y precarga los datos de
+solo lectura (matriz nutricional, resolver, grafo de sustituciones, catálogo de
+planes) antes de hacer fork, de modo que los workers uvicorn los comparten por
+copy-on-write. Sin gunicorn (p. ej. Windows): uvicorn con N procesos, cada uno
+con su propia carga. En ambos casos se usan uvloop/httptools si están
+instalados y SIGTERM deja de aceptar conexiones, espera las requests en curso y
+vacía las colas de fondo (webhooks, analytics de uso) antes de salir.
+
+Por defecto corre un solo worker: los entitlements, perfiles, catálogo de planes
+y customers de Stripe se cachean por proceso y un webhook solo actualiza el
+worker que lo procesa. Con WEB_CONCURRENCY > 1 los demás convergen en su
+siguiente reconciliación.
+
+    python serve.py
+    WEB_CONCURRENCY=4 PORT=10000 python serve.py
+"""
+
+import gc
+import os
+import asyncio
+import logging
+import multiprocessing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("RecipeTunerServe")
+
+# ================== CONFIGURACIÓN ==================
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+# Procesos worker (0 = uno por CPU); por defecto uno, por las cachés por proceso
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1)) or multiprocessing.cpu_count()
+# Segundos que un worker espera las requests en curso tras SIGTERM
+REQUEST_DRAIN_TIMEOUT = float(os.getenv("REQUEST_DRAIN_TIMEOUT", 15))
+# Tiempo total del apagado de un worker (drenaje + vaciado de colas) antes de matarlo
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+# Reciclar workers tras N requests (0 = nunca), con jitter para no reciclarlos a la vez
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", 0))
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+
+
+def shutdown_budget() -> float:
+    """
+    Peor caso del apagado de un worker: drenaje de requests y, en el lifespan,
+    las esperas por los workers de webhooks y por el buffer de analytics
+    """
+    from webhook_queue import WEBHOOK_STOP_TIMEOUT
+    from usage_writer import USAGE_STOP_TIMEOUT
+
+    return REQUEST_DRAIN_TIMEOUT + WEBHOOK_STOP_TIMEOUT + USAGE_STOP_TIMEOUT
+
+
+def event_loop_implementation() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+
+def http_implementation() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+
+# ================== PRECARGA ==================
+
+async def _preload_plan_catalog():
+    from plan_catalog import get_plan_catalog
+    from supabase_repository import close_repository
+
+    try:
+        await get_plan_catalog().load()
+    finally:
+        # El cliente HTTP pertenece a este event loop: cada worker abre el suyo
+        await close_repository()
+
+
+def preload_shared_data():
+    """
+    Cargar en el master los datos de solo lectura que comparten los workers.
+    Nada de lo que se cree aquí puede quedar atado a un event loop ni a un
+    socket: los workers heredan la memoria pero no el loop del master.
+    """
+    from nutrition_engine import get_nutrition_engine
+    from recipe_tuner import get_recipe_tuner
+
+    get_nutrition_engine()
+    get_recipe_tuner()
+    asyncio.run(_preload_plan_catalog())
+
+    # Sacar los objetos precargados del recolector para que sus recorridos no
+    # toquen (y copien) las páginas compartidas en cada worker
+    gc.collect()
+    gc.freeze()
+    logger.info(f"📦 Datos compartidos precargados ({gc.get_freeze_count()} objetos congelados)")
+
+
+# ================== GUNICORN ==================
+
+def run_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class RecipeTunerApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+
+            preload_shared_data()
+            return app
+
+    RecipeTunerApplication({
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": RecipeTunerWorker,
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": max(GRACEFUL_TIMEOUT, 60),
+        "keepalive": KEEPALIVE_TIMEOUT,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER,
+        "loglevel": LOG_LEVEL,
+        "accesslog": None
+    }).run()
+
+
+try:
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        from uvicorn.workers import UvicornWorker
+except ImportError:
+    UvicornWorker = None
+
+if UvicornWorker is not None:
+    class RecipeTunerWorker(UvicornWorker):
+        """
+        Worker uvicorn de gunicorn con uvloop/httptools si existen y drenaje
+        acotado de las requests en curso al recibir SIGTERM
+        """
+        CONFIG_KWARGS = {
+            "loop": "auto",
+            "http": "auto",
+            "timeout_graceful_shutdown": REQUEST_DRAIN_TIMEOUT
+        }
+
+
+# ================== UVICORN ==================
+
+def run_uvicorn():
+    import uvicorn
+
+    if WEB_CONCURRENCY == 1:
+        # Un solo proceso: se puede pasar la app ya importada y precargada
+        from main import app
+        preload_shared_data()
+        target = app
+    else:
+        # Con varios procesos uvicorn los crea con spawn: cada uno importa y carga por su cuenta
+        target = "main:app"
+
+    uvicorn.run(
+        target,
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=REQUEST_DRAIN_TIMEOUT,
+        limit_max_requests=MAX_REQUESTS or None,
+        log_level=LOG_LEVEL,
+        access_log=False
+    )
+
+
+def main():
+    logger.info(
+        f"🚀 RecipeTuner API en {HOST}:{PORT} con {WEB_CONCURRENCY} workers "
+        f"({event_loop_implementation()} + {http_implementation()})"
+    )
+    budget = shutdown_budget()
+    if budget >= GRACEFUL_TIMEOUT:
+        logger.warning(
+            f"⚠️ El apagado puede tardar {budget:.0f}s (REQUEST_DRAIN_TIMEOUT + WEBHOOK_STOP_TIMEOUT + "
+            f"USAGE_STOP_TIMEOUT) y GRACEFUL_TIMEOUT={GRACEFUL_TIMEOUT}s: el worker se mataría a mitad del drenaje"
+        )
+    if WEB_CONCURRENCY > 1:
+        logger.warning(
+            f"⚠️ {WEB_CONCURRENCY} workers con cachés por proceso: los webhooks solo actualizan el worker "
+            f"que los procesa y el resto converge en la siguiente reconciliación"
+        )
+    if UvicornWorker is not None:
+        run_gunicorn()
+    else:
+        logger.warning("⚠️ gunicorn no disponible: uvicorn sin precarga compartida entre workers")
+        run_uvicorn()
+
+
+if __name__ == "__main__":
+    main()
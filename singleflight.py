@@ -0,0 +1,55 @@
+"""
+Deduplicación de llamadas concurrentes (single-flight)
+Si varias corrutinas piden la misma clave a la vez, solo la primera ejecuta la
+operación y las demás esperan su resultado
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes por clave. El resultado (o la excepción) de la
+    llamada en curso se comparte con todas las corrutinas que esperan la misma clave;
+    no se cachea nada una vez que la llamada termina.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            # La llamada corre en su propia tarea: si la corrutina que la inició se
+            # cancela (p. ej. el cliente se desconecta) las demás siguen esperándola
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # shield: cancelar a quien espera no debe cancelar la llamada compartida
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Evitar el aviso "exception was never retrieved" si nadie más esperaba
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "shared": self.shared
+        }
@@ -0,0 +1,94 @@
+"""
+Resolución de Stripe Customer IDs con caché de lectura
+Orden de búsqueda: memoria -> tabla recipetuner_stripe_customers -> Stripe
+"""
+
+import os
+import logging
+from typing import Any, Dict
+
+from integration_helper import get_customer_id_for_user, get_or_create_customer_mapping
+from singleflight import SingleFlight
+from stripe_gateway import get_stripe_gateway
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+CUSTOMER_CACHE_MAXSIZE = int(os.getenv("CUSTOMER_CACHE_MAXSIZE", 10_000))
+CUSTOMER_CACHE_TTL = int(os.getenv("CUSTOMER_CACHE_TTL", 3600))
+
+
+class StripeCustomerResolver:
+    """
+    Obtiene el Stripe Customer ID de un usuario de RecipeTuner.
+
+    Las resoluciones concurrentes para el mismo usuario comparten una sola
+    búsqueda (single-flight), y la creación en Stripe usa una idempotency key
+    derivada del user_id para que otros workers tampoco dupliquen customers.
+    """
+
+    def __init__(self, maxsize: int = CUSTOMER_CACHE_MAXSIZE, ttl: float = CUSTOMER_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flights = SingleFlight()
+        self.stripe_lookups = 0
+        self.stripe_creates = 0
+
+    async def get_or_create(self, user_data: Dict[str, Any]) -> str:
+        user_id = user_data.get("user_id")
+
+        customer_id = self._cache.get(user_id)
+        if customer_id is not None:
+            return customer_id
+
+        return await self._flights.do(user_id, lambda: self._resolve(user_data))
+
+    async def _resolve(self, user_data: Dict[str, Any]) -> str:
+        user_id = user_data.get("user_id")
+
+        # 1. Mapeo persistido en Supabase
+        customer_id = await get_customer_id_for_user(user_id)
+
+        # 2. Stripe: buscar por email o crear
+        if customer_id is None:
+            customer_id = await self._find_or_create_in_stripe(user_data)
+            # Write-back del mapeo para las próximas resoluciones
+            await get_or_create_customer_mapping(user_id, customer_id)
+
+        self._cache.set(user_id, customer_id)
+        return customer_id
+
+    async def _find_or_create_in_stripe(self, user_data: Dict[str, Any]) -> str:
+        gateway = get_stripe_gateway()
+
+        self.stripe_lookups += 1
+        customers = await gateway.list_customers(user_data.get("email"), limit=1)
+        if customers:
+            return customers[0].id
+
+        self.stripe_creates += 1
+        customer = await gateway.create_customer(
+            email=user_data.get("email"),
+            metadata={
+                "app_name": "recipetuner",
+                "user_id": user_data.get("user_id")
+            },
+            idempotency_key=f"recipetuner-customer-{user_data.get('user_id')}"
+        )
+        logger.info(f"🆕 Customer Stripe creado: {customer.id}")
+        return customer.id
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache": self._cache.stats(),
+            "single_flight": self._flights.stats(),
+            "stripe_lookups": self.stripe_lookups,
+            "stripe_creates": self.stripe_creates
+        }
+
+
+customer_resolver = StripeCustomerResolver()
@@ -3,14 +3,30 @@ Endpoints Stripe para CaloriasAPI - Implementación FastAPI
 Endpoints faltantes para integración completa con RecipeTuner
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import stripe
 import os
 import json
+import math
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+
+from stripe_gateway import get_stripe_gateway, StripeTimeoutError
+from resilience import CircuitOpenError
+from idempotency import IdempotentRequest, idempotent
+from integration_helper import (
+    validate_supabase_token,
+    invalidate_user_cache,
+    get_user_by_stripe_customer_id,
+    upsert_subscription_in_supabase
+)
+from stripe_customers import customer_resolver
+from webhook_queue import enqueue_webhook
+from webhook_dedup import webhook_deduplicator
+from plan_catalog import get_plan_catalog
+from entitlements import get_entitlements, subscription_plan_id, subscription_period_end
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -55,21 +71,74 @@ async def get_current_user(request: Request):
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token de autorización requerido")
 
-    # Aquí validarías el token con Supabase
     token = auth_header.replace("Bearer ", "")
-    # TODO: Implementar validación con Supabase
-    return {"user_id": "user_from_token", "email": "user@example.com"}
+
+    # Validar JWT de Supabase (verificación local + perfil cacheado)
+    user_data = await validate_supabase_token(token)
+    if not user_data:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+
+    return user_data
+
+async def resolve_entitlement(user_id: Optional[str]):
+    """
+    Entitlement vigente del usuario; 503 si aún no hay mapa cargado y la base
+    no responde (no se niega el acceso a quien sí pagó)
+    """
+    try:
+        return await get_entitlements().resolve(user_id)
+    except Exception as e:
+        logger.error(f"❌ No se pudo verificar la suscripción de {user_id}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="No se pudo verificar la suscripción, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "5"}
+        )
+
+async def require_subscription(current_user = Depends(get_current_user)):
+    """Exigir una suscripción vigente (mapa de entitlements en memoria)"""
+    if await resolve_entitlement(current_user.get("user_id")) is None:
+        raise HTTPException(status_code=402, detail="Se requiere una suscripción activa")
+
+    return current_user
 
 # ================== ENDPOINTS ==================
 
+@router.get("/entitlement")
+async def get_entitlement(current_user = Depends(get_current_user)):
+    """
+    Plan vigente del usuario actual (sin consultar Stripe ni Supabase)
+    """
+    entitlement = await resolve_entitlement(current_user.get("user_id"))
+
+    return {
+        "success": True,
+        "entitled": entitlement is not None,
+        "entitlement": entitlement.to_dict() if entitlement else None
+    }
+
 @router.post("/create-subscription")
 async def create_subscription(
     request: CreateSubscriptionRequest,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
-    Crear nueva suscripción en Stripe
+    Crear nueva suscripción en Stripe.
+    Con el header Idempotency-Key los reintentos reciben la respuesta original.
     """
+    return await idempotent(
+        idempotency_key,
+        f"{current_user.get('user_id')}:create-subscription",
+        request,
+        lambda idempotent_request: _create_subscription(request, current_user, idempotent_request)
+    )
+
+async def _create_subscription(
+    request: CreateSubscriptionRequest,
+    current_user: Dict[str, Any],
+    idempotent_request: IdempotentRequest
+):
     try:
         logger.info(f"📝 Creando suscripción para usuario: {current_user.get('user_id')}")
 
@@ -77,27 +146,31 @@ async def create_subscription(
         validate_recipetuner_request(request.metadata)
 
         # Buscar o crear customer en Stripe
-        customer = await get_or_create_stripe_customer(current_user)
+        customer_id = await get_or_create_stripe_customer(current_user)
 
         # Obtener price_id basado en planId e isYearly
         price_id = await get_price_id(request.planId, request.isYearly)
 
+        gateway = get_stripe_gateway()
+
         # Adjuntar método de pago al customer
-        await stripe.PaymentMethod.attach(
+        await gateway.attach_payment_method(
             request.paymentMethodId,
-            customer=customer.id
+            customer_id,
+            idempotency_key=idempotent_request.stripe_key("payment_method.attach")
         )
 
         # Crear suscripción
-        subscription = stripe.Subscription.create(
-            customer=customer.id,
+        subscription = await gateway.create_subscription(
+            idempotency_key=idempotent_request.stripe_key("subscription.create"),
+            customer=customer_id,
             items=[{"price": price_id}],
             default_payment_method=request.paymentMethodId,
             trial_period_days=7,  # 7 días de trial
             metadata={
                 **request.metadata,
                 "user_id": current_user.get("user_id"),
-                "created_at": datetime.utcnow().isoformat()
+                "created_at": idempotent_request.started_at.isoformat()
             }
         )
 
@@ -112,10 +185,32 @@ async def create_subscription(
             "trial_end": subscription.trial_end
         }
 
+    except HTTPException:
+        raise
+
     except stripe.error.CardError as e:
         logger.error(f"❌ Error de tarjeta: {e}")
         raise HTTPException(status_code=400, detail=f"Error de tarjeta: {e.user_message}")
 
+    except StripeTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+    except stripe.error.IdempotencyError as e:
+        # Stripe sigue procesando la request original con esta clave
+        logger.warning(f"⏳ Idempotency-Key en uso en Stripe: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="La operación original sigue en curso, reintenta con la misma Idempotency-Key",
+            headers={"Retry-After": "2"}
+        )
+
     except stripe.error.StripeError as e:
         logger.error(f"❌ Error de Stripe: {e}")
         raise HTTPException(status_code=500, detail=f"Error de Stripe: {str(e)}")
@@ -128,30 +223,47 @@ async def create_subscription(
 @router.post("/cancel-subscription")
 async def cancel_subscription(
     request: CancelSubscriptionRequest,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
-    Cancelar suscripción existente
+    Cancelar suscripción existente.
+    Con el header Idempotency-Key los reintentos reciben la respuesta original.
     """
+    return await idempotent(
+        idempotency_key,
+        f"{current_user.get('user_id')}:cancel-subscription",
+        request,
+        lambda idempotent_request: _cancel_subscription(request, current_user, idempotent_request)
+    )
+
+async def _cancel_subscription(
+    request: CancelSubscriptionRequest,
+    current_user: Dict[str, Any],
+    idempotent_request: IdempotentRequest
+):
     try:
         logger.info(f"❌ Cancelando suscripción: {request.subscriptionId}")
 
         # Validar que es request de RecipeTuner
         validate_recipetuner_request(request.metadata)
 
+        gateway = get_stripe_gateway()
+
         # Verificar que la suscripción pertenece al usuario
-        subscription = stripe.Subscription.retrieve(request.subscriptionId)
+        subscription = await gateway.retrieve_subscription(request.subscriptionId)
         if not subscription:
             raise HTTPException(status_code=404, detail="Suscripción no encontrada")
 
         # Cancelar suscripción (al final del período actual)
-        canceled_subscription = stripe.Subscription.modify(
+        canceled_subscription = await gateway.modify_subscription(
             request.subscriptionId,
+            idempotency_key=idempotent_request.stripe_key("subscription.modify"),
             cancel_at_period_end=True,
             metadata={
                 **request.metadata,
                 "canceled_by": current_user.get("user_id"),
-                "canceled_at": datetime.utcnow().isoformat()
+                "canceled_at": idempotent_request.started_at.isoformat()
             }
         )
 
@@ -165,6 +277,28 @@ async def cancel_subscription(
             "current_period_end": canceled_subscription.current_period_end
         }
 
+    except HTTPException:
+        raise
+
+    except StripeTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+    except stripe.error.IdempotencyError as e:
+        # Stripe sigue procesando la request original con esta clave
+        logger.warning(f"⏳ Idempotency-Key en uso en Stripe: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="La operación original sigue en curso, reintenta con la misma Idempotency-Key",
+            headers={"Retry-After": "2"}
+        )
+
     except stripe.error.StripeError as e:
         logger.error(f"❌ Error de Stripe: {e}")
         raise HTTPException(status_code=500, detail=f"Error de Stripe: {str(e)}")
@@ -177,36 +311,54 @@ async def cancel_subscription(
 @router.post("/update-payment-method")
 async def update_payment_method(
     request: UpdatePaymentMethodRequest,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
-    Actualizar método de pago de una suscripción
+    Actualizar método de pago de una suscripción.
+    Con el header Idempotency-Key los reintentos reciben la respuesta original.
     """
+    return await idempotent(
+        idempotency_key,
+        f"{current_user.get('user_id')}:update-payment-method",
+        request,
+        lambda idempotent_request: _update_payment_method(request, current_user, idempotent_request)
+    )
+
+async def _update_payment_method(
+    request: UpdatePaymentMethodRequest,
+    current_user: Dict[str, Any],
+    idempotent_request: IdempotentRequest
+):
     try:
         logger.info(f"💳 Actualizando método de pago: {request.subscriptionId}")
 
         # Validar que es request de RecipeTuner
         validate_recipetuner_request(request.metadata)
 
+        gateway = get_stripe_gateway()
+
         # Obtener suscripción
-        subscription = stripe.Subscription.retrieve(request.subscriptionId)
+        subscription = await gateway.retrieve_subscription(request.subscriptionId)
         if not subscription:
             raise HTTPException(status_code=404, detail="Suscripción no encontrada")
 
         # Adjuntar nuevo método de pago al customer
-        await stripe.PaymentMethod.attach(
+        await gateway.attach_payment_method(
             request.paymentMethodId,
-            customer=subscription.customer
+            subscription.customer,
+            idempotency_key=idempotent_request.stripe_key("payment_method.attach")
         )
 
         # Actualizar método de pago por defecto
-        stripe.Subscription.modify(
+        await gateway.modify_subscription(
             request.subscriptionId,
+            idempotency_key=idempotent_request.stripe_key("subscription.modify"),
             default_payment_method=request.paymentMethodId,
             metadata={
                 **request.metadata,
                 "payment_method_updated_by": current_user.get("user_id"),
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": idempotent_request.started_at.isoformat()
             }
         )
 
@@ -219,6 +371,28 @@ async def update_payment_method(
             "status": subscription.status
         }
 
+    except HTTPException:
+        raise
+
+    except StripeTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+    except stripe.error.IdempotencyError as e:
+        # Stripe sigue procesando la request original con esta clave
+        logger.warning(f"⏳ Idempotency-Key en uso en Stripe: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="La operación original sigue en curso, reintenta con la misma Idempotency-Key",
+            headers={"Retry-After": "2"}
+        )
+
     except stripe.error.StripeError as e:
         logger.error(f"❌ Error de Stripe: {e}")
         raise HTTPException(status_code=500, detail=f"Error de Stripe: {str(e)}")
@@ -253,82 +427,121 @@ async def stripe_webhooks(request: Request):
 
         logger.info(f"📥 Webhook recibido: {event['type']}")
 
-        # Procesar eventos específicos de RecipeTuner
-        if event['type'] == 'customer.subscription.created':
-            await handle_subscription_created(event)
-        elif event['type'] == 'customer.subscription.updated':
-            await handle_subscription_updated(event)
-        elif event['type'] == 'customer.subscription.deleted':
-            await handle_subscription_deleted(event)
-        elif event['type'] == 'invoice.payment_succeeded':
-            await handle_payment_succeeded(event)
-        elif event['type'] == 'invoice.payment_failed':
-            await handle_payment_failed(event)
-        else:
-            logger.info(f"⏭️ Evento no manejado: {event['type']}")
-
-        return {"success": True}
+        # Reentrega de un evento ya procesado: confirmar sin tocar la cola ni la base
+        if webhook_deduplicator.seen_recently(event['id']):
+            logger.info(f"⏭️ Webhook duplicado ignorado: {event['id']}")
+            return {"success": True, "duplicate": True}
+
+        # Guardar en la cola persistente y confirmar a Stripe de inmediato;
+        # los workers procesan el evento en segundo plano
+        queued = await enqueue_webhook(event['id'], event['type'], payload.decode('utf-8'))
+        if not queued:
+            logger.info(f"⏭️ Webhook duplicado ignorado: {event['id']}")
+
+        return {"success": True, "queued": queued}
+
+    except HTTPException:
+        raise
 
     except Exception as e:
-        logger.error(f"❌ Error procesando webhook: {e}")
+        logger.error(f"❌ Error encolando webhook: {e}")
         raise HTTPException(status_code=500, detail=f"Error procesando webhook: {str(e)}")
 
 
-# ================== FUNCIONES AUXILIARES ==================
+async def process_webhook_event(event: Dict[str, Any]):
+    """
+    Procesar un evento de Stripe desde la cola (los errores provocan reintento)
+    """
+    if await webhook_deduplicator.is_duplicate(event['id']):
+        logger.info(f"⏭️ Evento ya procesado: {event['id']}")
+        return
 
-async def get_or_create_stripe_customer(user_data: Dict[str, Any]):
-    """Buscar o crear customer en Stripe"""
-    try:
-        # Buscar customer existente por metadata
-        customers = stripe.Customer.list(
-            email=user_data.get("email"),
-            limit=1
-        )
+    # Procesar eventos específicos de RecipeTuner
+    if event['type'] == 'customer.subscription.created':
+        await handle_subscription_created(event)
+    elif event['type'] == 'customer.subscription.updated':
+        await handle_subscription_updated(event)
+    elif event['type'] == 'customer.subscription.deleted':
+        await handle_subscription_deleted(event)
+    elif event['type'] == 'invoice.payment_succeeded':
+        await handle_payment_succeeded(event)
+    elif event['type'] == 'invoice.payment_failed':
+        await handle_payment_failed(event)
+    elif event['type'].startswith(('price.', 'product.')):
+        # Cambió un precio o producto en Stripe: recargar el catálogo de planes
+        get_plan_catalog().request_refresh()
+    else:
+        logger.info(f"⏭️ Evento no manejado: {event['type']}")
+
+    # Marcar como procesado antes de confirmar el evento en la cola
+    await webhook_deduplicator.record(event)
 
-        if customers.data:
-            return customers.data[0]
 
-        # Crear nuevo customer
-        customer = stripe.Customer.create(
-            email=user_data.get("email"),
-            metadata={
-                "app_name": "recipetuner",
-                "user_id": user_data.get("user_id")
-            }
-        )
+# ================== FUNCIONES AUXILIARES ==================
 
-        return customer
+async def get_or_create_stripe_customer(user_data: Dict[str, Any]) -> str:
+    """Obtener el Stripe Customer ID del usuario (caché -> Supabase -> Stripe)"""
+    try:
+        return await customer_resolver.get_or_create(user_data)
 
     except Exception as e:
         logger.error(f"❌ Error gestionando customer: {e}")
         raise
 
 async def get_price_id(plan_id: str, is_yearly: bool):
-    """Obtener price_id de Stripe basado en plan y frecuencia"""
-    # Mapeo de planes (actualizar con tus price_ids reales)
-    PRICE_MAPPING = {
-        "premium_mexico": {
-            "monthly": "price_mexico_monthly_89mxn",
-            "yearly": "price_mexico_yearly_699mxn"
-        },
-        "premium_usa": {
-            "monthly": "price_usa_monthly_499usd",
-            "yearly": "price_usa_yearly_3999usd"
-        }
-    }
-
+    """Obtener price_id de Stripe basado en plan y frecuencia (catálogo en memoria)"""
     frequency = "yearly" if is_yearly else "monthly"
+    catalog = get_plan_catalog()
 
-    if plan_id not in PRICE_MAPPING:
+    if catalog.get_plan(plan_id) is None:
         raise HTTPException(status_code=400, detail=f"Plan no válido: {plan_id}")
 
-    price_id = PRICE_MAPPING[plan_id][frequency]
+    price_id = catalog.get_price_id(plan_id, frequency)
 
     if not price_id:
         raise HTTPException(status_code=400, detail=f"Price ID no encontrado para {plan_id} {frequency}")
 
     return price_id
 
+def _iso(timestamp) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat() if timestamp else None
+
+async def sync_subscription(event):
+    """
+    Aplicar el estado de la suscripción al entitlement del usuario (inmediato,
+    en memoria) y guardarlo en Supabase; si la escritura falla el evento se
+    reintenta. Los eventos atrasados no se aplican ni se guardan.
+    """
+    subscription = event['data']['object']
+    customer_id = subscription.get('customer')
+
+    user_id = subscription.get('metadata', {}).get('user_id')
+    if not user_id and customer_id:
+        user = await get_user_by_stripe_customer_id(customer_id)
+        user_id = user.get('id') if user else None
+    if not user_id:
+        logger.warning(f"⚠️ Suscripción sin usuario asociado: {subscription['id']}")
+        return
+
+    if not get_entitlements().apply_subscription(user_id, subscription, event.get('created')):
+        # Un evento atrasado no debe pisar en la base un estado más reciente
+        # (p. ej. un "updated" activo que llega después del "deleted")
+        return
+
+    saved = await upsert_subscription_in_supabase({
+        'user_id': user_id,
+        'plan_id': subscription_plan_id(subscription),
+        'stripe_subscription_id': subscription['id'],
+        'stripe_customer_id': customer_id,
+        'status': subscription.get('status'),
+        'current_period_start': _iso(subscription.get('current_period_start')),
+        'current_period_end': _iso(subscription_period_end(subscription)),
+        'trial_start': _iso(subscription.get('trial_start')),
+        'trial_end': _iso(subscription.get('trial_end'))
+    })
+    if not saved:
+        raise RuntimeError(f"No se pudo guardar la suscripción {subscription['id']}")
+
 # ================== HANDLERS DE WEBHOOKS ==================
 
 async def handle_subscription_created(event):
@@ -341,8 +554,13 @@ async def handle_subscription_created(event):
 
     logger.info(f"🆕 Suscripción creada: {subscription['id']}")
 
-    # TODO: Actualizar base de datos (Supabase)
-    # await update_subscription_in_supabase(subscription)
+    # El estado del usuario cambió: descartar su perfil cacheado
+    invalidate_user_cache(
+        user_id=subscription.get('metadata', {}).get('user_id'),
+        stripe_customer_id=subscription.get('customer')
+    )
+
+    await sync_subscription(event)
 
 async def handle_subscription_updated(event):
     """Manejar suscripción actualizada"""
@@ -353,7 +571,13 @@ async def handle_subscription_updated(event):
 
     logger.info(f"🔄 Suscripción actualizada: {subscription['id']}")
 
-    # TODO: Actualizar base de datos (Supabase)
+    # El estado del usuario cambió: descartar su perfil cacheado
+    invalidate_user_cache(
+        user_id=subscription.get('metadata', {}).get('user_id'),
+        stripe_customer_id=subscription.get('customer')
+    )
+
+    await sync_subscription(event)
 
 async def handle_subscription_deleted(event):
     """Manejar suscripción cancelada"""
@@ -364,7 +588,13 @@ async def handle_subscription_deleted(event):
 
     logger.info(f"❌ Suscripción cancelada: {subscription['id']}")
 
-    # TODO: Actualizar base de datos (Supabase)
+    # El estado del usuario cambió: descartar su perfil cacheado
+    invalidate_user_cache(
+        user_id=subscription.get('metadata', {}).get('user_id'),
+        stripe_customer_id=subscription.get('customer')
+    )
+
+    await sync_subscription(event)
 
 async def handle_payment_succeeded(event):
     """Manejar pago exitoso"""
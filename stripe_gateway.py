@@ -0,0 +1,252 @@
+"""
+Gateway asíncrono de Stripe para RecipeTuner API
+Ejecuta las llamadas del SDK síncrono de Stripe en un pool de hilos acotado,
+con límite de concurrencia, circuit breaker y timeout adaptativo por llamada,
+para no bloquear el event loop
+"""
+
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import stripe
+
+from metrics import track_dependency
+from resilience import DependencyTimeoutError, get_dependency
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+STRIPE_MAX_CONCURRENCY = int(os.getenv("STRIPE_MAX_CONCURRENCY", 16))
+STRIPE_CALL_TIMEOUT = float(os.getenv("STRIPE_CALL_TIMEOUT", 15))
+# Base de la API de Stripe; solo se cambia para apuntar a un servidor falso (benchmarks/load_test.py)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+
+
+class StripeTimeoutError(Exception):
+    """La llamada a Stripe excedió el timeout configurado"""
+
+
+def is_stripe_failure(exc: BaseException) -> bool:
+    """
+    Errores que indican que Stripe no está sano (red, 5xx, rate limit); los
+    errores de tarjeta o de parámetros no cuentan para el circuit breaker
+    """
+    return isinstance(exc, (
+        stripe.error.APIConnectionError,
+        stripe.error.APIError,
+        stripe.error.RateLimitError
+    ))
+
+
+class _ExecutorSlot:
+    """
+    Turno del semáforo del gateway que se devuelve cuando termina el hilo del
+    SDK, no cuando vence el timeout: un hilo que sigue bloqueado en Stripe
+    ocupa su turno y la siguiente llamada espera en el semáforo (sin contar
+    para su timeout) en lugar de esperar un hilo libre del pool
+    """
+
+    def __init__(self, semaphore: asyncio.Semaphore):
+        self._semaphore = semaphore
+        self.future: Optional[Future] = None
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self.future = None
+        return self
+
+    async def __aexit__(self, *exc_info):
+        future = self.future
+        if future is None or future.done():
+            self._semaphore.release()
+            return
+        loop = asyncio.get_running_loop()
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(self._semaphore.release)
+            except RuntimeError:
+                # Event loop ya cerrado (apagado del servidor)
+                pass
+
+        future.add_done_callback(release)
+
+
+class StripeGateway:
+    """
+    Fachada asíncrona sobre el SDK de Stripe.
+
+    Cada llamada se ejecuta en un ThreadPoolExecutor dedicado cuyo tamaño coincide
+    con el límite de concurrencia, de modo que una ráfaga de checkouts nunca agota
+    el pool por defecto del event loop ni bloquea otras requests.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = STRIPE_MAX_CONCURRENCY,
+        call_timeout: float = STRIPE_CALL_TIMEOUT
+    ):
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="stripe-gateway"
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dependency = get_dependency("stripe", call_timeout, is_stripe_failure)
+
+        # Timeout de red del SDK alineado con el timeout por llamada, para que
+        # los hilos no queden ocupados después de que la request ya expiró.
+        # Los reintentos los hace Dependency: el SDK no reintenta por su cuenta.
+        stripe.max_network_retries = 0
+        try:
+            stripe.default_http_client = stripe.new_default_http_client(timeout=call_timeout)
+        except (AttributeError, TypeError):
+            logger.warning("⚠️ SDK de Stripe sin soporte para timeout de cliente HTTP")
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Crear el semáforo dentro del event loop activo
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _call(
+        self,
+        operation: str,
+        fn: Callable[..., Any],
+        *args,
+        idempotent: bool = False,
+        **kwargs
+    ) -> Any:
+        """
+        Ejecutar una función del SDK de Stripe fuera del event loop.
+        Solo las lecturas (`idempotent=True`) se reintentan; con el circuito
+        abierto falla al instante con CircuitOpenError. El timeout empieza a
+        contar con el semáforo ya adquirido y el turno se devuelve cuando
+        termina el hilo (ver _ExecutorSlot).
+        """
+        slot = _ExecutorSlot(self._get_semaphore())
+
+        async def attempt():
+            slot.future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+            with track_dependency("stripe", operation):
+                return await asyncio.wrap_future(slot.future)
+
+        try:
+            return await self._dependency.call(operation, attempt, idempotent=idempotent, limiter=slot)
+        except DependencyTimeoutError as e:
+            logger.error(f"⏱️ Timeout en Stripe ({operation}) tras {e.timeout:.2f}s")
+            raise StripeTimeoutError(f"Timeout de Stripe en {operation}")
+
+    # ================== CUSTOMERS ==================
+
+    async def list_customers(self, email: str, limit: int = 1) -> List[Any]:
+        customers = await self._call(
+            "customer.list", stripe.Customer.list, email=email, limit=limit, idempotent=True
+        )
+        return customers.data
+
+    async def create_customer(
+        self,
+        email: str,
+        metadata: Dict[str, str],
+        idempotency_key: Optional[str] = None
+    ) -> Any:
+        return await self._call(
+            "customer.create",
+            stripe.Customer.create,
+            email=email,
+            metadata=metadata,
+            idempotency_key=idempotency_key
+        )
+
+    # ================== PAYMENT METHODS ==================
+
+    async def attach_payment_method(
+        self,
+        payment_method_id: str,
+        customer_id: str,
+        idempotency_key: Optional[str] = None
+    ) -> Any:
+        return await self._call(
+            "payment_method.attach",
+            stripe.PaymentMethod.attach,
+            payment_method_id,
+            customer=customer_id,
+            idempotency_key=idempotency_key
+        )
+
+    # ================== SUBSCRIPTIONS ==================
+
+    # Las escrituras no se reintentan dentro de la request aunque lleven
+    # idempotency_key: tras un timeout Stripe puede seguir procesando la original
+    # y respondería idempotency_key_in_use. El reintento es del cliente, con la
+    # misma Idempotency-Key.
+
+    async def create_subscription(self, idempotency_key: Optional[str] = None, **params) -> Any:
+        return await self._call(
+            "subscription.create",
+            stripe.Subscription.create,
+            idempotency_key=idempotency_key,
+            **params
+        )
+
+    async def retrieve_subscription(self, subscription_id: str) -> Any:
+        return await self._call(
+            "subscription.retrieve", stripe.Subscription.retrieve, subscription_id, idempotent=True
+        )
+
+    async def modify_subscription(self, subscription_id: str, idempotency_key: Optional[str] = None, **params) -> Any:
+        return await self._call(
+            "subscription.modify",
+            stripe.Subscription.modify,
+            subscription_id,
+            idempotency_key=idempotency_key,
+            **params
+        )
+
+    # ================== HEALTH ==================
+
+    async def ping(self):
+        """
+        Llamada autenticada mínima para los health checks
+        """
+        await self._call("price.list", stripe.Price.list, limit=1, idempotent=True)
+
+    def shutdown(self):
+        """Liberar los hilos del pool al apagar el servidor"""
+        self._executor.shutdown(wait=False)
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_gateway: Optional[StripeGateway] = None
+
+def get_stripe_gateway() -> StripeGateway:
+    """
+    Obtener el gateway compartido (se crea en el primer uso)
+    """
+    global _gateway
+    if _gateway is None:
+        _gateway = StripeGateway()
+        logger.info(
+            f"✅ Gateway Stripe listo (concurrencia={_gateway.max_concurrency}, "
+            f"timeout={_gateway.call_timeout}s)"
+        )
+    return _gateway
+
+def shutdown_stripe_gateway():
+    """
+    Cerrar el gateway compartido
+    """
+    global _gateway
+    if _gateway is not None:
+        _gateway.shutdown()
+        _gateway = None
@@ -0,0 +1,248 @@
+"""
+Capa de acceso a datos asíncrona para Supabase
+Cliente PostgREST/Auth sobre httpx.AsyncClient con pool de conexiones keep-alive,
+para que las consultas no bloqueen el event loop
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+
+from metrics import track_dependency
+from resilience import get_dependency
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", 20))
+SUPABASE_POOL_KEEPALIVE = int(os.getenv("SUPABASE_POOL_KEEPALIVE", 10))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 3))
+SUPABASE_REQUEST_TIMEOUT = float(os.getenv("SUPABASE_REQUEST_TIMEOUT", 10))
+
+
+class SupabaseError(Exception):
+    """Error devuelto por la API de Supabase"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_supabase_failure(exc: BaseException) -> bool:
+    """
+    Fallos del servicio (red, 5xx, 429); los 4xx son errores de la consulta
+    """
+    if isinstance(exc, SupabaseError):
+        return exc.status_code is None or exc.status_code >= 500 or exc.status_code == 429
+    return isinstance(exc, httpx.TransportError)
+
+
+def _format_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Convertir filtros de igualdad {columna: valor} a la sintaxis de PostgREST
+    """
+    params = {}
+    for column, value in (filters or {}).items():
+        if value is None:
+            params[column] = "is.null"
+        elif isinstance(value, bool):
+            params[column] = f"eq.{str(value).lower()}"
+        else:
+            params[column] = f"eq.{value}"
+    return params
+
+
+class SupabaseRepository:
+    """
+    Repositorio asíncrono sobre la API REST de Supabase.
+
+    Un único httpx.AsyncClient por proceso reutiliza conexiones HTTP/1.1 keep-alive,
+    con tamaño de pool y timeouts configurables.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        service_key: str,
+        pool_size: int = SUPABASE_POOL_SIZE,
+        keepalive: int = SUPABASE_POOL_KEEPALIVE,
+        connect_timeout: float = SUPABASE_CONNECT_TIMEOUT,
+        request_timeout: float = SUPABASE_REQUEST_TIMEOUT
+    ):
+        self.url = url.rstrip("/")
+        self._service_key = service_key
+        self._client = httpx.AsyncClient(
+            headers={
+                "apikey": service_key,
+                "Authorization": f"Bearer {service_key}"
+            },
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive
+            ),
+            timeout=httpx.Timeout(request_timeout, connect=connect_timeout)
+        )
+        self._dependency = get_dependency("supabase", request_timeout, is_supabase_failure)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        idempotent: bool = False,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Request a Supabase bajo el circuit breaker; solo las lecturas y los
+        upserts (`idempotent=True`) se reintentan y usan el timeout adaptativo.
+        Un INSERT o un UPDATE parcial repetido o cortado a medias no es seguro.
+        """
+        async def attempt() -> httpx.Response:
+            with track_dependency("supabase", f"{method} {path}"):
+                response = await self._client.request(method, f"{self.url}{path}", **kwargs)
+            if response.status_code >= 400:
+                raise SupabaseError(
+                    f"{method} {path} -> {response.status_code}: {response.text}",
+                    status_code=response.status_code
+                )
+            return response
+
+        return await self._dependency.call(f"{method} {path}", attempt, idempotent=idempotent)
+
+    # ================== POSTGREST ==================
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        order: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        SELECT columns FROM table WHERE col = valor ... [ORDER BY order] LIMIT/OFFSET
+        """
+        params = {"select": columns, **_format_filters(filters)}
+        if limit is not None:
+            params["limit"] = str(limit)
+        if offset:
+            params["offset"] = str(offset)
+        if order:
+            params["order"] = order
+        response = await self._request("GET", f"/rest/v1/{table}", params=params, idempotent=True)
+        return response.json()
+
+    async def insert(
+        self,
+        table: str,
+        rows: Union[Dict[str, Any], List[Dict[str, Any]]],
+        returning: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        INSERT de una fila o de un lote de filas en una sola request
+        """
+        prefer = "return=representation" if returning else "return=minimal"
+        response = await self._request(
+            "POST",
+            f"/rest/v1/{table}",
+            json=rows,
+            headers={"Prefer": prefer}
+        )
+        return response.json() if returning else []
+
+    async def update(
+        self,
+        table: str,
+        values: Dict[str, Any],
+        filters: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """
+        UPDATE table SET ... WHERE col = valor ...
+        """
+        response = await self._request(
+            "PATCH",
+            f"/rest/v1/{table}",
+            params=_format_filters(filters),
+            json=values,
+            headers={"Prefer": "return=representation"}
+        )
+        return response.json()
+
+    async def upsert(
+        self,
+        table: str,
+        rows: Union[Dict[str, Any], List[Dict[str, Any]]],
+        on_conflict: str
+    ) -> List[Dict[str, Any]]:
+        """
+        INSERT ... ON CONFLICT (on_conflict) DO UPDATE en una sola request
+        """
+        response = await self._request(
+            "POST",
+            f"/rest/v1/{table}",
+            params={"on_conflict": on_conflict},
+            json=rows,
+            headers={"Prefer": "resolution=merge-duplicates,return=representation"},
+            idempotent=True
+        )
+        return response.json()
+
+    # ================== AUTH ==================
+
+    async def get_auth_user(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener el usuario de Supabase Auth asociado a un access token
+        """
+        try:
+            response = await self._request(
+                "GET",
+                "/auth/v1/user",
+                headers={"Authorization": f"Bearer {access_token}"},
+                idempotent=True
+            )
+        except SupabaseError as e:
+            if e.status_code in (401, 403):
+                return None
+            raise
+        return response.json()
+
+    async def get_jwks(self) -> List[Dict[str, Any]]:
+        """
+        Obtener las llaves públicas (JWKS) con las que Supabase Auth firma los JWT
+        """
+        response = await self._request("GET", "/auth/v1/.well-known/jwks.json", idempotent=True)
+        return response.json().get("keys", [])
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_repository: Optional[SupabaseRepository] = None
+
+def get_repository() -> SupabaseRepository:
+    """
+    Obtener el repositorio compartido (se crea en el primer uso)
+    """
+    global _repository
+    if _repository is None:
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Usar service role para operaciones del servidor
+        if not url or not key:
+            raise SupabaseError("SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY son requeridas")
+        _repository = SupabaseRepository(url, key)
+        logger.info(f"✅ Repositorio Supabase listo (pool={SUPABASE_POOL_SIZE})")
+    return _repository
+
+async def close_repository():
+    """
+    Cerrar el pool de conexiones compartido
+    """
+    global _repository
+    if _repository is not None:
+        await _repository.aclose()
+        _repository = None
@@ -0,0 +1,8 @@
+"""
+Configuración común de las pruebas unitarias (sin red ni credenciales)
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,156 @@
+"""
+Pruebas del mapa de entitlements: carga inicial fallida, reintentos, consulta
+de respaldo a la base mientras el mapa no está cargado y webhooks atrasados
+"""
+
+import time
+import asyncio
+
+import pytest
+
+import entitlements
+import stripe_endpoints
+from entitlements import EntitlementCache
+
+
+class FakeRepository:
+    def __init__(self, rows, failures: int = 0):
+        self.rows = rows
+        self.failures = failures
+        self.selects = []
+
+    async def select(self, table, columns="*", filters=None, limit=None, offset=None, order=None):
+        self.selects.append(filters)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("supabase caído")
+        rows = [row for row in self.rows if all(row.get(k) == v for k, v in (filters or {}).items())]
+        return rows[offset or 0:][:limit] if limit else rows
+
+
+def subscription_row(user_id, status="active"):
+    return {
+        "user_id": user_id,
+        "plan_id": "premium_mexico",
+        "stripe_subscription_id": f"sub_{user_id}",
+        "status": status,
+        "current_period_end": time.time() + 86400
+    }
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(entitlements, "ENTITLEMENT_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(entitlements, "ENTITLEMENT_RETRY_MAX_SECONDS", 0.01)
+
+
+def test_failed_first_load_is_retried_without_waiting_the_interval(monkeypatch, fast_retries):
+    repository = FakeRepository([subscription_row("u1")], failures=2)
+    monkeypatch.setattr(entitlements, "get_repository", lambda: repository)
+
+    async def scenario():
+        cache = EntitlementCache(reconcile_interval=600)
+        await cache.start(timeout=0.001)
+        assert not cache.loaded
+        for _ in range(100):
+            if cache.loaded:
+                break
+            await asyncio.sleep(0.01)
+        await cache.stop()
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.loaded
+    assert cache.failed_reconciles == 2
+    assert cache.is_entitled("u1")
+
+
+def test_resolve_falls_back_to_database_before_first_load(monkeypatch):
+    repository = FakeRepository([subscription_row("u1"), subscription_row("u2", status="canceled")])
+    monkeypatch.setattr(entitlements, "get_repository", lambda: repository)
+
+    async def scenario():
+        cache = EntitlementCache()
+        assert not cache.loaded
+        paying = await cache.resolve("u1")
+        canceled = await cache.resolve("u2")
+        # La respuesta positiva queda en el mapa: no se vuelve a consultar
+        await cache.resolve("u1")
+        return cache, paying, canceled
+
+    cache, paying, canceled = asyncio.run(scenario())
+    assert paying is not None and paying.plan_id == "premium_mexico"
+    assert canceled is None
+    assert repository.selects == [{"user_id": "u1"}, {"user_id": "u2"}]
+    assert cache.fallback_lookups == 2
+
+
+def test_resolve_propagates_database_errors_before_first_load(monkeypatch):
+    repository = FakeRepository([], failures=1)
+    monkeypatch.setattr(entitlements, "get_repository", lambda: repository)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(EntitlementCache().resolve("u1"))
+
+
+def test_resolve_does_no_io_once_loaded(monkeypatch):
+    repository = FakeRepository([subscription_row("u1")])
+    monkeypatch.setattr(entitlements, "get_repository", lambda: repository)
+
+    async def scenario():
+        cache = EntitlementCache()
+        assert await cache.reconcile()
+        repository.selects.clear()
+        return cache, await cache.resolve("u1"), await cache.resolve("u3")
+
+    cache, paying, missing = asyncio.run(scenario())
+    assert paying is not None
+    assert missing is None
+    assert repository.selects == []
+
+
+def subscription_event(status, created, subscription_id="sub_u1"):
+    return {
+        "id": subscription_id,
+        "status": status,
+        "metadata": {"user_id": "u1", "plan_id": "premium_mexico"},
+        "current_period_end": time.time() + 86400
+    }, created
+
+
+def test_update_delivered_after_delete_is_not_applied():
+    cache = EntitlementCache()
+    created = time.time()
+
+    assert cache.apply_subscription("u1", *subscription_event("active", created - 60))
+    assert cache.apply_subscription("u1", *subscription_event("canceled", created))
+    assert not cache.is_entitled("u1")
+
+    # Reintento de la cola o entrega fuera de orden del "updated" anterior
+    assert not cache.apply_subscription("u1", *subscription_event("active", created - 30))
+    assert not cache.is_entitled("u1")
+    assert cache.stale_pushes == 1
+
+
+def test_stale_webhook_is_not_saved(monkeypatch):
+    cache = EntitlementCache()
+    saved = []
+
+    async def upsert(data):
+        saved.append(data)
+        return True
+
+    monkeypatch.setattr(stripe_endpoints, "get_entitlements", lambda: cache)
+    monkeypatch.setattr(stripe_endpoints, "upsert_subscription_in_supabase", upsert)
+
+    def event(status, created):
+        subscription, created = subscription_event(status, created)
+        return {"created": created, "data": {"object": subscription}}
+
+    async def scenario():
+        await stripe_endpoints.sync_subscription(event("canceled", 200))
+        await stripe_endpoints.sync_subscription(event("active", 100))
+
+    asyncio.run(scenario())
+    assert [row["status"] for row in saved] == ["canceled"]
+    assert not cache.is_entitled("u1")
@@ -0,0 +1,155 @@
+"""
+Pruebas del almacén de Idempotency-Key: repetición de la respuesta, conflicto
+de huella, duplicados concurrentes, qué errores se guardan y persistencia en SQLite
+"""
+
+import json
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IdempotencyStore, request_fingerprint
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+class Handler:
+    def __init__(self, result=None, error=None, delay=0.0):
+        self.result = result if result is not None else {"subscription_id": "sub_1"}
+        self.error = error
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, request):
+        self.calls.append(request)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_retry_replays_the_stored_response():
+    store = IdempotencyStore(path="")
+    handler = Handler()
+    fingerprint = request_fingerprint({"plan_id": "premium"})
+
+    async def scenario():
+        first = await store.run("u1:k1", fingerprint, handler)
+        second = await store.run("u1:k1", fingerprint, handler)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(handler.calls) == 1
+    assert body(first) == body(second) == {"subscription_id": "sub_1"}
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert store.stats()["replayed"] == 1
+
+
+def test_same_key_with_another_payload_is_rejected():
+    store = IdempotencyStore(path="")
+    handler = Handler()
+
+    async def scenario():
+        await store.run("u1:k1", request_fingerprint({"plan_id": "premium"}), handler)
+        await store.run("u1:k1", request_fingerprint({"plan_id": "basic"}), handler)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+    assert exc.value.status_code == 422
+    assert len(handler.calls) == 1
+    assert store.stats()["conflicts"] == 1
+
+
+def test_concurrent_duplicates_wait_for_the_original():
+    store = IdempotencyStore(path="")
+    handler = Handler(delay=0.05)
+    fingerprint = request_fingerprint({"plan_id": "premium"})
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("u1:k1", fingerprint, handler) for _ in range(5)))
+
+    responses = asyncio.run(scenario())
+    assert len(handler.calls) == 1
+    assert all(body(r) == {"subscription_id": "sub_1"} for r in responses)
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 4
+    assert store.stats()["parked"] == 4
+
+
+@pytest.mark.parametrize("status_code", [500, 503, 504, 409, 429])
+def test_transient_errors_are_not_stored(status_code):
+    store = IdempotencyStore(path="")
+    failing = Handler(error=HTTPException(status_code=status_code, detail="Stripe no disponible"))
+    succeeding = Handler()
+    fingerprint = request_fingerprint({"plan_id": "premium"})
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await store.run("u1:k1", fingerprint, failing)
+        return await store.run("u1:k1", fingerprint, succeeding)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert len(succeeding.calls) == 1
+    # El reintento conserva el instante del primer intento
+    assert succeeding.calls[0].first_seen == failing.calls[0].first_seen
+
+
+def test_client_errors_are_stored():
+    store = IdempotencyStore(path="")
+    handler = Handler(error=HTTPException(status_code=400, detail="Error de tarjeta"))
+    fingerprint = request_fingerprint({"plan_id": "premium"})
+
+    async def scenario():
+        first = await store.run("u1:k1", fingerprint, handler)
+        second = await store.run("u1:k1", fingerprint, handler)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(handler.calls) == 1
+    assert first.status_code == second.status_code == 400
+    assert body(second) == {"detail": "Error de tarjeta"}
+
+
+def test_sqlite_replays_across_stores(tmp_path):
+    path = str(tmp_path / "idempotency.db")
+    handler = Handler()
+    fingerprint = request_fingerprint({"plan_id": "premium"})
+
+    async def scenario():
+        first_worker = IdempotencyStore(path=path)
+        await first_worker.run("u1:k1", fingerprint, handler)
+        first_worker.close()
+
+        second_worker = IdempotencyStore(path=path)
+        try:
+            replayed = await second_worker.run("u1:k1", fingerprint, handler)
+            with pytest.raises(HTTPException) as exc:
+                await second_worker.run("u1:k1", request_fingerprint({"plan_id": "basic"}), handler)
+            return replayed, exc.value, second_worker.stats()
+        finally:
+            second_worker.close()
+
+    replayed, conflict, stats = asyncio.run(scenario())
+    assert len(handler.calls) == 1
+    assert replayed.headers["idempotent-replayed"] == "true"
+    assert body(replayed) == {"subscription_id": "sub_1"}
+    assert conflict.status_code == 422
+    assert stats["db_replayed"] == 1
+
+
+def test_stripe_keys_are_stable_per_operation():
+    store = IdempotencyStore(path="")
+    handler = Handler()
+
+    async def scenario():
+        await store.run("u1:k1", request_fingerprint({}), handler)
+
+    asyncio.run(scenario())
+    request = handler.calls[0]
+    assert request.stripe_key("subscription") == request.stripe_key("subscription")
+    assert request.stripe_key("subscription") != request.stripe_key("customer")
@@ -0,0 +1,164 @@
+"""
+Pruebas del verificador de JWT de Supabase: HS256 con el secreto del proyecto,
+llaves asimétricas por JWKS (con refresco ante un kid desconocido), audiencia,
+expiración, algoritmos rechazados y ventana de revocación
+"""
+
+import json
+import time
+import asyncio
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import jwt_verifier
+from jwt_verifier import SupabaseJWTVerifier
+
+SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+
+
+def rsa_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return private_key, {**jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+KEY_1 = rsa_key("key-1")
+KEY_2 = rsa_key("key-2")
+
+
+class FakeRepository:
+    def __init__(self, jwks=(), revoked=()):
+        self.jwks = list(jwks)
+        self.revoked = set(revoked)
+        self.jwks_fetches = 0
+        self.auth_checks = []
+
+    async def get_jwks(self):
+        self.jwks_fetches += 1
+        return self.jwks
+
+    async def get_auth_user(self, token):
+        claims = jwt.decode(token, options={"verify_signature": False})
+        self.auth_checks.append(claims["sub"])
+        if claims.get("session_id") in self.revoked:
+            return None
+        return {"id": claims["sub"], "email": claims.get("email")}
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    repository = FakeRepository(jwks=[KEY_1[1]])
+    monkeypatch.setattr(jwt_verifier, "get_repository", lambda: repository)
+    return repository
+
+
+def claims(**overrides):
+    now = int(time.time())
+    return {
+        "sub": "auth-user-1",
+        "email": "ana@example.com",
+        "aud": "authenticated",
+        "session_id": "session-1",
+        "iat": now,
+        "exp": now + 3600,
+        **overrides
+    }
+
+
+def hs256(**overrides):
+    return jwt.encode(claims(**overrides), SECRET, algorithm="HS256")
+
+
+def rs256(key=KEY_1, **overrides):
+    private_key, jwk = key
+    return jwt.encode(claims(**overrides), private_key, algorithm="RS256", headers={"kid": jwk["kid"]})
+
+
+def verify(verifier, *tokens):
+    async def scenario():
+        return [await verifier.verify(token) for token in tokens]
+    return asyncio.run(scenario())
+
+
+def test_hs256_token_is_verified_with_the_project_secret(repository):
+    [result] = verify(SupabaseJWTVerifier(jwt_secret=SECRET), hs256())
+    assert result["sub"] == "auth-user-1"
+    assert repository.jwks_fetches == 0
+
+
+@pytest.mark.parametrize("token", [
+    hs256(aud="anon"),
+    hs256(exp=int(time.time()) - 3600),
+    jwt.encode({k: v for k, v in claims().items() if k != "sub"}, SECRET, algorithm="HS256"),
+    jwt.encode(claims(), "otro-secreto-de-al-menos-32-caracteres!!", algorithm="HS256"),
+    "no-es-un-jwt"
+], ids=["audience", "expired", "missing_sub", "bad_signature", "malformed"])
+def test_invalid_hs256_tokens_are_rejected(repository, token):
+    assert verify(SupabaseJWTVerifier(jwt_secret=SECRET), token) == [None]
+    assert repository.auth_checks == []
+
+
+@pytest.mark.parametrize("token", [
+    jwt.encode(claims(), None, algorithm="none"),
+    jwt.encode(claims(), SECRET, algorithm="HS384")
+], ids=["none", "hs384"])
+def test_unsupported_algorithms_are_rejected(repository, token):
+    assert verify(SupabaseJWTVerifier(jwt_secret=SECRET), token) == [None]
+    assert repository.jwks_fetches == 0
+    assert repository.auth_checks == []
+
+
+def test_hs256_without_secret_falls_back_to_supabase_auth(repository):
+    [result] = verify(SupabaseJWTVerifier(jwt_secret=None), hs256())
+    assert result == {"sub": "auth-user-1", "email": "ana@example.com"}
+    assert repository.auth_checks == ["auth-user-1"]
+
+
+def test_rs256_token_is_verified_with_the_cached_jwks(repository):
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=0)
+    results = verify(verifier, rs256(), rs256())
+    assert [r["sub"] for r in results] == ["auth-user-1", "auth-user-1"]
+    assert repository.jwks_fetches == 1
+
+
+def test_unknown_kid_forces_a_jwks_refresh(repository, monkeypatch):
+    monkeypatch.setattr(jwt_verifier, "JWKS_MIN_REFRESH_INTERVAL", 0)
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=0)
+    verify(verifier, rs256())
+
+    # Rotación: Supabase publica la llave nueva
+    repository.jwks.append(KEY_2[1])
+    [result] = verify(verifier, rs256(KEY_2))
+    assert result["sub"] == "auth-user-1"
+    assert repository.jwks_fetches == 2
+
+
+def test_unknown_kid_refreshes_are_rate_limited(repository):
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=0)
+    known, unknown, again = verify(verifier, rs256(), rs256(KEY_2), rs256(KEY_2))
+    assert known is not None
+    assert unknown is None and again is None
+    # Dentro de JWKS_MIN_REFRESH_INTERVAL un kid desconocido no vuelve a descargar
+    assert repository.jwks_fetches == 1
+
+
+def test_rs256_token_signed_by_another_key_with_a_known_kid_is_rejected(repository):
+    forged = jwt.encode(claims(), KEY_2[0], algorithm="RS256", headers={"kid": "key-1"})
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=0)
+    assert verify(verifier, forged) == [None]
+
+
+def test_revocation_is_checked_once_per_window(repository):
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=300)
+    results = verify(verifier, hs256(), hs256(), hs256(session_id="session-2"))
+    assert all(result is not None for result in results)
+    assert repository.auth_checks == ["auth-user-1", "auth-user-1"]
+
+
+def test_revoked_session_is_rejected_and_remembered(repository):
+    repository.revoked.add("session-1")
+    verifier = SupabaseJWTVerifier(jwt_secret=SECRET, revocation_window=300)
+    assert verify(verifier, hs256(), hs256()) == [None, None]
+    assert repository.auth_checks == ["auth-user-1"]
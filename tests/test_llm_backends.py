@@ -0,0 +1,77 @@
+"""
+Pruebas del backend de OpenAI ante errores de red: se convierten en LLMError y
+el ajuste de recetas conserva las explicaciones basadas en notas
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import recipe_tuner
+from llm_backends import LLMError, OpenAIBackend
+from llm_dispatcher import LLMDispatcher
+
+RECIPE = {
+    "title": "Muffins",
+    "servings": 6,
+    "ingredients": ["200 g mantequilla", "2 tazas de azúcar", "1 taza de leche entera"],
+    "instructions": ["Mezclar", "Hornear"]
+}
+
+
+def unreachable_backend(error: Exception) -> OpenAIBackend:
+    def handler(request):
+        raise error
+
+    backend = OpenAIBackend("sk-test")
+    backend._client = httpx.AsyncClient(
+        base_url="https://openai.invalid/v1",
+        transport=httpx.MockTransport(handler)
+    )
+    return backend
+
+
+NETWORK_ERRORS = [
+    httpx.ConnectError("connection refused"),
+    httpx.ReadTimeout("timed out")
+]
+
+
+@pytest.mark.parametrize("error", NETWORK_ERRORS, ids=["connect", "read_timeout"])
+def test_network_errors_become_llm_errors(error):
+    backend = unreachable_backend(error)
+
+    async def scenario():
+        try:
+            with pytest.raises(LLMError) as analyze:
+                await backend.analyze(RECIPE)
+            with pytest.raises(LLMError):
+                await backend.ping()
+            return analyze.value
+        finally:
+            await backend.aclose()
+
+    raised = asyncio.run(scenario())
+    assert raised.__cause__ is error
+
+
+def test_tune_keeps_note_explanations_when_openai_is_unreachable(monkeypatch):
+    backend = unreachable_backend(httpx.ReadTimeout("timed out"))
+    dispatcher = LLMDispatcher(backend=backend)
+    monkeypatch.setattr(recipe_tuner, "get_llm_dispatcher", lambda: dispatcher)
+    tuner = recipe_tuner.get_recipe_tuner()
+    result = tuner.tune(RECIPE["ingredients"], servings=RECIPE["servings"])
+
+    async def scenario():
+        try:
+            return await tuner.explain(RECIPE, "muffins", result)
+        finally:
+            await backend.aclose()
+
+    explained = asyncio.run(scenario())
+    assert explained["alternatives"]
+    assert [a["explanation"] for a in explained["alternatives"]] == [
+        a["explanation"] for a in result["alternatives"]
+    ]
+    assert dispatcher.errors == len(result["alternatives"])
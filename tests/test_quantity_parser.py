@@ -0,0 +1,70 @@
+"""
+Pruebas del parser de cantidades y unidades de ingredientes
+"""
+
+import pytest
+
+from quantity_parser import parse_ingredient, parse_number, to_grams
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2", 2.0),
+    ("1.5", 1.5),
+    ("1,5", 1.5),
+    ("3/4", 0.75),
+    ("1 1/2", 1.5),
+    ("½", 0.5),
+    ("1½", 1.5),
+    ("1 ½", 1.5),
+])
+def test_parse_number(value, expected):
+    assert parse_number(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", [None, "", "1/0", "0/0", "1 1/0"])
+def test_parse_number_invalid_or_missing(value):
+    assert parse_number(value) is None
+
+
+def test_zero_denominator_is_an_unparseable_quantity():
+    parsed = parse_ingredient("1/0 taza de azucar")
+    assert parsed["quantity"] is None
+    assert parsed["unit"] == "cup"
+    assert parsed["name"] == "azucar"
+
+
+def test_range_with_zero_denominator_does_not_fail():
+    parsed = parse_ingredient("1/0-2 tazas de leche")
+    assert parsed["quantity"] is None
+    assert "quantity_max" not in parsed
+
+
+def test_range_returns_midpoint_and_bounds():
+    parsed = parse_ingredient("2-3 dientes de ajo")
+    assert parsed["quantity"] == 2.5
+    assert (parsed["quantity_min"], parsed["quantity_max"]) == (2.0, 3.0)
+    assert parsed["unit"] == "piece"
+    assert parsed["name"] == "ajo"
+
+
+@pytest.mark.parametrize("line, quantity, unit, name", [
+    ("½ cdita de sal", 0.5, "tsp", "sal"),
+    ("1 cucharada de aceite", 1.0, "tbsp", "aceite"),
+    ("200 g de pollo", 200.0, "g", "pollo"),
+    ("2 huevos", 2.0, None, "huevos"),
+    ("sal al gusto", None, None, "sal al gusto"),
+])
+def test_parse_ingredient(line, quantity, unit, name):
+    parsed = parse_ingredient(line)
+    assert parsed["quantity"] == quantity
+    assert parsed["unit"] == unit
+    assert parsed["name"] == name
+
+
+def test_to_grams():
+    assert to_grams(2, "kg") == 2000
+    assert to_grams(1, "cup", density=1.0) == 240
+    assert to_grams(1, "cup") is None
+    assert to_grams(None, "g") is None
+    assert to_grams(None, "pinch") == pytest.approx(0.4)
+    assert to_grams(2, None, unit_weight=50) == 100
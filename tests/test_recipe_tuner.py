@@ -0,0 +1,94 @@
+"""
+Pruebas de la búsqueda A* del RecipeTuner: resultados iguales a la fuerza
+bruta (la cota es admisible), sin conjuntos repetidos y sustituciones
+aplicadas a la línea correcta de la receta
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from recipe_tuner import get_recipe_tuner
+
+
+@pytest.fixture(scope="module")
+def tuner():
+    return get_recipe_tuner()
+
+
+def brute_force(gains, top_k, max_substitutions):
+    """
+    Todas las combinaciones de (posición, opción), a lo sumo una opción por posición
+    """
+    found = []
+    positions = range(len(gains))
+    for size in range(1, max_substitutions + 1):
+        for chosen in itertools.combinations(positions, size):
+            for options in itertools.product(*(range(len(gains[p])) for p in chosen)):
+                state = tuple(zip(chosen, options))
+                found.append(sum(gains[p][o] for p, o in state))
+    return sorted(found, reverse=True)[:top_k]
+
+
+def random_gains(rng, slots, max_options):
+    gains = [np.sort(rng.uniform(0.01, 10, rng.integers(1, max_options + 1)))[::-1] for _ in range(slots)]
+    # Mismo orden que tune(): posiciones por su mejor opción
+    return sorted(gains, key=lambda g: -g[0])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_search_matches_brute_force(tuner, seed):
+    rng = np.random.default_rng(seed)
+    gains = random_gains(rng, slots=int(rng.integers(1, 7)), max_options=3)
+    top_k = int(rng.integers(1, 8))
+    max_substitutions = int(rng.integers(1, 4))
+
+    found = tuner._search(gains, top_k, max_substitutions, max_expansions=100_000)
+
+    expected = brute_force(gains, top_k, max_substitutions)
+    assert [gain for gain, _ in found] == pytest.approx(expected)
+    for gain, state in found:
+        assert len(state) <= max_substitutions
+        assert gain == pytest.approx(sum(gains[p][o] for p, o in state))
+
+
+def test_search_never_returns_the_same_set_twice(tuner):
+    # Ganancias empatadas: la misma combinación solo puede salir una vez
+    gains = [np.array([1.0, 1.0]) for _ in range(4)]
+    found = tuner._search(gains, top_k=50, max_substitutions=3, max_expansions=100_000)
+
+    sets = [frozenset(state) for _, state in found]
+    assert len(sets) == len(set(sets)) == 50
+    assert all(len({p for p, _ in state}) == len(state) for _, state in found)
+
+
+def test_search_stops_at_max_expansions(tuner):
+    gains = [np.array([1.0, 0.5]) for _ in range(10)]
+    before = tuner.expansions
+    tuner._search(gains, top_k=100, max_substitutions=5, max_expansions=10)
+    assert tuner.expansions - before <= 10
+
+
+def test_substitutions_apply_to_the_right_lines(tuner):
+    lines = ["3 qwxz", "200 g mantequilla", "sal al gusto", "2 tazas de azúcar", "1 taza de leche entera"]
+    result = tuner.tune(lines, top_k=5)
+    engine = tuner.engine
+
+    improvements = [a["improvement"] for a in result["alternatives"]]
+    assert improvements == sorted(improvements, reverse=True)
+    assert result["unmatched"] == ["3 qwxz", "sal al gusto"]
+
+    seen = set()
+    for alternative in result["alternatives"]:
+        key = frozenset((s["original"], s["to"]) for s in alternative["substitutions"])
+        assert key not in seen
+        seen.add(key)
+
+        for substitution in alternative["substitutions"]:
+            index = lines.index(substitution["original"])
+            assert alternative["ingredients"][index] == substitution["replacement"]
+            assert engine.compute([substitution["original"]])["ingredients"][0]["food"] == substitution["from"]
+        # Los totales de la alternativa son los de la receta ya modificada
+        recomputed = engine.compute(alternative["ingredients"])["totals"]
+        assert alternative["totals"]["kcal"] == pytest.approx(recomputed["kcal"], rel=0.01, abs=1)
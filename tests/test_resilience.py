@@ -0,0 +1,183 @@
+"""
+Pruebas del circuit breaker y de la política de llamadas de una dependencia:
+transiciones de estado, reintentos solo en operaciones idempotentes y timeout
+por operación
+"""
+
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, Dependency, DependencyTimeoutError
+
+
+class ServiceDown(Exception):
+    pass
+
+
+class ClientError(Exception):
+    pass
+
+
+def is_failure(exc):
+    return isinstance(exc, (ServiceDown, asyncio.TimeoutError))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold_and_fails_fast(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 1
+
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == pytest.approx(20)
+    assert breaker.rejected == 1
+
+
+def test_breaker_half_open_allows_a_single_trial(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_the_trial_fails(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_trial_releases_the_half_open_slot(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 30
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_client_errors_do_not_count_against_the_service():
+    dependency = Dependency("svc", 5, is_failure, max_attempts=3)
+    calls = []
+
+    async def rejected():
+        calls.append(1)
+        raise ClientError("tarjeta rechazada")
+
+    async def scenario():
+        for _ in range(10):
+            with pytest.raises(ClientError):
+                await dependency.call("charge", rejected, idempotent=True)
+
+    asyncio.run(scenario())
+    assert len(calls) == 10
+    assert dependency.breaker.state == CircuitBreaker.CLOSED
+    assert dependency.failures == 0
+
+
+def test_only_idempotent_calls_are_retried():
+    dependency = Dependency("svc", 5, is_failure, max_attempts=3)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ServiceDown("502")
+        return "ok"
+
+    async def scenario():
+        assert await dependency.call("read", flaky, idempotent=True) == "ok"
+        calls.clear()
+        with pytest.raises(ServiceDown):
+            await dependency.call("write", flaky)
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert dependency.retries == 2
+
+
+def test_adaptive_timeout_is_per_operation_and_skips_writes(monkeypatch):
+    monkeypatch.setattr(resilience, "ADAPTIVE_TIMEOUT_MIN_SAMPLES", 5)
+    monkeypatch.setattr(resilience, "ADAPTIVE_TIMEOUT_MIN", 0.01)
+    dependency = Dependency("svc", 1.0, is_failure, max_attempts=1)
+
+    async def fast():
+        return "ok"
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def scenario():
+        for _ in range(10):
+            await dependency.call("GET /fast", fast, idempotent=True)
+        # Las lecturas rápidas no acortan el timeout de otra operación...
+        assert await dependency.call("GET /slow", slow, idempotent=True) == "ok"
+        assert dependency.stats()["timeout_seconds"]["get_fast"] < 0.1
+        with pytest.raises(DependencyTimeoutError):
+            await dependency.call("GET /fast", slow, idempotent=True)
+        # ...y una escritura usa siempre el timeout máximo
+        assert await dependency.call("GET /fast", slow) == "ok"
+
+    asyncio.run(scenario())
+    assert dependency.timeouts == 1
+
+
+def test_limiter_wait_does_not_count_against_the_timeout():
+    dependency = Dependency("svc", 0.2, is_failure, max_attempts=1)
+
+    async def work():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def scenario():
+        limiter = asyncio.Semaphore(1)
+        results = await asyncio.gather(*(
+            dependency.call("op", work, limiter=limiter) for _ in range(4)
+        ))
+        assert results == ["ok"] * 4
+
+    asyncio.run(scenario())
+    assert dependency.timeouts == 0
@@ -0,0 +1,63 @@
+"""
+Pruebas del resolver de Stripe Customer IDs: resoluciones concurrentes del
+mismo usuario crean un solo customer
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import stripe_customers
+from stripe_customers import StripeCustomerResolver
+
+
+class FakeGateway:
+    def __init__(self):
+        self.created = []
+        self.idempotency_keys = []
+
+    async def list_customers(self, email, limit=1):
+        await asyncio.sleep(0.01)
+        return []
+
+    async def create_customer(self, email, metadata, idempotency_key=None):
+        await asyncio.sleep(0.01)
+        self.created.append(metadata["user_id"])
+        self.idempotency_keys.append(idempotency_key)
+        return SimpleNamespace(id=f"cus_{metadata['user_id']}")
+
+
+def test_concurrent_resolutions_create_one_customer(monkeypatch):
+    gateway = FakeGateway()
+    mappings = []
+
+    async def no_mapping(user_id):
+        await asyncio.sleep(0.01)
+        return None
+
+    async def save_mapping(user_id, customer_id):
+        mappings.append((user_id, customer_id))
+
+    monkeypatch.setattr(stripe_customers, "get_stripe_gateway", lambda: gateway)
+    monkeypatch.setattr(stripe_customers, "get_customer_id_for_user", no_mapping)
+    monkeypatch.setattr(stripe_customers, "get_or_create_customer_mapping", save_mapping)
+    resolver = StripeCustomerResolver()
+
+    def user(user_id):
+        return {"user_id": user_id, "email": f"{user_id}@example.com"}
+
+    async def scenario():
+        first = await asyncio.gather(
+            *(resolver.get_or_create(user("u1")) for _ in range(10)),
+            resolver.get_or_create(user("u2"))
+        )
+        # Ya en caché: sin ir a Supabase ni a Stripe
+        again = await resolver.get_or_create(user("u1"))
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert first == ["cus_u1"] * 10 + ["cus_u2"]
+    assert again == "cus_u1"
+    assert sorted(gateway.created) == ["u1", "u2"]
+    assert len(set(gateway.idempotency_keys)) == 2
+    assert sorted(mappings) == [("u1", "cus_u1"), ("u2", "cus_u2")]
+    assert resolver.stats()["stripe_creates"] == 2
@@ -0,0 +1,55 @@
+"""
+Pruebas del gateway de Stripe: un hilo que sigue bloqueado tras un timeout
+conserva su turno y el SDK no reintenta por su cuenta
+"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+import stripe
+
+import resilience
+from stripe_gateway import StripeGateway, StripeTimeoutError
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    monkeypatch.setattr(resilience, "_dependencies", {})
+    gateway = StripeGateway(max_concurrency=1, call_timeout=0.1)
+    yield gateway
+    gateway.shutdown()
+
+
+def test_sdk_retries_are_disabled(gateway):
+    assert stripe.max_network_retries == 0
+
+
+def test_timed_out_thread_keeps_its_slot(gateway):
+    unblock = threading.Event()
+    finished = []
+
+    def hung_call():
+        unblock.wait(5)
+        finished.append(time.monotonic())
+
+    def quick_call():
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(StripeTimeoutError):
+            await gateway._call("hung", hung_call)
+        # El hilo sigue ocupado: la siguiente llamada espera turno sin que
+        # esa espera cuente para su timeout
+        pending = asyncio.create_task(gateway._call("quick", quick_call))
+        await asyncio.sleep(0.3)
+        assert not pending.done()
+        unblock.set()
+        result = await pending
+        return result, time.monotonic()
+
+    result, completed = asyncio.run(scenario())
+    assert result == "ok"
+    assert finished and finished[0] <= completed
+    assert gateway._dependency.timeouts == 1
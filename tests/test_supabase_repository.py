@@ -0,0 +1,43 @@
+"""
+Pruebas de la política de reintentos del repositorio: solo las lecturas y los
+upserts se repiten ante un 5xx de Supabase
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import resilience
+from supabase_repository import SupabaseError, SupabaseRepository
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    monkeypatch.setattr(resilience, "_dependencies", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    requests = []
+
+    def handler(request):
+        requests.append(request.method)
+        return httpx.Response(503, text="upstream unavailable")
+
+    repository = SupabaseRepository("https://supabase.invalid", "service-key")
+    asyncio.run(repository.aclose())
+    repository._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    repository.requests = requests
+    yield repository
+    asyncio.run(repository.aclose())
+
+
+@pytest.mark.parametrize("operation, retried", [
+    (lambda r: r.select("recipetuner_users", filters={"id": "u1"}), True),
+    (lambda r: r.upsert("recipetuner_subscriptions", {"user_id": "u1"}, on_conflict="user_id"), True),
+    (lambda r: r.insert("recipetuner_billing_events", {"user_id": "u1"}), False),
+    (lambda r: r.update("recipetuner_users", {"plan": "free"}, filters={"id": "u1"}), False)
+], ids=["select", "upsert", "insert", "update"])
+def test_only_reads_and_upserts_are_retried(repository, operation, retried):
+    with pytest.raises(SupabaseError):
+        asyncio.run(operation(repository))
+    expected = resilience.RETRY_MAX_ATTEMPTS if retried else 1
+    assert len(repository.requests) == expected
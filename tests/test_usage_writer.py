@@ -0,0 +1,57 @@
+"""
+Pruebas del escritor por lotes de analytics de uso
+"""
+
+import asyncio
+
+import usage_writer
+from usage_writer import ApiUsageWriter
+
+
+class SlowRepository:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.rows = []
+
+    async def insert(self, table, rows, returning=True):
+        await asyncio.sleep(self.delay)
+        self.rows.extend(rows)
+        return []
+
+
+def test_stop_waits_for_in_flight_flush_and_drains_buffer(monkeypatch):
+    repository = SlowRepository(delay=0.05)
+    monkeypatch.setattr(usage_writer, "get_repository", lambda: repository)
+
+    async def scenario():
+        writer = ApiUsageWriter(batch_size=2, flush_interval=10)
+        writer.start()
+        for i in range(5):
+            writer.record({"n": i})
+        # El primer lote ya salió del buffer y está en vuelo
+        await asyncio.sleep(0.01)
+        await writer.stop(timeout=2)
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert [row["n"] for row in repository.rows] == [0, 1, 2, 3, 4]
+    assert writer.stats()["buffered"] == 0
+
+
+def test_stop_timeout_keeps_in_flight_batch_in_buffer(monkeypatch):
+    repository = SlowRepository(delay=10)
+    monkeypatch.setattr(usage_writer, "get_repository", lambda: repository)
+
+    async def scenario():
+        writer = ApiUsageWriter(batch_size=2, flush_interval=10)
+        writer.start()
+        for i in range(3):
+            writer.record({"n": i})
+        await asyncio.sleep(0.01)
+        await writer.stop(timeout=0.05)
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert repository.rows == []
+    # Cancelado a mitad del insert: ninguna fila se perdió en silencio
+    assert writer.stats()["buffered"] == 3
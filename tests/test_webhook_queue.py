@@ -0,0 +1,123 @@
+"""
+Pruebas de la cola persistente de webhooks y de su pool de workers
+"""
+
+import json
+import time
+import asyncio
+import sqlite3
+
+from webhook_queue import WebhookQueue, WebhookWorkerPool
+
+
+def make_queue(tmp_path, max_attempts: int = 3) -> WebhookQueue:
+    return WebhookQueue(path=str(tmp_path / "queue.db"), max_attempts=max_attempts, visibility_timeout=60)
+
+
+def test_enqueue_is_deduplicated_by_event_id(tmp_path):
+    async def scenario():
+        queue = make_queue(tmp_path)
+        assert await queue.enqueue("evt_1", "invoice.paid", "{}") is True
+        assert await queue.enqueue("evt_1", "invoice.paid", "{}") is False
+        assert (await queue.stats())["depth"] == 1
+        queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_claim_hides_job_until_ack(tmp_path):
+    async def scenario():
+        queue = make_queue(tmp_path)
+        await queue.enqueue("evt_1", "invoice.paid", "{}")
+
+        job = await queue.claim()
+        assert job["event_id"] == "evt_1"
+        assert job["attempts"] == 1
+        # Reclamado: invisible para otro worker
+        assert await queue.claim() is None
+
+        await queue.ack("evt_1")
+        assert (await queue.stats())["depth"] == 0
+        queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_fail_reschedules_with_backoff(tmp_path):
+    async def scenario():
+        queue = make_queue(tmp_path)
+        await queue.enqueue("evt_1", "invoice.paid", "{}")
+        job = await queue.claim()
+
+        assert await queue.fail(job, "boom") is False
+        # Backoff: todavía no está disponible
+        assert await queue.claim() is None
+        queue._conn.execute("UPDATE webhook_queue SET available_at = ?", (time.time() - 1,))
+
+        retried = await queue.claim()
+        assert retried["attempts"] == 2
+        assert retried["last_error"] == "boom"
+        queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_fail_moves_to_dead_letter_after_max_attempts(tmp_path):
+    async def scenario():
+        queue = make_queue(tmp_path, max_attempts=2)
+        await queue.enqueue("evt_1", "invoice.paid", "{}")
+
+        for attempt in range(1, 3):
+            queue._conn.execute("UPDATE webhook_queue SET available_at = ?", (time.time() - 1,))
+            job = await queue.claim()
+            assert job["attempts"] == attempt
+            dead = await queue.fail(job, f"error {attempt}")
+
+        assert dead is True
+        stats = await queue.stats()
+        assert stats["depth"] == 0
+        assert stats["dead_letters"] == 1
+        [letter] = await queue.dead_letters()
+        assert letter["event_id"] == "evt_1"
+        assert letter["attempts"] == 2
+        assert letter["last_error"] == "error 2"
+        queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_worker_survives_ack_failure_and_releases_job(tmp_path):
+    async def scenario():
+        queue = make_queue(tmp_path)
+        handled = []
+
+        async def handler(event):
+            handled.append(event["id"])
+
+        acks = {"failures": 1}
+        original_ack = queue.ack
+
+        async def flaky_ack(event_id):
+            if acks["failures"]:
+                acks["failures"] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            await original_ack(event_id)
+
+        queue.ack = flaky_ack
+        pool = WebhookWorkerPool(queue, handler, concurrency=1, poll_interval=0.01)
+        await queue.enqueue("evt_1", "invoice.paid", json.dumps({"id": "evt_1"}))
+        pool.start()
+
+        for _ in range(200):
+            if (await queue.stats())["depth"] == 0:
+                break
+            await asyncio.sleep(0.01)
+
+        # El worker siguió vivo, el evento se liberó y se procesó de nuevo
+        assert not pool._tasks[0].done()
+        assert handled == ["evt_1", "evt_1"]
+        assert pool.processed == 1
+        await pool.stop(timeout=1)
+        queue.close()
+
+    asyncio.run(scenario())
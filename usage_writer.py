@@ -0,0 +1,192 @@
+"""
+Escritor por lotes de analytics de uso de API
+Los registros se acumulan en un buffer acotado y una tarea en segundo plano los
+inserta en recipetuner_api_usage por tamaño de lote o por intervalo de tiempo
+"""
+
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from supabase_repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+USAGE_BUFFER_SIZE = int(os.getenv("USAGE_BUFFER_SIZE", 10_000))
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", 500))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 5))
+# "oldest": descartar los registros más antiguos al llenarse; "newest": rechazar los nuevos
+USAGE_DROP_POLICY = os.getenv("USAGE_DROP_POLICY", "oldest")
+# Espera máxima (s) al apagar para que el flusher termine su lote y vacíe el buffer
+USAGE_STOP_TIMEOUT = float(os.getenv("USAGE_STOP_TIMEOUT", 5))
+
+USAGE_TABLE = "recipetuner_api_usage"
+
+
+class ApiUsageWriter:
+    """
+    Buffer circular de registros de uso con vaciado por lotes.
+
+    `record()` nunca espera I/O: si el buffer está lleno aplica la política de
+    descarte y lo contabiliza. Un lote fallido se devuelve al frente del buffer
+    (si hay espacio) para el siguiente intento.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = USAGE_BUFFER_SIZE,
+        batch_size: int = USAGE_BATCH_SIZE,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        drop_policy: str = USAGE_DROP_POLICY
+    ):
+        if drop_policy not in ("oldest", "newest"):
+            raise ValueError(f"Política de descarte no válida: {drop_policy}")
+
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def record(self, row: Dict[str, Any]) -> bool:
+        """
+        Encolar un registro; devuelve False si fue descartado
+        """
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            if self.drop_policy == "newest":
+                return False
+            self._buffer.popleft()
+
+        self._buffer.append(row)
+        self.enqueued += 1
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        count = min(self.batch_size, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(count)]
+
+    async def flush(self) -> int:
+        """
+        Insertar un lote; devuelve el número de filas escritas
+        """
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        try:
+            await get_repository().insert(USAGE_TABLE, batch, returning=False)
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"❌ Error escribiendo lote de uso de API ({len(batch)} filas): {e}")
+            # Devolver el lote al frente del buffer sin exceder su capacidad
+            space = self.buffer_size - len(self._buffer)
+            retained = batch[:max(space, 0)]
+            self._buffer.extendleft(reversed(retained))
+            self.dropped += len(batch) - len(retained)
+            return 0
+        except asyncio.CancelledError:
+            # Cancelado a mitad del insert: el lote vuelve al buffer, no se pierde
+            self._buffer.extendleft(reversed(batch))
+            raise
+
+        self.batches += 1
+        self.flushed += len(batch)
+        return len(batch)
+
+    async def _drain(self):
+        while self._buffer:
+            if not await self.flush():
+                break
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            # Vaciar lotes completos seguidos; un lote parcial solo por intervalo
+            while self._buffer and not self._stopping:
+                written = await self.flush()
+                if not written or len(self._buffer) < self.batch_size:
+                    break
+
+        # Apagado: el lote en curso ya terminó; escribir lo que quede
+        await self._drain()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="api-usage-writer")
+
+    async def stop(self, timeout: float = USAGE_STOP_TIMEOUT):
+        """
+        Pedir al flusher que termine su lote en curso y vacíe el buffer; solo se
+        cancela si no acaba en `timeout` segundos
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._batch_ready.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Escritor de uso sin terminar tras {timeout}s al apagar")
+            except Exception as e:
+                logger.error(f"❌ Error vaciando el buffer de uso al apagar: {e}")
+            self._task = None
+        else:
+            await self._drain()
+
+        if self._buffer:
+            logger.warning(f"⚠️ {len(self._buffer)} registros de uso sin escribir al apagar")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "buffer_size": self.buffer_size,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_writer: Optional[ApiUsageWriter] = None
+
+def get_usage_writer() -> ApiUsageWriter:
+    """
+    Obtener el escritor compartido (se crea en el primer uso)
+    """
+    global _writer
+    if _writer is None:
+        _writer = ApiUsageWriter()
+    return _writer
+
+def start_usage_writer():
+    get_usage_writer().start()
+
+async def stop_usage_writer():
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
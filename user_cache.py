@@ -0,0 +1,98 @@
+"""
+Caché de perfiles de usuario (recipetuner_users)
+Compartida por la validación de tokens y la búsqueda por Stripe Customer ID,
+con invalidación explícita desde los webhooks
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", 10_000))
+USER_PROFILE_CACHE_TTL = int(os.getenv("USER_PROFILE_CACHE_TTL", 60))
+
+
+class UserProfileCache:
+    """
+    Perfiles indexados por auth_user_id, con índices secundarios por
+    recipetuner_users.id y por stripe_customer_id.
+
+    Los índices secundarios solo apuntan al auth_user_id: si el perfil expira o se
+    invalida, la búsqueda secundaria también falla y se vuelve a consultar la base.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_MAXSIZE, ttl: float = USER_PROFILE_CACHE_TTL):
+        self._profiles = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_user_id = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_stripe_customer = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_by_auth_user_id(self, auth_user_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(auth_user_id)
+
+    def get_by_stripe_customer_id(self, stripe_customer_id: str) -> Optional[Dict[str, Any]]:
+        auth_user_id = self._by_stripe_customer.get(stripe_customer_id)
+        if auth_user_id is None:
+            return None
+        return self._profiles.get(auth_user_id)
+
+    def put(
+        self,
+        profile: Dict[str, Any],
+        auth_user_id: Optional[str] = None,
+        stripe_customer_id: Optional[str] = None
+    ):
+        auth_user_id = auth_user_id or profile.get("auth_user_id")
+        if not auth_user_id:
+            return
+
+        self._profiles.set(auth_user_id, profile)
+        if profile.get("id"):
+            self._by_user_id.set(profile["id"], auth_user_id)
+        if stripe_customer_id:
+            self._by_stripe_customer.set(stripe_customer_id, auth_user_id)
+
+    def invalidate(
+        self,
+        auth_user_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        stripe_customer_id: Optional[str] = None
+    ) -> bool:
+        """
+        Descartar el perfil identificado por cualquiera de sus claves
+        """
+        if auth_user_id is None and user_id:
+            auth_user_id = self._by_user_id.pop(user_id)
+        if auth_user_id is None and stripe_customer_id:
+            auth_user_id = self._by_stripe_customer.pop(stripe_customer_id)
+
+        if stripe_customer_id:
+            self._by_stripe_customer.pop(stripe_customer_id)
+        if auth_user_id is None:
+            return False
+
+        profile = self._profiles.pop(auth_user_id)
+        if profile and profile.get("id"):
+            self._by_user_id.pop(profile["id"])
+
+        logger.info(f"🧹 Perfil invalidado en caché: {auth_user_id}")
+        return profile is not None
+
+    def clear(self):
+        self._profiles.clear()
+        self._by_user_id.clear()
+        self._by_stripe_customer.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "profiles": self._profiles.stats(),
+            "by_stripe_customer": self._by_stripe_customer.stats()
+        }
+
+
+user_profile_cache = UserProfileCache()
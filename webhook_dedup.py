@@ -0,0 +1,96 @@
+"""
+Índice de deduplicación de webhooks de Stripe
+Conjunto acotado en memoria delante de la tabla recipetuner_billing_events,
+para descartar entregas duplicadas sin consultar la base de datos
+"""
+
+import os
+import logging
+from collections import OrderedDict
+from typing import Any, Dict
+
+from integration_helper import is_event_processed, record_processed_event
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+WEBHOOK_DEDUP_MAXSIZE = int(os.getenv("WEBHOOK_DEDUP_MAXSIZE", 100_000))
+
+
+class WebhookDeduplicator:
+    """
+    Stripe reintenta entregas durante días, pero casi todos los duplicados llegan
+    minutos después del original: un conjunto LRU de los últimos N event ids resuelve
+    esos casos en O(1) y la tabla persistente cubre el resto (y los reinicios).
+    """
+
+    def __init__(self, maxsize: int = WEBHOOK_DEDUP_MAXSIZE):
+        self.maxsize = maxsize
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.duplicates_dropped = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.recorded = 0
+
+    def _remember(self, event_id: str):
+        self._seen[event_id] = None
+        self._seen.move_to_end(event_id)
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+    def seen_recently(self, event_id: str) -> bool:
+        """
+        Comprobación solo en memoria (para la ruta de ingesta)
+        """
+        if event_id in self._seen:
+            self.memory_hits += 1
+            self.duplicates_dropped += 1
+            return True
+        return False
+
+    async def is_duplicate(self, event_id: str) -> bool:
+        """
+        Comprobación completa: memoria y, si no está, la tabla de eventos
+        """
+        if self.seen_recently(event_id):
+            return True
+
+        if await is_event_processed(event_id):
+            self._remember(event_id)
+            self.db_hits += 1
+            self.duplicates_dropped += 1
+            return True
+
+        return False
+
+    async def record(self, event: Dict[str, Any]):
+        """
+        Registrar el evento como procesado; si la escritura falla se lanza una
+        excepción para que la cola lo reintente
+        """
+        obj = event.get('data', {}).get('object', {})
+        recorded = await record_processed_event({
+            'user_id': (obj.get('metadata') or {}).get('user_id'),
+            'stripe_event_id': event['id'],
+            'event_type': event['type'],
+            'event_data': obj
+        })
+        if not recorded:
+            raise RuntimeError(f"No se pudo registrar el evento {event['id']}")
+
+        self._remember(event['id'])
+        self.recorded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._seen),
+            "maxsize": self.maxsize,
+            "duplicates_dropped": self.duplicates_dropped,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "recorded": self.recorded
+        }
+
+
+webhook_deduplicator = WebhookDeduplicator()
@@ -0,0 +1,378 @@
+"""
+Cola persistente de webhooks de Stripe
+Los webhooks se verifican, se guardan en SQLite y se confirman a Stripe de inmediato;
+un pool de workers asíncronos los procesa después con reintentos y dead-letter
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ================== CONFIGURACIÓN ==================
+
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", "webhook_queue.db")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", 2))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv("WEBHOOK_RETRY_MAX_SECONDS", 600))
+# Tiempo que un evento reclamado queda invisible para otros workers
+WEBHOOK_VISIBILITY_TIMEOUT = float(os.getenv("WEBHOOK_VISIBILITY_TIMEOUT", 120))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 1))
+# Espera máxima (s) al apagar por los eventos en proceso; los que no terminen
+# vuelven a la cola al vencer su visibility timeout
+WEBHOOK_STOP_TIMEOUT = float(os.getenv("WEBHOOK_STOP_TIMEOUT", 5))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_queue (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    received_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_queue_available ON webhook_queue (available_at);
+CREATE TABLE IF NOT EXISTS webhook_dead_letters (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    received_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    last_error TEXT
+);
+"""
+
+
+class WebhookQueue:
+    """
+    Cola FIFO con reintentos respaldada por SQLite (modo WAL).
+
+    Las operaciones SQLite son síncronas y breves; se ejecutan con asyncio.to_thread
+    detrás de un lock para no bloquear el event loop. `BEGIN IMMEDIATE` hace que el
+    reclamo de eventos sea atómico también entre procesos que comparten el archivo.
+    """
+
+    def __init__(
+        self,
+        path: str = WEBHOOK_QUEUE_PATH,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+        visibility_timeout: float = WEBHOOK_VISIBILITY_TIMEOUT
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    # ================== OPERACIONES ==================
+
+    def _enqueue(self, event_id: str, event_type: str, payload: str) -> bool:
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO webhook_queue (event_id, event_type, payload, received_at, available_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (event_id, event_type, payload, now, now)
+        )
+        return cursor.rowcount == 1
+
+    async def enqueue(self, event_id: str, event_type: str, payload: str) -> bool:
+        """
+        Guardar un evento; devuelve False si ya estaba en la cola
+        """
+        return await self._run(self._enqueue, event_id, event_type, payload)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT * FROM webhook_queue "
+                "WHERE available_at <= ? AND (locked_until IS NULL OR locked_until <= ?) "
+                "ORDER BY available_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE webhook_queue SET locked_until = ?, attempts = attempts + 1 WHERE event_id = ?",
+                    (now + self.visibility_timeout, row["event_id"])
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Reclamar el siguiente evento disponible
+        """
+        return await self._run(self._claim)
+
+    def _ack(self, event_id: str):
+        self._conn.execute("DELETE FROM webhook_queue WHERE event_id = ?", (event_id,))
+
+    async def ack(self, event_id: str):
+        await self._run(self._ack, event_id)
+
+    def _release(self, event_id: str):
+        self._conn.execute("UPDATE webhook_queue SET locked_until = NULL WHERE event_id = ?", (event_id,))
+
+    async def release(self, event_id: str):
+        """
+        Devolver un evento reclamado a la cola sin contar el intento como fallo
+        """
+        await self._run(self._release, event_id)
+
+    def _fail(self, job: Dict[str, Any], error: str) -> bool:
+        now = time.time()
+        if job["attempts"] >= self.max_attempts:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO webhook_dead_letters "
+                    "(event_id, event_type, payload, attempts, received_at, failed_at, last_error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job["event_id"], job["event_type"], job["payload"], job["attempts"],
+                     job["received_at"], now, error)
+                )
+                self._conn.execute("DELETE FROM webhook_queue WHERE event_id = ?", (job["event_id"],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return True
+
+        # Backoff exponencial con jitter
+        delay = min(WEBHOOK_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1), WEBHOOK_RETRY_MAX_SECONDS)
+        delay *= random.uniform(0.5, 1.0)
+        self._conn.execute(
+            "UPDATE webhook_queue SET available_at = ?, locked_until = NULL, last_error = ? WHERE event_id = ?",
+            (now + delay, error, job["event_id"])
+        )
+        return False
+
+    async def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """
+        Reprogramar un evento fallido; devuelve True si se movió a dead-letter
+        """
+        return await self._run(self._fail, job, error)
+
+    def _stats(self) -> Dict[str, Any]:
+        now = time.time()
+        depth, oldest = self._conn.execute(
+            "SELECT COUNT(*), MIN(received_at) FROM webhook_queue"
+        ).fetchone()
+        dead_letters = self._conn.execute("SELECT COUNT(*) FROM webhook_dead_letters").fetchone()[0]
+        return {
+            "depth": depth,
+            "oldest_event_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "dead_letters": dead_letters
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._run(self._stats)
+
+    def _dead_letters(self, limit: int) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT event_id, event_type, attempts, received_at, failed_at, last_error "
+            "FROM webhook_dead_letters ORDER BY failed_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return await self._run(self._dead_letters, limit)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WebhookWorkerPool:
+    """
+    Pool de workers asíncronos que drenan la cola de webhooks
+    """
+
+    def __init__(
+        self,
+        queue: WebhookQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]],
+        concurrency: int = WEBHOOK_WORKERS,
+        poll_interval: float = WEBHOOK_POLL_INTERVAL
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.busy = 0
+        self.last_lag_seconds = 0.0
+
+    def notify(self):
+        """Despertar a los workers cuando llega un evento nuevo"""
+        self._wakeup.set()
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"✅ Workers de webhooks iniciados: {self.concurrency}")
+
+    async def stop(self, timeout: float = WEBHOOK_STOP_TIMEOUT):
+        """
+        Dejar de reclamar eventos y esperar a que terminen los que están en proceso
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+        logger.info("👋 Workers de webhooks detenidos")
+
+    async def _wait_for_work(self):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self, worker_id: int):
+        while not self._stopping:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error(f"❌ Error leyendo cola de webhooks: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+
+            try:
+                await self._process(job)
+            except Exception as e:
+                # ack/fail no llegaron a SQLite (p. ej. "database is locked"): el
+                # worker sigue vivo y el evento vuelve a quedar disponible (si la
+                # liberación también falla, expira con el visibility timeout)
+                logger.error(f"❌ Error registrando resultado del webhook {job['event_id']}: {e}")
+                try:
+                    await self.queue.release(job["event_id"])
+                except Exception as release_error:
+                    logger.error(f"❌ No se pudo liberar el webhook {job['event_id']}: {release_error}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job: Dict[str, Any]):
+        self.busy += 1
+        try:
+            await self.handler(json.loads(job["payload"]))
+        except Exception as e:
+            logger.error(f"❌ Error procesando webhook {job['event_id']} (intento {job['attempts']}): {e}")
+            if await self.queue.fail(job, str(e)):
+                self.dead_lettered += 1
+                logger.error(f"☠️ Webhook enviado a dead-letter: {job['event_id']}")
+            else:
+                self.retried += 1
+        else:
+            await self.queue.ack(job["event_id"])
+            self.processed += 1
+            self.last_lag_seconds = time.time() - job["received_at"]
+        finally:
+            self.busy -= 1
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            **(await self.queue.stats()),
+            "workers": len(self._tasks),
+            "busy_workers": self.busy,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "last_processing_lag_seconds": round(self.last_lag_seconds, 3)
+        }
+
+
+# ================== INSTANCIA COMPARTIDA ==================
+
+_queue: Optional[WebhookQueue] = None
+_pool: Optional[WebhookWorkerPool] = None
+
+def get_webhook_queue() -> WebhookQueue:
+    """
+    Obtener la cola compartida (se crea en el primer uso)
+    """
+    global _queue
+    if _queue is None:
+        _queue = WebhookQueue()
+    return _queue
+
+async def enqueue_webhook(event_id: str, event_type: str, payload: str) -> bool:
+    """
+    Guardar un webhook verificado y despertar a los workers
+    """
+    queued = await get_webhook_queue().enqueue(event_id, event_type, payload)
+    if _pool is not None:
+        _pool.notify()
+    return queued
+
+def start_webhook_workers(handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+    """
+    Iniciar el pool de workers (llamar desde el startup de la app)
+    """
+    global _pool
+    _pool = WebhookWorkerPool(get_webhook_queue(), handler)
+    _pool.start()
+
+async def stop_webhook_workers():
+    """
+    Drenar y detener el pool de workers
+    """
+    global _pool, _queue
+    if _pool is not None:
+        await _pool.stop()
+        _pool = None
+    if _queue is not None:
+        _queue.close()
+        _queue = None
+
+async def get_webhook_stats() -> Dict[str, Any]:
+    if _pool is not None:
+        return await _pool.stats()
+    return await get_webhook_queue().stats()